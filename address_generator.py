@@ -1,78 +1,129 @@
 import pandas as pd
-import random
+import numpy as np
+import re
+from typing import Dict, List, Optional, Tuple
+
+from util.rng import DocumentId, document_rng, resolve_rng, seed_sequence_for
+
+FIELD_COLUMNS = {
+    'index': 'Індекс НП',
+    'village': 'Населений пункт',
+    'region': 'Область',
+    'district': 'Адміністративний район(новий)',
+    'street': 'Назва вулиці',
+}
+FORMAT_FIELD_RE = re.compile(r'\{(index|village|region|district|street|house_number)\}')
 
 class AddressGenerator:
-    def __init__(self, csv_data_path):
+    RNG_STREAM = 1
+
+    def __init__(self, csv_data_path, seed: Optional[int] = None, rng: Optional[np.random.Generator] = None):
         # Load CSV data into a DataFrame
         self.df = pd.read_csv(csv_data_path)
         print(self.df['Область'].unique())
-    
-    def generate_address(self, format_string, seed=None):
-        # Randomly select a row
-        if seed:
-            random.seed(seed)
-        random_row = self.df.sample().iloc[0]
-        # Extract the necessary values from the selected row
-        postal_code = random_row['Індекс НП']
-        village = random_row['Населений пункт']
-        region = random_row['Область']
-        district = random_row['Адміністративний район(новий)']
-        street = random_row['Назва вулиці']
-        
-        # Extract available house numbers as a list from the "№ будинку" column
-        house_numbers = random_row['№ будинку'].split(',')
-        house_number = random.choice(house_numbers).strip()
-        
-        # Generate the address based on the format string
-        formatted_address = format_string
-        formatted_address = formatted_address.replace("{index}", str(postal_code))
-        formatted_address = formatted_address.replace("{village}", village)
-        formatted_address = formatted_address.replace("{region}", region)
-        formatted_address = formatted_address.replace("{district}", district)
-        formatted_address = formatted_address.replace("{street}", street)
-        formatted_address = formatted_address.replace("{house_number}", house_number)
-        
-        return formatted_address
-    
-    def generate_address(self, format_string, city=None, region=None, seed=None):
-        if seed:
-            random.seed(seed)
-        # contains city
+
+        self.seed_sequence = seed_sequence_for(seed, rng)
+        self.rng = rng if rng is not None else np.random.default_rng(self.seed_sequence)
+
+        self._build_index()
+        self._candidates_cache: Dict[Tuple[Optional[str], Optional[str]], np.ndarray] = {}
+        self._template_cache: Dict[str, list] = {}
+
+    def _build_index(self):
+        # Field values as flat arrays, with categorical codes for region/city/district
+        self.fields: Dict[str, np.ndarray] = {}
+        self.codes: Dict[str, np.ndarray] = {}
+        self.categories: Dict[str, pd.Index] = {}
+        for field, column in FIELD_COLUMNS.items():
+            codes, categories = pd.factorize(self.df[column])
+            if field in ('region', 'village', 'district'):
+                self.codes[field] = codes
+                self.categories[field] = categories
+            values = np.asarray(categories.astype(str), dtype=object)
+            self.fields[field] = np.where(codes >= 0, values[np.maximum(codes, 0)], '').astype(object)
+
+        # Row-id postings per region and per city
+        self.postings: Dict[str, List[np.ndarray]] = {}
+        for field in ('region', 'village'):
+            codes = self.codes[field]
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(self.categories[field]) + 1))
+            self.postings[field] = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.categories[field]))]
+
+        # House numbers pre-split into one flat array with per-row offsets
+        house_lists = [str(value).split(',') if isinstance(value, str) else [''] for value in self.df['№ будинку']]
+        self.house_counts = np.fromiter((len(houses) for houses in house_lists), dtype=np.int64, count=len(house_lists))
+        self.house_offsets = np.concatenate(([0], np.cumsum(self.house_counts)[:-1]))
+        self.house_numbers = np.array([house.strip() for houses in house_lists for house in houses], dtype=object)
+
+    def _matching_rows(self, field: str, value: str) -> np.ndarray:
+        # Same substring match the per-row str.contains did, but over the distinct values only
+        matches = np.flatnonzero(pd.Series(self.categories[field]).str.contains(value, na=False))
+        if not len(matches):
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate([self.postings[field][code] for code in matches]))
+
+    def _candidates(self, city=None, region=None) -> np.ndarray:
         empty_value = [None, 'null']
+        city = None if city in empty_value else city
+        region = None if region in empty_value else region
+
+        key = (city, region)
+        if key not in self._candidates_cache:
+            if city is not None and region is not None:
+                rows = np.intersect1d(self._matching_rows('region', region), self._matching_rows('village', city),
+                                      assume_unique=True)
+            elif city is not None:
+                rows = self._matching_rows('village', city)
+            elif region is not None:
+                rows = self._matching_rows('region', region)
+            else:
+                rows = np.arange(len(self.df))
+            self._candidates_cache[key] = rows
+        return self._candidates_cache[key]
+
+    def _template(self, format_string: str) -> list:
+        # Alternating literal text and field names, e.g. ['(', 'index', ', ', 'region', ' область)']
+        if format_string not in self._template_cache:
+            self._template_cache[format_string] = FORMAT_FIELD_RE.split(format_string)
+        return self._template_cache[format_string]
+
+    def document_rng(self, doc_id: DocumentId) -> np.random.Generator:
+        """Independent generator for one document, derived from this generator's seed and the document id."""
+        return document_rng(self.seed_sequence, doc_id, self.RNG_STREAM)
+
+    def generate_address(self, format_string, city=None, region=None, seed=None, rng=None):
+        return self.generate_addresses(1, format_string, city=city, region=region, seed=seed, rng=rng)[0]
+
+    def generate_addresses(self, n, format_string, city=None, region=None, seed=None, rng=None) -> List[str]:
+        """Generates n addresses; after the first call for a city/region pair the cost per address is constant."""
+        candidates = self._candidates(city, region)
+        if not len(candidates):
+            raise ValueError(f"No addresses found for city={city!r}, region={region!r}")
+        return self.generate_addresses_from(candidates, n, format_string, seed=seed, rng=rng)
+
+    def generate_addresses_from(self, candidates: np.ndarray, n, format_string, seed=None, rng=None) -> List[str]:
+        """Generates n addresses drawn uniformly from the given table rows, e.g. one entry of postings."""
+        rng = resolve_rng(self.rng, seed, rng)
+
+        rows = candidates[rng.integers(len(candidates), size=n)]
+        houses = self.house_numbers[self.house_offsets[rows] + rng.integers(self.house_counts[rows])]
+
+        formatted = np.full(n, '', dtype=object)
+        for i, part in enumerate(self._template(format_string)):
+            if i % 2 == 0:
+                formatted += part
+            elif part == 'house_number':
+                formatted += houses
+            else:
+                formatted += self.fields[part][rows]
+
+        return formatted.tolist()
+
+if __name__ == "__main__":
+    # Create the AddressGenerator object
+    address_generator = AddressGenerator("./dict/address.csv", seed=42)
 
-        if city not in empty_value and region not in empty_value:
-            mask = self.df['Область'].str.contains(region, na=False) & self.df['Населений пункт'].str.contains(city, na=False)
-        elif city not in empty_value:
-            mask = self.df['Населений пункт'].str.contains(city, na=False)
-        elif region not in empty_value:
-            mask = self.df['Область'].str.contains(region, na=False)
-        else:
-            mask = pd.Series([True] * len(self.df))
-
-        random_row = self.df[mask].sample().iloc[0]
-
-        postal_code = random_row['Індекс НП']
-        village = random_row['Населений пункт']
-        region = random_row['Область']
-        district = random_row['Адміністративний район(новий)']
-        street = random_row['Назва вулиці']
-
-        house_numbers = random_row['№ будинку'].split(',')
-        house_number = random.choice(house_numbers).strip()
-        
-        formatted_address = format_string
-        formatted_address = formatted_address.replace("{index}", str(postal_code))
-        formatted_address = formatted_address.replace("{village}", village)
-        formatted_address = formatted_address.replace("{region}", region)
-        formatted_address = formatted_address.replace("{district}", district)
-        formatted_address = formatted_address.replace("{street}", street)
-        formatted_address = formatted_address.replace("{house_number}", house_number)
-        
-        return formatted_address
-
-# Create the AddressGenerator object
-address_generator = AddressGenerator("./dict/address.csv")
-
-# Generate an address based on a format string
-generated_address = address_generator.generate_address("({index}, {region} область, {district} район, {village}, {street}, {house_number})", city="Одеса", region='null')
-print(generated_address)
+    # Generate an address based on a format string
+    generated_address = address_generator.generate_address("({index}, {region} область, {district} район, {village}, {street}, {house_number})", city="Одеса", region='null')
+    print(generated_address)
@@ -1,8 +1,17 @@
 import argparse
 import csv
+import io
 import logging
 import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 from striprtf.striprtf import rtf_to_text
 import tarfile
@@ -15,87 +24,571 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s",
     force=True
 )
-# Set up argument parsing
-parser = argparse.ArgumentParser(description="Download, convert, and process RTF files from a CSV file.")
-parser.add_argument("--csv_path", type=str, required=True, help="Path to the CSV file containing URLs.")
-parser.add_argument("--output_dir", type=str, default="2024", help="Output directory for storing processed files.")
-parser.add_argument("--batch_size", type=int, default=1000, help="Number of files to process before compressing.")
-args = parser.parse_args()
-
-# Paths and configurations from arguments
-csv_path = args.csv_path
-output_dir = args.output_dir
-batch_size = args.batch_size
-processed_documents_dir = os.path.join(output_dir, "documents")
-checkpoint_file = os.path.join(output_dir, "progress_checkpoint.txt")
+
 url_column = 9  # Assuming URL column is the 10th in the CSV file
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HostRateLimiter:
+    """Spaces requests to the same host at least 1 / rate seconds apart, across all threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def create_session(pool_size):
+    """Session whose keep-alive connection pool is large enough for every worker thread."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def retry_delay(response, attempt, backoff):
+    """Honours a Retry-After header, otherwise backs off exponentially with jitter."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return backoff * (2 ** attempt) * (0.5 + random.random())
+
+
+def download(session, limiter, url, timeout, retries, backoff):
+    """GETs url through the shared session, retrying connection errors, timeouts, 429 and 5xx responses."""
+    for attempt in range(retries + 1):
+        limiter.wait(url)
+        response = None
+        try:
+            response = session.get(url, timeout=timeout)
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                return response.content
+            error = requests.HTTPError(f"{response.status_code} for {url}", response=response)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        if attempt == retries:
+            raise error
+        delay = retry_delay(response, attempt, backoff)
+        logging.warning(f"Retrying {url} in {delay:.1f}s after: {error}")
+        time.sleep(delay)
+
+
+def write_text(path, text):
+    # Write to a temporary name first so an interrupted run never leaves a truncated document
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as outfile:
+        outfile.write(text)
+    os.replace(tmp_path, path)
+
+
+def convert_document(name, content, documents_dir=None):
+    """
+    Conversion stage, run in a worker process: rtf_to_text is pure Python and CPU-bound.
+    Saves the text into documents_dir, or returns it when the main process writes shards.
+    """
+    rtf_content = content.decode('cp1251', errors='ignore')
+    text = rtf_to_text(rtf_content)
+    if documents_dir is None:
+        return text
+
+    # Save directly as text
+    write_text(os.path.join(documents_dir, f'{name}.txt'), text)
 
-# Ensure output directories exist
-os.makedirs(processed_documents_dir, exist_ok=True)
 
 # Load progress checkpoint
-def load_checkpoint():
+def load_checkpoint(checkpoint_file):
     if os.path.exists(checkpoint_file):
         with open(checkpoint_file, 'r') as f:
             return int(f.read().strip())
     return 0
 
+
 # Save progress checkpoint
-def save_checkpoint(index):
-    with open(checkpoint_file, 'w') as f:
+def save_checkpoint(checkpoint_file, index):
+    tmp_path = f"{checkpoint_file}.tmp"
+    with open(tmp_path, 'w') as f:
         f.write(str(index))
+    os.replace(tmp_path, checkpoint_file)
+
+
+def load_failed_rows(failed_file):
+    """Row index -> line of failed_rows.tsv, keeping the last entry of a row that failed more than once."""
+    failed = {}
+    if os.path.exists(failed_file):
+        with open(failed_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                index = line.split('\t', 1)[0]
+                if index.isdigit() and line.endswith('\n'):
+                    failed[int(index)] = line
+    return failed
+
+
+def prune_failed_rows(failed_file, succeeded):
+    """Rewrites failed_rows.tsv without the rows for which succeeded(index) is true; removes it once empty."""
+    remaining = [line for index, line in sorted(load_failed_rows(failed_file).items()) if not succeeded(index)]
+    if not remaining:
+        if os.path.exists(failed_file):
+            os.remove(failed_file)
+        return
+    tmp_path = f"{failed_file}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.writelines(remaining)
+    os.replace(tmp_path, failed_file)
+
 
 # Batch compression function
-def compress_batch(batch_number):
+def compress_batch(output_dir, documents_dir, batch_number, names):
+    """
+    Archives the documents of one batch and returns their paths. Rows of later batches may already be on disk,
+    so only the given names are added. The caller removes the files once the checkpoint covers them,
+    so an interrupted run can always rebuild the archive.
+    """
     tar_filename = os.path.join(output_dir, f'documents_batch_{batch_number}.tar.gz')
-    with tarfile.open(tar_filename, 'w:gz') as tar:
-        for file in os.listdir(processed_documents_dir):
-            if file.endswith('.txt'):
-                full_path = os.path.join(processed_documents_dir, file)
-                tar.add(full_path, arcname=file)
-                os.remove(full_path)
-
-# Start processing
-start_index = load_checkpoint()
-batch_number = start_index // batch_size
-
-# Count total lines in the CSV for progress tracking
-with open(csv_path, 'r') as csvfile:
-    total_lines = sum(1 for _ in csvfile)
-logging.info(f"Total number of lines in CSV: {total_lines}")
-
-with open(csv_path, 'r') as csvfile:
-    reader = csv.reader(csvfile)
-    for i, row in enumerate(reader):
-        if i < start_index:
-            continue  # Skip already processed files
-
-        data = row[0].split("\t")
-        name = data[0]
-        download_url = data[url_column]
-
-        if download_url.endswith('.rtf'):
-            response = requests.get(download_url)
-            rtf_content = response.content.decode('cp1251', errors='ignore')
-            text = rtf_to_text(rtf_content)
-
-            # Save directly as text
-            with open(os.path.join(processed_documents_dir, f'{name}.txt'), 'w') as outfile:
-                outfile.write(text)
-        
-        # Save progress checkpoint
-        save_checkpoint(i + 1)
-        
-        # Log progress at each step
-        logging.info(f"Processed file {i + 1}/{total_lines} - {name}")
-
-        # Compress every batch_size files
-        if (i + 1) % batch_size == 0:
-            compress_batch(batch_number)
-            batch_number += 1
-            logging.info(f"Compressed batch {batch_number}")
-
-# Final compression of remaining files
-if os.listdir(processed_documents_dir):
-    compress_batch(batch_number)
-    logging.info(f"Final batch compression complete.")
+    added = []
+    with tarfile.open(f'{tar_filename}.tmp', 'w:gz') as tar:
+        for name in names:
+            full_path = os.path.join(documents_dir, f'{name}.txt')
+            if os.path.exists(full_path):
+                tar.add(full_path, arcname=f'{name}.txt')
+                added.append(full_path)
+        # A partial batch archived at the end of an earlier run keeps its documents
+        if os.path.exists(tar_filename):
+            arcnames = {os.path.basename(path) for path in added}
+            with tarfile.open(tar_filename, 'r:gz') as previous:
+                for member in previous:
+                    if member.isfile() and member.name not in arcnames:
+                        tar.addfile(member, previous.extractfile(member))
+    os.replace(f'{tar_filename}.tmp', tar_filename)
+    return added
+
+
+class Manifest:
+    """
+    Append-only TSV of every document stored in shards: id, shard file, offset and size.
+    For tar shards the offset is the byte offset of the document's data and size its length in bytes;
+    for parquet shards the offset is the row number within the shard and size is the text length.
+    """
+
+    header = "id\tshard\toffset\tsize\n"
+
+    def __init__(self, path):
+        self.path = path
+        self.ids = set()
+        self.shards = {}  # shard -> (offset, size) of its last document
+        valid_bytes = 0
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                for line in f:
+                    # A line cut short by a crash is dropped together with everything after it
+                    if not line.endswith(b'\n'):
+                        break
+                    fields = line.decode('utf-8').rstrip('\n').split('\t')
+                    valid_bytes += len(line)
+                    if fields[0] == 'id':
+                        continue
+                    doc_id, shard, offset, size = fields
+                    self.ids.add(doc_id)
+                    self.shards[shard] = (int(offset), int(size))
+            with open(path, 'ab') as f:
+                f.truncate(valid_bytes)
+        self.file = open(path, 'a', encoding='utf-8')
+        if not valid_bytes:
+            self.file.write(self.header)
+
+    def append(self, entries):
+        self.file.writelines(f"{doc_id}\t{shard}\t{offset}\t{size}\n" for doc_id, shard, offset, size in entries)
+        self.file.flush()
+        for doc_id, shard, offset, size in entries:
+            self.ids.add(doc_id)
+            self.shards[shard] = (offset, size)
+
+    def close(self):
+        self.file.close()
+
+
+class TarShardWriter:
+    """
+    Appends documents to uncompressed documents_shard_N.tar files of about max_bytes each.
+    Every document is in the manifest as soon as it is written, so offsets allow random access
+    and an interrupted shard is cut back to its last listed document and continued.
+    """
+
+    def __init__(self, output_dir, manifest, max_bytes):
+        self.output_dir = output_dir
+        self.manifest = manifest
+        self.max_bytes = max_bytes
+        self.number = len(manifest.shards)
+        self.tar = None
+        if manifest.shards:
+            # Continue the last shard unless it is already full
+            self.number -= 1
+            offset, size = manifest.shards[self.shard_name()]
+            end = offset + -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            if end < max_bytes:
+                self.open(end)
+            else:
+                self.number += 1
+
+    def shard_name(self):
+        return f"documents_shard_{self.number:05d}.tar"
+
+    def open(self, end=0):
+        path = os.path.join(self.output_dir, self.shard_name())
+        self.file = open(path, 'r+b' if end else 'wb')
+        self.file.truncate(end)
+        self.file.seek(end)
+        self.tar = tarfile.open(fileobj=self.file, mode='w', format=tarfile.PAX_FORMAT)
+
+    def write(self, i, name, text):
+        """Stores one document and returns the row indices that are now durable."""
+        if self.tar is None:
+            self.open()
+        data = text.encode('utf-8')
+        info = tarfile.TarInfo(f'{name}.txt')
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.tar.addfile(info, io.BytesIO(data))
+        self.file.flush()
+        offset = self.tar.offset - -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        self.manifest.append([(name, self.shard_name(), offset, len(data))])
+        if self.tar.offset >= self.max_bytes:
+            self.close()
+            self.number += 1
+        return [i]
+
+    def close(self):
+        if self.tar is not None:
+            self.tar.close()
+            self.file.close()
+            self.tar = None
+        return []
+
+
+class ParquetShardWriter:
+    """
+    Writes documents to documents_shard_N.parquet files (id, text) of about max_bytes of text each,
+    in row groups of row_group_size documents. A parquet file is only readable once closed,
+    so documents are added to the manifest, and become durable, when their shard is finished;
+    a shard interrupted by a crash is rewritten from scratch.
+    """
+
+    def __init__(self, output_dir, manifest, max_bytes, row_group_size=1000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        self.pq = pq
+        self.schema = pa.schema([('id', pa.string()), ('text', pa.string())])
+        self.output_dir = output_dir
+        self.manifest = manifest
+        self.max_bytes = max_bytes
+        self.row_group_size = row_group_size
+        self.number = len(manifest.shards)
+        self.writer = None
+        self.rows = []
+        self.entries = []
+        self.buffer = []
+        self.size = 0
+
+    def shard_name(self):
+        return f"documents_shard_{self.number:05d}.parquet"
+
+    def flush_row_group(self):
+        if self.buffer:
+            names, texts = zip(*self.buffer)
+            self.writer.write_table(self.pa.table({'id': list(names), 'text': list(texts)}, schema=self.schema))
+            self.buffer = []
+
+    def write(self, i, name, text):
+        """Stores one document and returns the row indices that are now durable."""
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(os.path.join(self.output_dir, self.shard_name()), self.schema,
+                                                compression='zstd')
+        self.entries.append((name, self.shard_name(), len(self.entries), len(text)))
+        self.rows.append(i)
+        self.buffer.append((name, text))
+        self.size += len(text)
+        if len(self.buffer) >= self.row_group_size:
+            self.flush_row_group()
+        if self.size >= self.max_bytes:
+            durable = self.close()
+            self.number += 1
+            return durable
+        return []
+
+    def close(self):
+        if self.writer is None:
+            return []
+        self.flush_row_group()
+        self.writer.close()
+        self.writer = None
+        self.manifest.append(self.entries)
+        durable = self.rows
+        self.rows, self.entries, self.size = [], [], 0
+        return durable
+
+
+def read_document(output_dir, shard, offset, size):
+    """Random access to one document of a shard, given its manifest entry."""
+    path = os.path.join(output_dir, shard)
+    if shard.endswith('.tar'):
+        with open(path, 'rb') as f:
+            f.seek(int(offset))
+            return f.read(int(size)).decode('utf-8')
+
+    import pyarrow.parquet as pq
+    parquet_file = pq.ParquetFile(path)
+    row = int(offset)
+    for row_group in range(parquet_file.num_row_groups):
+        rows = parquet_file.metadata.row_group(row_group).num_rows
+        if row < rows:
+            return parquet_file.read_row_group(row_group, columns=['text']).column('text')[row].as_py()
+        row -= rows
+    raise IndexError(f"{shard} has no row {offset}")
+
+
+class StageStats:
+    """Counts documents finished by a pipeline stage and reports its throughput."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.started = time.perf_counter()
+
+    def rate(self):
+        return self.count / max(time.perf_counter() - self.started, 1e-9)
+
+    def __str__(self):
+        return f"{self.name}: {self.count} docs, {self.rate():.1f} docs/s"
+
+
+def collect(csv_path, output_dir, batch_size=1000, workers=8, max_in_flight=32, rate_limit=5.0,
+            timeout=(10, 60), retries=5, backoff=1.0, checkpoint_every=100, convert_workers=None, convert_queue=None,
+            output_format="files", shard_size=256 * 1024 * 1024, row_group_size=1000):
+    """
+    Downloads every .rtf row of the CSV with a pool of worker threads sharing one Session and converts
+    the downloaded RTFs to text in a pool of convert_workers processes, so network waits and parsing overlap.
+
+    At most max_in_flight rows are in progress at a time. Downloaded documents wait in a queue of at most
+    convert_queue documents for a conversion process; while it is full no new downloads are started.
+    The checkpoint is the number of leading CSV rows that are fully done, saved every checkpoint_every rows
+    and at every batch boundary, so a restart resumes exactly after the last contiguous finished row.
+    Rows that still fail after all retries are logged to failed_rows.tsv and skipped; the next run
+    tries them again (documents of batches archived meanwhile are added to their archive at the end)
+    and removes the rows that succeed from the file.
+
+    With output_format "files" documents are written as .txt files and every batch_size rows are compressed
+    into documents_batch_N.tar.gz. With "tar" or "parquet" they are appended straight into shards of about
+    shard_size bytes and listed in manifest.tsv; rows already in the manifest are not downloaded again.
+    """
+    documents_dir = os.path.join(output_dir, "documents")
+    checkpoint_file = os.path.join(output_dir, "progress_checkpoint.txt")
+    failed_file = os.path.join(output_dir, "failed_rows.tsv")
+
+    # Ensure output directories exist
+    os.makedirs(documents_dir if output_format == "files" else output_dir, exist_ok=True)
+
+    # Start processing
+    start_index = load_checkpoint(checkpoint_file)
+    batch_number = start_index // batch_size
+    # Rows behind the checkpoint that failed in earlier runs; rows after it are processed anyway
+    retry_rows = {i for i in load_failed_rows(failed_file) if i < start_index}
+    if retry_rows:
+        logging.info(f"Retrying {len(retry_rows)} rows that failed in earlier runs")
+
+    manifest = None
+    shard_writer = None
+    if output_format != "files":
+        manifest = Manifest(os.path.join(output_dir, "manifest.tsv"))
+        if output_format == "tar":
+            shard_writer = TarShardWriter(output_dir, manifest, shard_size)
+        else:
+            shard_writer = ParquetShardWriter(output_dir, manifest, shard_size, row_group_size)
+        logging.info(f"Manifest lists {len(manifest.ids)} documents")
+
+    convert_workers = convert_workers or os.cpu_count()
+    convert_queue = convert_queue or 2 * convert_workers
+    session = create_session(workers)
+    limiter = HostRateLimiter(rate_limit)
+    downloads = {}
+    conversions = {}
+    download_stats = StageStats("download")
+    convert_stats = StageStats("convert")
+    finished = set()
+    failed_now = set()
+    batch_names = {}
+    late_names = {}  # batch number -> names of retried rows whose batch is already archived
+    next_index = start_index
+    last_checkpoint = start_index
+    started = time.perf_counter()
+
+    def advance():
+        # Move the checkpoint over the contiguous run of finished rows, compressing full batches on the way
+        nonlocal next_index, batch_number, last_checkpoint
+        while next_index in finished:
+            finished.remove(next_index)
+            next_index += 1
+            if shard_writer is None and next_index % batch_size == 0:
+                names = [batch_names.pop(j) for j in range(next_index - batch_size, next_index) if j in batch_names]
+                archived = compress_batch(output_dir, documents_dir, batch_number, names)
+                batch_number += 1
+                logging.info(f"Compressed batch {batch_number}")
+                save_checkpoint(checkpoint_file, next_index)
+                last_checkpoint = next_index
+                for path in archived:
+                    os.remove(path)
+        if next_index - last_checkpoint >= checkpoint_every:
+            save_checkpoint(checkpoint_file, next_index)
+            last_checkpoint = next_index
+
+    def fail(i, name, download_url, e):
+        logging.error(f"Failed to process {name} ({download_url}): {e}")
+        error = ' '.join(str(e).split())  # One line per row, so the file can be read back
+        with open(failed_file, 'a', encoding='utf-8') as f:
+            f.write(f"{i}\t{name}\t{download_url}\t{error}\n")
+        failed_now.add(i)
+        finished.add(i)
+
+    def collect_done(converter):
+        done, _ = wait([*downloads, *conversions], return_when=FIRST_COMPLETED)
+        for future in done:
+            if future in downloads:
+                i, name, download_url = downloads.pop(future)
+                try:
+                    content = future.result()
+                except Exception as e:
+                    fail(i, name, download_url, e)
+                    continue
+                download_stats.count += 1
+                target_dir = documents_dir if shard_writer is None else None
+                conversions[converter.submit(convert_document, name, content, target_dir)] = (i, name, download_url)
+            else:
+                i, name, download_url = conversions.pop(future)
+                try:
+                    text = future.result()
+                except Exception as e:
+                    fail(i, name, download_url, e)
+                    continue
+                convert_stats.count += 1
+                if shard_writer is None:
+                    finished.add(i)
+                else:
+                    finished.update(shard_writer.write(i, name, text))
+        advance()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor, ProcessPoolExecutor(max_workers=convert_workers) as converter, \
+            open(csv_path, 'r') as csvfile:
+        reader = csv.reader(csvfile)
+        for i, row in enumerate(reader):
+            retrying = i in retry_rows
+            if i < start_index and not retrying and (shard_writer is not None or i < batch_number * batch_size):
+                continue  # Skip already compressed files
+
+            data = row[0].split("\t")
+            name = data[0]
+            download_url = data[url_column] if len(data) > url_column else ''
+            if shard_writer is None:
+                if i >= batch_number * batch_size:
+                    batch_names[i] = name
+                else:
+                    late_names.setdefault(i // batch_size, []).append(name)
+            if i < start_index and not retrying:
+                continue  # Skip already processed files of the current batch
+
+            if manifest is not None and name in manifest.ids:
+                finished.add(i)  # Stored in a shard before the last checkpoint was saved
+            elif download_url.endswith('.rtf'):
+                while len(downloads) + len(conversions) >= max_in_flight or len(conversions) >= convert_queue:
+                    collect_done(converter)
+                future = executor.submit(download, session, limiter, download_url, timeout, retries, backoff)
+                downloads[future] = (i, name, download_url)
+            else:
+                finished.add(i)
+
+            if (i + 1) % 1000 == 0:
+                rate = (i + 1 - start_index) / (time.perf_counter() - started)
+                logging.info(f"Submitted file {i + 1} - {name} ({rate:.1f} rows/s); "
+                             f"{download_stats}; {convert_stats}; {len(conversions)} queued for conversion")
+
+        while downloads or conversions:
+            collect_done(converter)
+        if shard_writer is not None:
+            finished.update(shard_writer.close())
+            manifest.close()
+        advance()
+
+    save_checkpoint(checkpoint_file, next_index)
+    logging.info(f"Processed {next_index - start_index} rows in {time.perf_counter() - started:.1f}s; "
+                 f"{download_stats}; {convert_stats}")
+
+    # Final compression of remaining files
+    if any(os.path.exists(os.path.join(documents_dir, f'{name}.txt')) for name in batch_names.values()):
+        for path in compress_batch(output_dir, documents_dir, batch_number, batch_names.values()):
+            os.remove(path)
+        logging.info(f"Final batch compression complete.")
+
+    # Retried documents of earlier batches join their archive; until then they stay listed as failed
+    for late_batch, names in sorted(late_names.items()):
+        added = compress_batch(output_dir, documents_dir, late_batch, names)
+        for path in added:
+            os.remove(path)
+        if added:
+            logging.info(f"Added {len(added)} retried documents to batch {late_batch + 1}")
+
+    prune_failed_rows(failed_file, lambda i: i not in failed_now and (start_index <= i < next_index or i in retry_rows))
+
+
+def parse_timeout(value):
+    parts = [float(part) for part in value.split(',')]
+    return parts[0] if len(parts) == 1 else tuple(parts)
+
+
+def main():
+    # Set up argument parsing
+    parser = argparse.ArgumentParser(description="Download, convert, and process RTF files from a CSV file.")
+    parser.add_argument("--csv_path", type=str, required=True, help="Path to the CSV file containing URLs.")
+    parser.add_argument("--output_dir", type=str, default="2024", help="Output directory for storing processed files.")
+    parser.add_argument("--batch_size", type=int, default=1000, help="Number of files to process before compressing.")
+    parser.add_argument("--workers", type=int, default=8, help="Number of download threads.")
+    parser.add_argument("--max_in_flight", type=int, default=32, help="Maximum number of rows being processed at once.")
+    parser.add_argument("--rate_limit", type=float, default=5.0, help="Maximum requests per second per host (0 disables).")
+    parser.add_argument("--timeout", type=parse_timeout, default=(10, 60),
+                        help="Request timeout in seconds, or 'connect,read'.")
+    parser.add_argument("--retries", type=int, default=5, help="Retries per download after the first attempt.")
+    parser.add_argument("--backoff", type=float, default=1.0, help="Base delay in seconds for exponential backoff.")
+    parser.add_argument("--checkpoint_every", type=int, default=100, help="Save the checkpoint every N finished rows.")
+    parser.add_argument("--convert_workers", type=int, default=None,
+                        help="Number of RTF conversion processes (defaults to the number of CPUs).")
+    parser.add_argument("--convert_queue", type=int, default=None,
+                        help="Maximum downloaded documents waiting for conversion (defaults to 2 x convert_workers).")
+    parser.add_argument("--output_format", choices=["files", "tar", "parquet"], default="files",
+                        help="Loose .txt files compressed per batch, or documents appended into tar/parquet shards.")
+    parser.add_argument("--shard_size", type=int, default=256, help="Approximate shard size in MB.")
+    parser.add_argument("--row_group_size", type=int, default=1000, help="Documents per parquet row group.")
+    args = parser.parse_args()
+
+    collect(args.csv_path, args.output_dir, args.batch_size, args.workers, args.max_in_flight, args.rate_limit,
+            args.timeout, args.retries, args.backoff, args.checkpoint_every, args.convert_workers, args.convert_queue,
+            args.output_format, args.shard_size * 1024 * 1024, args.row_group_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Minimal stand-in for the registry's document server, for running collection.py offline.
+# GET /<name>.rtf answers a small cp1251 RTF document that contains the name, after an optional delay.
+# Names in `missing` answer 404 (a row that fails for good); every document first answers `flaky`
+# times with 503 and Retry-After: 0 (a transient error that the downloader retries).
+# GET /stats exposes request counts per path and the peak number of concurrent requests.
+
+
+def rtf_document(name):
+    return ("{\\rtf1\\ansi\\ansicpg1251 " + f"Документ {name}" + "\\par}").encode('cp1251')
+
+
+class StubState:
+    def __init__(self, delay=0.0, missing=(), flaky=0):
+        self.delay = delay
+        self.missing = set(missing)
+        self.flaky = flaky
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.active = 0
+        self.peak = 0
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, content_type, headers=()):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for key, value in headers:
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = self.path.rstrip('/')
+            if path.endswith('/stats'):
+                with state.lock:
+                    stats = {'requests': dict(state.requests), 'peak_concurrency': state.peak}
+                self._send(200, json.dumps(stats).encode('utf-8'), 'application/json')
+                return
+            if not path.endswith('.rtf'):
+                self._send(404, b'not found', 'text/plain')
+                return
+
+            name = path.rsplit('/', 1)[-1][:-len('.rtf')]
+            with state.lock:
+                attempt = state.requests.get(path, 0)
+                state.requests[path] = attempt + 1
+                state.active += 1
+                state.peak = max(state.peak, state.active)
+            try:
+                time.sleep(state.delay)
+                if name in state.missing:
+                    self._send(404, b'not found', 'text/plain')
+                elif attempt < state.flaky:
+                    self._send(503, b'try again', 'text/plain', [('Retry-After', '0')])
+                else:
+                    self._send(200, rtf_document(name), 'application/rtf')
+            finally:
+                with state.lock:
+                    state.active -= 1
+
+    return Handler
+
+
+def start_server(state, host='127.0.0.1', port=0):
+    """Serves in a daemon thread; returns the server, whose server_address holds the bound port."""
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RTF document stub server for testing collection.py offline')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--delay', type=float, default=0.05, help='Seconds to wait before every response')
+    parser.add_argument('--missing', nargs='*', default=[], help='Document names that answer 404')
+    parser.add_argument('--flaky', type=int, default=0, help='503 responses every document gives before succeeding')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(StubState(args.delay, args.missing, args.flaky)))
+    print(f'Serving on http://{args.host}:{args.port}/')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
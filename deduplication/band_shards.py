@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+
+# One spilled record per (document, band)
+SPILL_DTYPE = np.dtype([('band', '<u2'), ('bucket', '<u8'), ('doc_id', '<i8')])
+
+
+def partition_dir(spill_dir, partition):
+    return os.path.join(spill_dir, f"part-{partition:03d}")
+
+
+def spill_band_hashes(spill_dir, partitions, doc_ids, hashes, tag):
+    """
+    Writes (band, bucket, doc_id) records of a chunk of documents to the spill directory.
+    Band b goes to partition b % partitions, so every bucket is resolved by exactly one partition.
+    """
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    bands = hashes.shape[1]
+    for partition in range(partitions):
+        band_ids = np.arange(partition, bands, partitions)
+        records = np.empty(len(doc_ids) * len(band_ids), dtype=SPILL_DTYPE)
+        records['band'] = np.tile(band_ids, len(doc_ids))
+        records['bucket'] = hashes[:, band_ids].ravel()
+        records['doc_id'] = np.repeat(doc_ids, len(band_ids))
+        directory = partition_dir(spill_dir, partition)
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, f"{tag}.npy"), records)
+
+
+def bucket_links(bands, buckets, doc_ids):
+    """
+    Returns an (n, 2) array of unique (doc_id, linked doc_id) pairs:
+    every document in a (band, bucket) is linked to the lowest doc id sharing it.
+    """
+    order = np.lexsort((doc_ids, buckets, bands))
+    bands, buckets, doc_ids = bands[order], buckets[order], doc_ids[order]
+
+    starts = np.ones(len(doc_ids), dtype=bool)
+    starts[1:] = (bands[1:] != bands[:-1]) | (buckets[1:] != buckets[:-1])
+    first = doc_ids[np.maximum.accumulate(np.where(starts, np.arange(len(doc_ids)), 0))]
+    linked = ~starts
+    pairs = np.stack([doc_ids[linked], first[linked]], axis=1)
+    return np.unique(pairs, axis=0)
+
+
+def resolve_partition(directory):
+    """Loads one partition's spilled records and returns their bucket_links."""
+    paths = sorted(entry.path for entry in os.scandir(directory) if entry.name.endswith('.npy'))
+    if not paths:
+        return np.empty((0, 2), dtype=np.int64)
+    records = np.concatenate([np.load(path) for path in paths])
+    return bucket_links(records['band'], records['bucket'], records['doc_id'])
+
+
+def connected_components(n, pairs):
+    """
+    Union-find over doc ids 0..n-1: hooks the roots of every pair onto the smaller one and compresses paths
+    until all pairs agree. Returns the root of every doc id, which is the lowest doc id in its component.
+    """
+    roots = np.arange(n, dtype=np.int64)
+    if not len(pairs):
+        return roots
+    a, b = pairs[:, 0], pairs[:, 1]
+    while True:
+        root_a, root_b = roots[a], roots[b]
+        if np.array_equal(root_a, root_b):
+            return roots
+        low = np.minimum(root_a, root_b)
+        np.minimum.at(roots, root_a, low)
+        np.minimum.at(roots, root_b, low)
+        while True:
+            compressed = roots[roots]
+            if np.array_equal(compressed, roots):
+                break
+            roots = compressed
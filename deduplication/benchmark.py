@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import time
+import random
+import resource
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from datasketch import MinHash, MinHashLSH
+
+from deduplication import deduplicate_text_files_lsh
+from util.text_normalizer import normalize
+
+
+def generate_corpus(folder, n_files, words_per_file=800, vocabulary_size=50_000, seed=0):
+    """Writes n_files random documents; every tenth one is a light edit of an earlier document."""
+    rng = random.Random(seed)
+    vocabulary = [f"слово{i}" for i in range(vocabulary_size)]
+    documents = []
+    for i in range(n_files):
+        if documents and i % 10 == 0:
+            words = list(rng.choice(documents))
+            words[rng.randrange(len(words))] = rng.choice(vocabulary)
+        else:
+            words = rng.choices(vocabulary, k=words_per_file)
+            if len(documents) < 1000:
+                documents.append(words)
+        # Long, path-like names like the registry dumps
+        with open(os.path.join(folder, f"court_decision_{i:012d}.txt"), 'w', encoding='utf-8') as f:
+            f.write(' '.join(words))
+
+
+def legacy_process_file(file_path, num_perm):
+    """The previous transport: a full MinHash object per file, pickled back to the parent."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        file_content = f.read()
+    minhash = MinHash(num_perm=num_perm)
+    for word in normalize(file_content)[1]:
+        minhash.update(word.encode('utf-8'))
+    return file_path, minhash
+
+
+def run_legacy(folder, threshold, num_perm, workers, batch_size):
+    lsh = MinHashLSH(threshold=threshold, num_perm=num_perm)
+    file_paths = [entry.path for entry in os.scandir(folder) if entry.is_file()]
+    unique_files = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(file_paths), batch_size):
+            futures = [executor.submit(legacy_process_file, file_path, num_perm)
+                       for file_path in file_paths[start:start + batch_size]]
+            for future in as_completed(futures):
+                file_path, minhash = future.result()
+                if not lsh.query(minhash):
+                    lsh.insert(file_path, minhash)
+                    unique_files.append(file_path)
+    return len(unique_files)
+
+
+def run_packed(folder, threshold, num_perm, workers, batch_size):
+    with tempfile.TemporaryDirectory() as tmp:
+        _, unique_files, _, _ = deduplicate_text_files_lsh(
+            folder, threshold, num_perm, workers, batch_size=batch_size,
+            unique_store=os.path.join(tmp, "unique_files.txt"), prefilter=False)
+    return len(unique_files)
+
+
+def run_mode(mode, folder, threshold, num_perm, workers, batch_size):
+    start = time.perf_counter()
+    runner = run_legacy if mode == "legacy" else run_packed
+    unique = runner(folder, threshold, num_perm, workers, batch_size)
+    # ru_maxrss is in kilobytes on Linux
+    print(json.dumps({
+        "mode": mode,
+        "unique": unique,
+        "seconds": time.perf_counter() - start,
+        "parent_peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "worker_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare peak RSS and time of MinHash transport modes")
+    parser.add_argument("--corpus", type=str, default=None, help="Folder with text files (a synthetic one is generated if omitted)")
+    parser.add_argument("--files", type=int, default=20_000, help="Number of synthetic files to generate")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Similarity threshold (0-1)")
+    parser.add_argument("--num_perm", type=int, default=128, help="Number of MinHash permutations")
+    parser.add_argument("--workers", type=int, default=4, help="Number of parallel workers")
+    parser.add_argument("--batch_size", type=int, default=1000, help="Files in flight per batch")
+    parser.add_argument("--run", choices=["legacy", "packed"], default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_mode(args.run, args.corpus, args.threshold, args.num_perm, args.workers, args.batch_size)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = args.corpus
+        if folder is None:
+            folder = tmp
+            generate_corpus(folder, args.files)
+
+        # Each mode runs in a fresh interpreter so peak RSS is not shared between them
+        results = []
+        for mode in ["legacy", "packed"]:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run", mode, "--corpus", folder,
+                 "--threshold", str(args.threshold), "--num_perm", str(args.num_perm),
+                 "--workers", str(args.workers), "--batch_size", str(args.batch_size)],
+                capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    print(f"{'mode':<10}{'unique':>10}{'seconds':>10}{'parent MB':>12}{'worker MB':>12}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['unique']:>10}{r['seconds']:>10.1f}"
+              f"{r['parent_peak_rss_mb']:>12.1f}{r['worker_peak_rss_mb']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,113 @@
 import os
-import re
+import sys
+import time
+import tempfile
+import hashlib
 import argparse
+import itertools
 import logging
-from datasketch import MinHash, MinHashLSH
+import numpy as np
+from datasketch import MinHash
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from util.text_normalizer import normalize, normalize_text
+from band_shards import connected_components, partition_dir, resolve_partition, spill_band_hashes
+from lsh_index import BandIndex, PersistentLSHIndex, band_hashes, optimal_bands
+from sources import open_source
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-def normalize_text(text):
-    text = re.sub(r'\n', ' ', text)
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
+def compute_signature(text, num_perm):
+    """Returns the MinHash signature of a text as a uint64 array."""
+    minhash = MinHash(num_perm=num_perm)
+    _, tokens = normalize(text)
+    minhash.update_batch([word.encode('utf-8') for word in tokens])
+    return minhash.hashvalues
+
+
+def load_text(payload, read_files):
+    if not read_files:
+        return payload or ''
+    with open(payload, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def process_chunk(doc_ids, payloads, num_perm, read_files=True):
+    """
+    Signs a chunk of documents (file paths, or texts when read_files is False) and returns the ids
+    of the readable ones together with their signatures packed into a single (n, num_perm) uint64 array.
+    """
+    signatures = np.empty((len(payloads), num_perm), dtype=np.uint64)
+    ok = np.zeros(len(payloads), dtype=bool)
+    for i, payload in enumerate(payloads):
+        try:
+            signatures[i] = compute_signature(load_text(payload, read_files), num_perm)
+            ok[i] = True
+        except Exception as e:
+            logging.warning(f"Error processing {payload if read_files else f'document {doc_ids[i]}'}: {e}")
+    return np.asarray(doc_ids, dtype=np.int64)[ok], signatures[ok]
+
+
+def hash_chunk(payloads, read_files=True):
+    """Returns the BLAKE2 digest of every document's normalized text, or None where it cannot be read."""
+    digests = []
+    for payload in payloads:
+        try:
+            text = load_text(payload, read_files)
+            digests.append(hashlib.blake2b(normalize_text(text).encode('utf-8'), digest_size=16).digest())
+        except Exception as e:
+            logging.warning(f"Error hashing {payload if read_files else 'document'}: {e}")
+            digests.append(None)
+    return digests
+
+
+def exact_hash_prefilter(executor, keys, doc_ids, payloads, read_files, first_by_digest, chunk_size):
+    """
+    Drops documents whose normalized text is identical to one seen before.
+    first_by_digest maps digests to the key of their first document and carries over between batches.
+    Returns the surviving doc ids and payloads, in input order, and a mapping of
+    the first document's key to the exact copies found in this batch.
+    """
+    futures = [executor.submit(hash_chunk, payloads[start:start + chunk_size], read_files)
+               for start in range(0, len(payloads), chunk_size)]
+    digests = [digest for future in futures for digest in future.result()]
 
-def tokenize_text(text):
-    return re.findall(r'\b\w+\b', text.lower())
+    kept_ids = []
+    kept_payloads = []
+    exact_duplicates = {}
+    for doc_id, payload, digest in zip(doc_ids, payloads, digests):
+        if digest is None:
+            continue
+        original = first_by_digest.setdefault(digest, keys[doc_id])
+        if original == keys[doc_id]:
+            kept_ids.append(doc_id)
+            kept_payloads.append(payload)
+        else:
+            exact_duplicates.setdefault(original, []).append(keys[doc_id])
+    return kept_ids, kept_payloads, exact_duplicates
 
-def process_file(file_path, num_perm):
-    """Reads file, tokenizes, and returns its MinHash signature."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            file_content = f.read()
-        minhash = MinHash(num_perm=num_perm)
-        for word in tokenize_text(normalize_text(file_content)):
-            minhash.update(word.encode('utf-8'))
-        return file_path, minhash
-    except Exception as e:
-        logging.warning(f"Error processing file {file_path}: {e}")
-        return None
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def read_batches(source, keys, batch_size, limit=None):
+    """
+    Streams a source in batches of at most batch_size documents.
+    Keys are appended to keys, so doc ids are positions in it; yields (doc ids, payloads, read_files).
+    """
+    records, read_files = open_source(source)
+    if limit:
+        records = itertools.islice(records, limit)
+    for batch in batched(records, batch_size):
+        start = len(keys)
+        keys.extend(key for key, _ in batch)
+        yield range(start, len(keys)), [payload for _, payload in batch], read_files
 
 
 def append_unique_to_file(unique_store, file_path):
@@ -39,20 +119,19 @@ def append_unique_to_file(unique_store, file_path):
             f.write(f"{file_path}\n")
 
 
-def process_futures(futures, lsh, unique_store, unique_files, duplicates, original_to_duplicates, processed_count):
+def process_futures(futures, lsh, rows, file_paths, unique_store, unique_files, duplicates, original_to_duplicates, processed_count):
     for future in as_completed(futures):
-        result = future.result()
-        if result:
-            file_path, minhash = result
-            query_result = lsh.query(minhash)
-            if query_result:
-                canonical = query_result[0]
-                # original_to_duplicates.setdefault(canonical, []).append(file_path)
-                # duplicates.append(file_path)
+        doc_ids, signatures = future.result()
+        for doc_id, hashes in zip(doc_ids.tolist(), band_hashes(signatures, lsh.bands, rows)):
+            canonical = lsh.query(hashes)
+            if canonical < 0:
+                lsh.insert(hashes, doc_id)
+                unique_files.append(file_paths[doc_id])
+                append_unique_to_file(unique_store, file_paths[doc_id])
             else:
-                lsh.insert(file_path, minhash)
-                unique_files.append(file_path)
-                append_unique_to_file(unique_store, file_path)
+                # A near-duplicate of file_paths[canonical]
+                duplicates.append(file_paths[doc_id])
+                original_to_duplicates.setdefault(file_paths[canonical], []).append(file_paths[doc_id])
             processed_count += 1
             if processed_count % 1000 == 0:
                 logging.info(f"Processed {processed_count} files")
@@ -60,41 +139,205 @@ def process_futures(futures, lsh, unique_store, unique_files, duplicates, origin
 
 
 def deduplicate_text_files_lsh(folder_path, threshold=0.5, num_perm=128, workers=4,
-                               limit=None, use_threads=False, batch_size=1000, unique_store="unique_files.txt"):
+                               limit=None, use_threads=False, batch_size=1000, unique_store="unique_files.txt",
+                               prefilter=True, chunk_size=100):
     """
     Deduplicates text files using MinHashLSH with parallelism.
-    Processes files in batches so progress logging happens continuously.
+    folder_path may also be a tar(.gz) archive, a parquet file or a folder of those (see sources.open_source);
+    they are streamed batch by batch, so at most batch_size texts are held in memory.
+    With prefilter, exact copies (after normalization) are grouped by hash first
+    and only one file per group goes through MinHash and LSH.
+    Workers return signatures for chunk_size files at a time as one packed uint64 array.
+    The LSH tables map uint64 band hashes to the file's position in the listing instead of its path.
     """
-    lsh = MinHashLSH(threshold=threshold, num_perm=num_perm)
+    bands, rows = optimal_bands(threshold, num_perm)
+    lsh = BandIndex(bands)
     duplicates = []
     unique_files = []
     original_to_duplicates = {}
+    file_paths = []
 
-    file_paths = [entry.path for entry in os.scandir(folder_path) if entry.is_file()]
-    if limit:
-        file_paths = file_paths[:limit]
-
-    total_files = len(file_paths)
-    logging.info(f"Processing {total_files} files with {workers} workers...")
+    logging.info(f"Processing {folder_path} with {workers} workers...")
     Executor = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
 
     processed_count = 0
+    exact_count = 0
+    prefilter_time = 0.0
+    lsh_time = 0.0
     with Executor(max_workers=workers) as executor:
-        futures = []
-        for file_path in file_paths:
-            futures.append(executor.submit(process_file, file_path, num_perm))
-            if len(futures) >= batch_size:
-                processed_count = process_futures(futures, lsh, unique_store, unique_files, duplicates, original_to_duplicates, processed_count)
-                futures = []
-        # Process any remaining futures.
-        if futures:
-            processed_count = process_futures(futures, lsh, unique_store, unique_files, duplicates, original_to_duplicates, processed_count)
+        first_by_digest = {}
+        for doc_ids, payloads, read_files in read_batches(folder_path, file_paths, batch_size, limit):
+            if prefilter:
+                stage_start = time.perf_counter()
+                doc_ids, payloads, exact_duplicates = exact_hash_prefilter(
+                    executor, file_paths, doc_ids, payloads, read_files, first_by_digest, chunk_size)
+                for original, copies in exact_duplicates.items():
+                    original_to_duplicates.setdefault(original, []).extend(copies)
+                    duplicates.extend(copies)
+                    exact_count += len(copies)
+                prefilter_time += time.perf_counter() - stage_start
+
+            stage_start = time.perf_counter()
+            futures = [executor.submit(process_chunk, doc_ids[start:start + chunk_size],
+                                       payloads[start:start + chunk_size], num_perm, read_files)
+                       for start in range(0, len(doc_ids), chunk_size)]
+            processed_count = process_futures(futures, lsh, rows, file_paths, unique_store, unique_files, duplicates, original_to_duplicates, processed_count)
+            lsh_time += time.perf_counter() - stage_start
+
+    total_files = len(file_paths)
+    if prefilter:
+        logging.info(f"Exact-hash prefilter removed {exact_count} of {total_files} files in {prefilter_time:.2f}s")
+    logging.info(f"MinHash LSH stage processed {processed_count} files and found {len(duplicates) - exact_count} "
+                 f"near-duplicates in {lsh_time:.2f}s")
+
+    return duplicates, unique_files, original_to_duplicates, total_files
+
+
+def spill_chunk(doc_ids, payloads, num_perm, bands, rows, spill_dir, partitions, tag, read_files=True):
+    """Signs a chunk of documents and spills their band hashes to disk; returns the ids of the readable ones."""
+    doc_ids, signatures = process_chunk(doc_ids, payloads, num_perm, read_files)
+    spill_band_hashes(spill_dir, partitions, doc_ids, band_hashes(signatures, bands, rows), tag)
+    return doc_ids
+
+
+def deduplicate_text_files_sharded(folder_path, threshold=0.5, num_perm=128, workers=4,
+                                   limit=None, use_threads=False, batch_size=1000, unique_store="unique_files.txt",
+                                   prefilter=True, chunk_size=100, partitions=None, spill_dir=None):
+    """
+    Deduplicates text files without holding the LSH tables in any single process.
+    Workers spill (band, bucket, doc id) records to disk partitioned by band, every partition is
+    resolved into candidate pairs by its own worker, and the pairs are merged with union-find.
+    Each connected component keeps its first file in listing order as the original; the rest
+    (and the exact copies found by the prefilter) are reported in original_to_duplicates.
+    """
+    bands, rows = optimal_bands(threshold, num_perm)
+    partitions = min(partitions or bands, bands)
+    duplicates = []
+    unique_files = []
+    original_to_duplicates = {}
+    file_paths = []
+
+    logging.info(f"Processing {folder_path} with {workers} workers in {partitions} band partitions...")
+    Executor = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+
+    with Executor(max_workers=workers) as executor, tempfile.TemporaryDirectory(dir=spill_dir) as spill_root:
+        stage_start = time.perf_counter()
+        first_by_digest = {}
+        exact_duplicates = {}
+        signed = []
+        for doc_ids, payloads, read_files in read_batches(folder_path, file_paths, batch_size, limit):
+            if prefilter:
+                doc_ids, payloads, batch_duplicates = exact_hash_prefilter(
+                    executor, file_paths, doc_ids, payloads, read_files, first_by_digest, chunk_size)
+                for original, copies in batch_duplicates.items():
+                    exact_duplicates.setdefault(original, []).extend(copies)
+            futures = [executor.submit(spill_chunk, doc_ids[start:start + chunk_size], payloads[start:start + chunk_size],
+                                       num_perm, bands, rows, spill_root, partitions, f"{doc_ids[start]:010d}", read_files)
+                       for start in range(0, len(doc_ids), chunk_size)]
+            signed.extend(future.result() for future in futures)
+            logging.info(f"Signed {sum(len(ids) for ids in signed)} of {len(file_paths)} files")
+        signed = np.concatenate(signed) if signed else np.empty(0, dtype=np.int64)
+        logging.info(f"Signing stage processed {len(signed)} files in {time.perf_counter() - stage_start:.2f}s")
+
+        stage_start = time.perf_counter()
+        pairs = list(executor.map(resolve_partition, [partition_dir(spill_root, p) for p in range(partitions)]))
+        pairs = np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int64)
+        logging.info(f"Resolved {len(pairs)} candidate pairs in {time.perf_counter() - stage_start:.2f}s")
+
+    total_files = len(file_paths)
+    roots = connected_components(total_files, pairs)
+    for doc_id, root in zip(signed.tolist(), roots[signed].tolist()):
+        file_path = file_paths[doc_id]
+        cluster = original_to_duplicates.setdefault(file_paths[root], [])
+        if doc_id == root:
+            unique_files.append(file_path)
+        else:
+            cluster.append(file_path)
+        cluster.extend(exact_duplicates.get(file_path, []))
+    original_to_duplicates = {original: cluster for original, cluster in original_to_duplicates.items() if cluster}
+    for cluster in original_to_duplicates.values():
+        duplicates.extend(cluster)
+
+    with open(unique_store, 'a', encoding='utf-8') as f:
+        f.writelines(f"{file_path}\n" for file_path in unique_files)
 
     return duplicates, unique_files, original_to_duplicates, total_files
 
+
+def sign_batch(executor, payloads, read_files, num_perm, chunk_size):
+    """Signs a batch of payloads in parallel and returns (positions in the batch, signatures) in input order."""
+    futures = [executor.submit(process_chunk, range(start, min(start + chunk_size, len(payloads))),
+                               payloads[start:start + chunk_size], num_perm, read_files)
+               for start in range(0, len(payloads), chunk_size)]
+    results = [future.result() for future in futures]
+    if not results:
+        return np.empty(0, dtype=np.int64), np.empty((0, num_perm), dtype=np.uint64)
+    return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+
+def deduplicate_incremental(sources, index_dir, threshold=0.5, num_perm=128, workers=4, use_threads=False,
+                            batch_size=1000, unique_store="unique_files.txt", chunk_size=100):
+    """
+    Deduplicates new folders or parquet files against a persistent index of everything indexed before.
+    Every batch is committed to the index, so an interrupted run resumes where it stopped,
+    and sources that were already finished are skipped.
+    """
+    index = PersistentLSHIndex(index_dir, threshold, num_perm)
+    logging.info(f"Loaded index with {index.n_docs} documents from {index_dir}")
+    index.truncate_output(unique_store)
+    duplicates = []
+    unique_files = []
+    total_files = 0
+
+    Executor = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+    with Executor(max_workers=workers) as executor:
+        for source in sources:
+            source_key = os.path.abspath(source)
+            consumed, done = index.source_progress(source_key)
+            if done:
+                logging.info(f"Skipping {source}: already indexed")
+                continue
+            if consumed:
+                logging.info(f"Resuming {source} after {consumed} documents")
+
+            records, read_files = open_source(source)
+            for batch in batched(itertools.islice(records, consumed, None), batch_size):
+                keys = [key for key, _ in batch]
+                positions, signatures = sign_batch(executor, [payload for _, payload in batch], read_files, num_perm, chunk_size)
+                hashes = band_hashes(signatures, index.bands, index.rows)
+                base_matches = index.query_base(hashes)
+
+                new_unique = []
+                for position, row, signature, base_match in zip(positions.tolist(), hashes, signatures, base_matches.tolist()):
+                    if base_match >= 0 or index.query(row) >= 0:
+                        duplicates.append(keys[position])
+                    else:
+                        index.insert(row, keys[position], signature)
+                        new_unique.append(keys[position])
+
+                consumed += len(batch)
+                total_files += len(batch)
+                # The unique keys reach the disk before the commit that marks their documents as indexed
+                unique_files.extend(new_unique)
+                with open(unique_store, 'a', encoding='utf-8') as f:
+                    f.writelines(f"{key}\n" for key in new_unique)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    store_size = f.tell()
+                index.commit(source_key, consumed, outputs={unique_store: store_size})
+                logging.info(f"{source}: processed {consumed} documents, index holds {index.n_docs}")
+
+            index.commit(source_key, consumed, done=True)
+
+    index.close()
+    return duplicates, unique_files, total_files
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Deduplicate text files using MinHash LSH")
-    parser.add_argument("folder", type=str, help="Folder containing text files")
+    parser.add_argument("folder", type=str, nargs="+",
+                        help="Folder of text files, tar(.gz) archive, parquet file or folder of archives/parquet files "
+                             "(with --index_dir: any number of them)")
     parser.add_argument("--threshold", type=float, default=0.5, help="Similarity threshold (0-1)")
     parser.add_argument("--num_perm", type=int, default=128, help="Number of MinHash permutations")
     parser.add_argument("--workers", type=int, default=4, help="Number of parallel workers")
@@ -102,13 +345,37 @@ if __name__ == "__main__":
     parser.add_argument("--use_threads", action="store_true", help="Use threads instead of processes")
     parser.add_argument("--batch_size", type=int, default=1000, help="Batch size for processing futures")
     parser.add_argument("--output", type=str, default="unique_files.txt", help="Output file to write unique file names")
+    parser.add_argument("--no_prefilter", action="store_true", help="Skip the exact-hash prefilter before MinHash")
+    parser.add_argument("--chunk_size", type=int, default=100, help="Number of files each worker task signs at once")
+    parser.add_argument("--index_dir", type=str, default=None,
+                        help="Persistent index directory: check inputs against it and add their unique documents")
+    parser.add_argument("--sharded", action="store_true",
+                        help="Partition LSH bands across workers through disk and cluster duplicates with union-find")
+    parser.add_argument("--partitions", type=int, default=None, help="Number of band partitions (default: one per band)")
+    parser.add_argument("--spill_dir", type=str, default=None, help="Where to spill band hashes in sharded mode")
 
     args = parser.parse_args()
 
-    duplicates, unique_files, original_to_duplicates, total_files = deduplicate_text_files_lsh(
-        args.folder, args.threshold, args.num_perm, args.workers,
-        args.limit, args.use_threads, args.batch_size, args.output
-    )
+    if args.index_dir:
+        duplicates, unique_files, total_files = deduplicate_incremental(
+            args.folder, args.index_dir, args.threshold, args.num_perm, args.workers,
+            args.use_threads, args.batch_size, args.output, args.chunk_size
+        )
+    elif args.sharded:
+        if len(args.folder) != 1:
+            parser.error("multiple inputs require --index_dir")
+        duplicates, unique_files, original_to_duplicates, total_files = deduplicate_text_files_sharded(
+            args.folder[0], args.threshold, args.num_perm, args.workers,
+            args.limit, args.use_threads, args.batch_size, args.output, not args.no_prefilter, args.chunk_size,
+            args.partitions, args.spill_dir
+        )
+    else:
+        if len(args.folder) != 1:
+            parser.error("multiple inputs require --index_dir")
+        duplicates, unique_files, original_to_duplicates, total_files = deduplicate_text_files_lsh(
+            args.folder[0], args.threshold, args.num_perm, args.workers,
+            args.limit, args.use_threads, args.batch_size, args.output, not args.no_prefilter, args.chunk_size
+        )
 
     dup_percentage = (len(unique_files) / total_files * 100) if total_files > 0 else 0
     logging.info(f"Threshold: {args.threshold}")
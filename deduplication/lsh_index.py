@@ -0,0 +1,268 @@
+import os
+import json
+import logging
+
+import numpy as np
+from datasketch.lsh import _optimal_param
+
+# splitmix64 finalizer constants
+_MIX_1 = np.uint64(0xbf58476d1ce4e5b9)
+_MIX_2 = np.uint64(0x94d049bb133111eb)
+_SEED = np.uint64(0x9e3779b97f4a7c15)
+
+
+def optimal_bands(threshold, num_perm, false_positive_weight=0.5, false_negative_weight=0.5):
+    """Returns the (bands, rows) split MinHashLSH would pick for this threshold."""
+    return _optimal_param(threshold, num_perm, false_positive_weight, false_negative_weight)
+
+
+def _mix(x):
+    x = (x ^ (x >> np.uint64(30))) * _MIX_1
+    x = (x ^ (x >> np.uint64(27))) * _MIX_2
+    return x ^ (x >> np.uint64(31))
+
+
+def band_hashes(signatures, bands, rows):
+    """
+    Hashes every band of every signature into one uint64 bucket key.
+    signatures is an (n, num_perm) uint64 array; returns an (n, bands) uint64 array.
+    Up to 64-bit hash collisions, two documents share a bucket exactly when MinHashLSH would put them in one.
+    """
+    signatures = np.asarray(signatures, dtype=np.uint64)
+    banded = signatures[:, :bands * rows].reshape(len(signatures), bands, rows)
+    hashes = np.full((len(signatures), bands), _SEED, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for row in range(rows):
+            hashes = _mix(hashes ^ banded[:, :, row])
+    return hashes
+
+
+class BandIndex:
+    """
+    Banded LSH over integer doc ids with the query-then-insert semantics of MinHashLSH:
+    a document is a duplicate when any of its band buckets already holds an inserted document.
+    Every bucket only remembers the first document inserted into it.
+    """
+
+    def __init__(self, bands):
+        self.bands = bands
+        self.tables = [dict() for _ in range(bands)]
+
+    def query(self, hashes):
+        """Returns the id of an inserted document sharing a bucket with these band hashes, or -1."""
+        for table, bucket in zip(self.tables, hashes.tolist()):
+            doc_id = table.get(bucket)
+            if doc_id is not None:
+                return doc_id
+        return -1
+
+    def insert(self, hashes, doc_id):
+        for table, bucket in zip(self.tables, hashes.tolist()):
+            table.setdefault(bucket, doc_id)
+
+
+class PersistentLSHIndex(BandIndex):
+    """
+    A BandIndex of unique documents that lives in a directory and grows across runs.
+
+    Layout:
+      manifest.json          parameters, committed document count, merged table width and per-source progress
+      signatures.u64         append-only (n, num_perm) uint64 signatures of the indexed documents
+      keys.txt               append-only document keys, line number == doc id
+      band_hashes.npy        (bands, m) bucket keys, each band sorted, memory-mapped on load
+      band_doc_ids.npy       (bands, m) doc ids aligned with band_hashes.npy
+
+    New documents are kept in the in-memory tables inherited from BandIndex and appended to the
+    signature and key files on every commit. Band tables are merged on close; after a crash they are
+    caught up from the committed signatures, and anything written after the last commit is truncated.
+    A merge writes both tables before recording their width in the manifest; tables that do not match
+    the manifest are refused rather than read.
+    Within a band every bucket key appears once, so the merged tables are rectangular.
+    """
+
+    def __init__(self, index_dir, threshold=0.5, num_perm=128):
+        self.index_dir = index_dir
+        os.makedirs(index_dir, exist_ok=True)
+
+        self.manifest_path = os.path.join(index_dir, "manifest.json")
+        self.signatures_path = os.path.join(index_dir, "signatures.u64")
+        self.keys_path = os.path.join(index_dir, "keys.txt")
+        self.band_hashes_path = os.path.join(index_dir, "band_hashes.npy")
+        self.band_doc_ids_path = os.path.join(index_dir, "band_doc_ids.npy")
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+            if self.manifest["num_perm"] != num_perm or self.manifest["threshold"] != threshold:
+                raise ValueError(f"Index in {index_dir} was built with threshold={self.manifest['threshold']}, "
+                                 f"num_perm={self.manifest['num_perm']}")
+        else:
+            bands, rows = optimal_bands(threshold, num_perm)
+            self.manifest = {"threshold": threshold, "num_perm": num_perm, "bands": bands, "rows": rows,
+                             "n_docs": 0, "keys_bytes": 0, "sources": {}}
+
+        super().__init__(self.manifest["bands"])
+        self.rows = self.manifest["rows"]
+        self.num_perm = num_perm
+        self.n_docs = self.manifest["n_docs"]
+
+        self._truncate_uncommitted()
+        self._load_tables()
+
+        self._pending_signatures = []
+        self._pending_keys = []
+
+    def _truncate_uncommitted(self):
+        # Drop anything a crashed run appended after its last commit
+        for path, size in [(self.signatures_path, self.n_docs * self.num_perm * 8),
+                           (self.keys_path, self.manifest["keys_bytes"])]:
+            with open(path, 'ab') as f:
+                if f.tell() != size:
+                    logging.warning(f"Truncating {path} to the last committed state")
+                    f.truncate(size)
+
+    def _load_tables(self):
+        if os.path.exists(self.band_hashes_path) and os.path.exists(self.band_doc_ids_path):
+            self.base_hashes = np.load(self.band_hashes_path, mmap_mode='r')
+            self.base_doc_ids = np.load(self.band_doc_ids_path, mmap_mode='r')
+            # Indexes written before the width was recorded only have the two tables to compare
+            expected = self.manifest.get("tables_docs", self.base_hashes.shape[1])
+            if self.base_hashes.shape != (self.bands, expected) or self.base_doc_ids.shape != (self.bands, expected):
+                raise ValueError(f"Band tables in {self.index_dir} do not match the manifest "
+                                 f"({self.base_hashes.shape} hashes, {self.base_doc_ids.shape} doc ids, "
+                                 f"{expected} documents expected), probably from an interrupted merge; "
+                                 f"delete band_hashes.npy and band_doc_ids.npy to rebuild them from the signatures")
+        else:
+            self.base_hashes = np.empty((self.bands, 0), dtype=np.uint64)
+            self.base_doc_ids = np.empty((self.bands, 0), dtype=np.int64)
+        # Merged tables only ever hold committed documents 0..tables_docs-1
+        tables_docs = self.base_hashes.shape[1]
+
+        # Catch the tables up with documents committed after the last merge
+        if tables_docs < self.n_docs:
+            logging.info(f"Rebuilding band tables for {self.n_docs - tables_docs} documents")
+            signatures = self.signatures(tables_docs, self.n_docs)
+            hashes = band_hashes(signatures, self.bands, self.rows)
+            for doc_id, row in enumerate(hashes, tables_docs):
+                super().insert(row, doc_id)
+
+    def signatures(self, start=0, stop=None):
+        """Memory-mapped view of the committed signatures."""
+        stop = self.n_docs if stop is None else stop
+        if stop <= start:
+            return np.empty((0, self.num_perm), dtype=np.uint64)
+        return np.memmap(self.signatures_path, dtype=np.uint64, mode='r',
+                         offset=start * self.num_perm * 8, shape=(stop - start, self.num_perm))
+
+    def source_progress(self, source_key):
+        """Returns (documents consumed, finished) for an input source."""
+        progress = self.manifest["sources"].get(source_key, {})
+        return progress.get("consumed", 0), progress.get("done", False)
+
+    def query_base(self, hashes):
+        """
+        Vectorized lookup of a batch of (n, bands) hashes in the merged on-disk tables.
+        Returns, per document, the id of a matching indexed document or -1.
+        """
+        result = np.full(len(hashes), -1, dtype=np.int64)
+        if not self.base_hashes.shape[1]:
+            return result
+        for band in range(self.bands):
+            table = self.base_hashes[band]
+            positions = np.minimum(np.searchsorted(table, hashes[:, band]), len(table) - 1)
+            hit = (table[positions] == hashes[:, band]) & (result < 0)
+            result[hit] = self.base_doc_ids[band][positions[hit]]
+        return result
+
+    def insert(self, hashes, key, signature):
+        """Adds a unique document and returns its doc id."""
+        doc_id = self.n_docs + len(self._pending_keys)
+        super().insert(hashes, doc_id)
+        self._pending_signatures.append(signature)
+        self._pending_keys.append(key)
+        return doc_id
+
+    def truncate_output(self, path):
+        """
+        Cuts an output file that is appended alongside commits (see commit's outputs) back to its size at
+        the last commit, dropping lines a crashed run wrote for documents the index never committed.
+        """
+        size = self.manifest.get("outputs", {}).get(os.path.abspath(path))
+        if size is not None and os.path.exists(path) and os.path.getsize(path) != size:
+            logging.warning(f"Truncating {path} to the last committed state")
+            with open(path, 'ab') as f:
+                f.truncate(size)
+
+    def commit(self, source_key, consumed, done=False, outputs=None):
+        """
+        Durably appends pending documents and records how far source_key has been read, together with
+        the sizes of already fsynced output files ({path: bytes}) that belong to this state.
+        """
+        if self._pending_keys:
+            with open(self.signatures_path, 'ab') as f:
+                f.write(np.asarray(self._pending_signatures, dtype=np.uint64).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.keys_path, 'ab') as f:
+                f.write(''.join(f"{key}\n" for key in self._pending_keys).encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+                self.manifest["keys_bytes"] = f.tell()
+            self.n_docs += len(self._pending_keys)
+            self._pending_signatures = []
+            self._pending_keys = []
+
+        self.manifest["n_docs"] = self.n_docs
+        self.manifest["sources"][source_key] = {"consumed": consumed, "done": done}
+        for path, size in (outputs or {}).items():
+            self.manifest.setdefault("outputs", {})[os.path.abspath(path)] = size
+        self._write_manifest()
+
+    def close(self):
+        """Merges the in-memory tables into the memory-mapped ones."""
+        if self.base_hashes.shape[1] == self.n_docs:
+            return
+        merged_hashes = []
+        merged_doc_ids = []
+        for band, table in enumerate(self.tables):
+            hashes = np.concatenate([self.base_hashes[band], np.fromiter(table.keys(), dtype=np.uint64, count=len(table))])
+            doc_ids = np.concatenate([self.base_doc_ids[band], np.fromiter(table.values(), dtype=np.int64, count=len(table))])
+            order = np.argsort(hashes, kind='stable')
+            merged_hashes.append(hashes[order])
+            merged_doc_ids.append(doc_ids[order])
+
+        # Both tables are durable before either replaces its predecessor, and the manifest only records
+        # the new width once both are in place
+        replacements = []
+        for path, array in [(self.band_hashes_path, np.array(merged_hashes)), (self.band_doc_ids_path, np.array(merged_doc_ids))]:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array)
+                f.flush()
+                os.fsync(f.fileno())
+            replacements.append((tmp_path, path))
+        for tmp_path, path in replacements:
+            os.replace(tmp_path, path)
+        self._fsync_dir()
+        self.manifest["tables_docs"] = len(merged_hashes[0])
+        self._write_manifest()
+
+        self.tables = [dict() for _ in range(self.bands)]
+        self._load_tables()
+
+    def _write_manifest(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+        self._fsync_dir()
+
+    def _fsync_dir(self):
+        # A rename itself is only durable once the directory entry is
+        directory = os.open(self.index_dir, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
@@ -0,0 +1,149 @@
+import argparse
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from band_shards import bucket_links, connected_components
+from deduplication import batched, read_batches, sign_batch
+from lsh_index import BandIndex, band_hashes, optimal_bands
+
+
+def build_signature_store(source, output_path, num_perm=128, workers=4, use_threads=False,
+                          batch_size=1000, chunk_size=100):
+    """
+    Computes MinHash signatures once and writes them to a parquet file with an id column and a
+    fixed-size list<uint64> signature column, in input order.
+    source is anything deduplication.py accepts, or an iterable of (id, text) pairs such as a DataFrame's columns.
+    Returns the number of signatures written.
+    """
+    schema = pa.schema([('id', pa.string()), ('signature', pa.list_(pa.uint64(), num_perm))])
+    written = 0
+    Executor = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+    with Executor(max_workers=workers) as executor, pq.ParquetWriter(output_path, schema) as writer:
+        if isinstance(source, str):
+            keys = []
+            batches = ((keys[doc_ids.start:doc_ids.stop], payloads, read_files)
+                       for doc_ids, payloads, read_files in read_batches(source, keys, batch_size))
+        else:
+            batches = (([str(key) for key, _ in batch], [text for _, text in batch], False)
+                       for batch in batched(source, batch_size))
+
+        for batch_keys, payloads, read_files in batches:
+            positions, signatures = sign_batch(executor, payloads, read_files, num_perm, chunk_size)
+            ids = pa.array([batch_keys[position] for position in positions.tolist()], type=pa.string())
+            values = pa.FixedSizeListArray.from_arrays(pa.array(signatures.ravel(), type=pa.uint64()), num_perm)
+            writer.write_table(pa.Table.from_arrays([ids, values], schema=schema))
+            written += len(ids)
+            logging.info(f"Stored {written} signatures")
+    return written
+
+
+def load_signatures(path):
+    """Returns (ids, signatures) from a signature store: an object array of ids and an (n, num_perm) uint64 matrix."""
+    table = pq.read_table(path)
+    num_perm = table.schema.field('signature').type.list_size
+    values = table.column('signature').combine_chunks().flatten()
+    signatures = values.to_numpy(zero_copy_only=False).reshape(len(table), num_perm)
+    return np.asarray(table.column('id').to_pylist(), dtype=object), signatures
+
+
+def duplicate_mask(signatures, bands, rows):
+    """
+    Marks duplicates the way deduplicate_text_files_lsh does: documents are taken in order and one is a
+    duplicate when it shares a band bucket with an earlier unique document.
+    """
+    index = BandIndex(bands)
+    mask = np.zeros(len(signatures), dtype=bool)
+    for doc_id, hashes in enumerate(band_hashes(signatures, bands, rows)):
+        if index.query(hashes) >= 0:
+            mask[doc_id] = True
+        else:
+            index.insert(hashes, doc_id)
+    return mask
+
+
+def count_clusters(signatures, bands, rows):
+    """Number of connected components when every shared band bucket links two documents (the --sharded result)."""
+    hashes = band_hashes(signatures, bands, rows)
+    n = len(hashes)
+    pairs = bucket_links(np.tile(np.arange(bands), n), hashes.ravel(), np.repeat(np.arange(n), bands))
+    roots = connected_components(n, pairs)
+    return int(np.count_nonzero(roots == np.arange(n)))
+
+
+def sweep(signatures, thresholds=(), configs=()):
+    """
+    Evaluates LSH settings against stored signatures without touching the texts.
+    Every threshold is mapped to the (bands, rows) split MinHashLSH would use; configs adds explicit
+    (bands, rows) pairs. Returns one row per setting with unique and duplicate counts for the greedy
+    mode and the number of clusters for the sharded mode.
+    """
+    num_perm = signatures.shape[1]
+    settings = [(threshold, *optimal_bands(threshold, num_perm)) for threshold in thresholds]
+    settings += [(None, bands, rows) for bands, rows in configs]
+
+    results = []
+    for threshold, bands, rows in settings:
+        if bands * rows > num_perm:
+            raise ValueError(f"{bands}x{rows} bands need {bands * rows} permutations, signatures have {num_perm}")
+        stage_start = time.perf_counter()
+        mask = duplicate_mask(signatures, bands, rows)
+        results.append({
+            'threshold': threshold,
+            'bands': bands,
+            'rows': rows,
+            # Similarity at which a pair becomes a candidate with probability 1/2
+            'approx_threshold': round((1 / bands) ** (1 / rows), 3),
+            'unique': int(len(mask) - mask.sum()),
+            'duplicates': int(mask.sum()),
+            'clusters': count_clusters(signatures, bands, rows),
+            'total': len(mask),
+        })
+        logging.info(f"bands={bands}, rows={rows}: {results[-1]['unique']} unique "
+                     f"in {time.perf_counter() - stage_start:.2f}s")
+    return pd.DataFrame(results)
+
+
+def parse_config(value):
+    bands, rows = value.lower().split('x')
+    return int(bands), int(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store MinHash signatures once and sweep dedup thresholds against them")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Compute signatures for an input and store them")
+    build_parser.add_argument("source", type=str, help="Folder of text files, archive, parquet file or folder of those")
+    build_parser.add_argument("output", type=str, help="Output parquet file")
+    build_parser.add_argument("--num_perm", type=int, default=128, help="Number of MinHash permutations")
+    build_parser.add_argument("--workers", type=int, default=4, help="Number of parallel workers")
+    build_parser.add_argument("--use_threads", action="store_true", help="Use threads instead of processes")
+    build_parser.add_argument("--batch_size", type=int, default=1000, help="Documents read per batch")
+    build_parser.add_argument("--chunk_size", type=int, default=100, help="Number of documents each worker task signs at once")
+
+    sweep_parser = subparsers.add_parser("sweep", help="Count unique documents per threshold or band/row config")
+    sweep_parser.add_argument("signatures", type=str, help="Signature parquet file written by build")
+    sweep_parser.add_argument("--thresholds", type=float, nargs="*", default=[0.5, 0.6, 0.7, 0.8, 0.9],
+                              help="Similarity thresholds")
+    sweep_parser.add_argument("--configs", type=parse_config, nargs="*", default=[],
+                              help="Explicit band/row configurations such as 16x8")
+    sweep_parser.add_argument("--output", type=str, default=None, help="Write the table to this CSV file")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_signature_store(args.source, args.output, args.num_perm, args.workers, args.use_threads,
+                                      args.batch_size, args.chunk_size)
+        logging.info(f"Wrote {count} signatures to {args.output}")
+    else:
+        _, signatures = load_signatures(args.signatures)
+        table = sweep(signatures, args.thresholds, args.configs)
+        print(table.to_string(index=False))
+        if args.output:
+            table.to_csv(args.output, index=False)
@@ -0,0 +1,122 @@
+import os
+import re
+import logging
+import tarfile
+
+import pyarrow.parquet as pq
+
+ARCHIVE_SUFFIXES = ('.tar.gz', '.tgz', '.tar')
+PARQUET_SUFFIX = '.parquet'
+TEXT_SUFFIX = '.txt'
+# The collector keeps documents of a batch that is not archived yet in this subfolder of its output directory
+DOCUMENTS_DIR = 'documents'
+# Documents are named after their numeric id; other .txt files (e.g. progress_checkpoint.txt) are bookkeeping
+DOCUMENT_NAME_RE = re.compile(r'^\d+\.txt$')
+
+
+def natural_key(name):
+    """Sort key that puts documents_batch_2 before documents_batch_10."""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+def is_archive(path):
+    return path.endswith(ARCHIVE_SUFFIXES)
+
+
+def is_parquet(path):
+    return path.endswith(PARQUET_SUFFIX)
+
+
+def iter_folder(folder_path):
+    """Yields (path, path) for every file of a folder; workers read the files themselves."""
+    for file_path in sorted(entry.path for entry in os.scandir(folder_path) if entry.is_file()):
+        yield file_path, file_path
+
+
+def iter_archive(archive_path):
+    """
+    Streams (archive_path/member, text) from a tar archive such as the collector's documents_batch_N.tar.gz.
+    The archive is read sequentially, one member in memory at a time, without extracting anything to disk.
+    """
+    with tarfile.open(archive_path, 'r|*') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            data = tar.extractfile(member).read()
+            try:
+                text = data.decode('utf-8')
+            except UnicodeDecodeError as e:
+                logging.warning(f"Error decoding {member.name} in {archive_path}: {e}")
+                continue
+            yield os.path.join(archive_path, member.name), text
+
+
+def iter_parquet(parquet_path, id_column='id', text_column='text', batch_size=1024):
+    """Streams (id, text) from a parquet file written by tools/folder_to_parquet.py, one record batch at a time."""
+    parquet_file = pq.ParquetFile(parquet_path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=[id_column, text_column]):
+        yield from zip(map(str, batch.column(id_column).to_pylist()), batch.column(text_column).to_pylist())
+
+
+def iter_text_files(paths):
+    """Yields (path, text) for loose text files, read here rather than by the workers."""
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            text = data.decode('utf-8')
+        except UnicodeDecodeError as e:
+            logging.warning(f"Error decoding {path}: {e}")
+            continue
+        yield path, text
+
+
+def iter_files(paths):
+    for path in paths:
+        if is_archive(path):
+            yield from iter_archive(path)
+        elif is_parquet(path):
+            yield from iter_parquet(path)
+        else:
+            yield from iter_text_files([path])
+
+
+def loose_documents(folder, files):
+    """
+    Returns the document .txt files kept next to the batch files of a folder: those of the collector's
+    documents/ subfolder and top-level files named after a document id, in natural order.
+    """
+    documents_dir = os.path.join(folder, DOCUMENTS_DIR)
+    if os.path.isdir(documents_dir):
+        files = files + [entry.path for entry in os.scandir(documents_dir) if entry.is_file()]
+    return sorted((path for path in files if DOCUMENT_NAME_RE.match(os.path.basename(path))),
+                  key=lambda path: natural_key(os.path.basename(path)))
+
+
+def open_source(source):
+    """
+    Returns (records, read_files) for an input: records yields (key, payload) pairs in a stable order,
+    and read_files tells whether payloads are file paths to read or the document text itself.
+
+    Accepted inputs are a folder of text files, a tar(.gz) archive, a parquet file with id/text columns,
+    or a folder of archives and parquet files (e.g. the collector's output directory), read in natural order
+    and followed by the documents not archived yet (see loose_documents).
+    """
+    if os.path.isfile(source):
+        if is_archive(source) or is_parquet(source):
+            return iter_files([source]), False
+        raise ValueError(f"Unsupported input file: {source}")
+
+    files = [entry.path for entry in os.scandir(source) if entry.is_file()]
+    batch_files = sorted((path for path in files if is_archive(path) or is_parquet(path)),
+                         key=lambda path: natural_key(os.path.basename(path)))
+    if batch_files:
+        # A half-migrated folder keeps some documents as loose .txt files; they follow the batch files so they
+        # are not silently left out. The collector's bookkeeping (progress_checkpoint.txt, manifest.tsv,
+        # failed_rows.tsv) does not match the document naming and is skipped.
+        text_files = loose_documents(source, files)
+        if text_files:
+            logging.warning(f"{source} mixes {len(batch_files)} archive/parquet files with {len(text_files)} "
+                            f"loose document files; reading both")
+        return iter_files(batch_files + text_files), False
+    return iter_folder(source), True
@@ -1,16 +1,21 @@
-import pandas as pd
 import os
+import sys
 
 python_file_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(python_file_path, '..', '..'))
 
-df = pd.read_parquet(f'{python_file_path}/2024-court-decisions.parquet')
+from util.corpus_reader import CorpusReader
 
-print(df.head())
+# Opening the corpus reads only the parquet footer; rows are read on demand
+reader = CorpusReader(f'{python_file_path}/2024-court-decisions.parquet')
 
-#print the number of rows
-print(f'Number of rows: {df.shape[0]}')
+print(reader.schema)
+print(reader.head(5))
 
-# print first 10 texts
-for index, row in df.head(3).iterrows():
-    print(row['text'])
+#print the number of rows (from the file metadata, no data is read)
+print(f'Number of rows: {reader.count_rows()}')
+
+# print first 3 texts
+for text in reader.head(3, columns=['text'])['text']:
+    print(text)
     print('-'*100)
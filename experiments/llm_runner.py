@@ -0,0 +1,301 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple, Type
+
+from openai import AsyncOpenAI
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+FSTRING_RE = re.compile(r'\{\{(\w+)\}\}')
+
+
+def resolve_fstrings(messages, context):
+    """Fills {{name}} placeholders in every message content from context."""
+    new_messages = []
+    for msg in messages:
+        content = msg.get("content", "")
+        new_content = FSTRING_RE.sub(lambda m: str(context[m.group(1)]), content)
+        new_msg = msg.copy()
+        new_msg["content"] = new_content
+        new_messages.append(new_msg)
+    return new_messages
+
+
+@dataclass
+class Provider:
+    """An OpenAI-compatible endpoint and how many requests may be in flight against it at once."""
+    base_url: Optional[str] = None
+    api_key_env: Optional[str] = None
+    api_key: Optional[str] = None
+    max_concurrency: int = 8
+    params: Dict[str, Any] = field(default_factory=dict)
+
+    def client(self, max_retries: int = 5, timeout: float = 600.0) -> AsyncOpenAI:
+        api_key = self.api_key or (os.getenv(self.api_key_env) if self.api_key_env else None) or 'none'
+        return AsyncOpenAI(base_url=self.base_url, api_key=api_key, max_retries=max_retries, timeout=timeout)
+
+
+PROVIDERS = {
+    'openai': Provider(api_key_env='OPENAI_API_KEY', max_concurrency=16),
+    'gemini': Provider(base_url='https://generativelanguage.googleapis.com/v1beta/openai/', api_key_env='GEMINI_API_KEY',
+                       max_concurrency=8),
+    # Ollama serves one model on the local GPU, so more parallel requests only queue up there
+    'ollama': Provider(base_url='http://localhost:11434/v1', api_key='ollama', max_concurrency=2),
+    'llamacloud': Provider(base_url='https://api.llamacloud.co', api_key_env='LLAMA_CLOUD_API_KEY', max_concurrency=8,
+                           params={'max_tokens': 4096}),
+}
+
+MODEL_PROVIDERS = {
+    'aya': 'ollama',
+    'llama-3.2-8b': 'llamacloud',
+    'llama-3.3-70b': 'llamacloud',
+    'mistral-nemo': 'llamacloud',
+    'gpt-4o-mini': 'openai',
+    'gpt-4o-2024-08-06': 'openai',
+}
+
+
+def _hash(value) -> str:
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def schema_hash(schema: Type[BaseModel]) -> str:
+    """Changes whenever the schema's name or JSON schema changes, so edited schemas do not hit stale entries."""
+    return _hash([schema.__name__, schema.model_json_schema()])
+
+
+def prompt_hash(messages: List[dict], params: Optional[dict] = None) -> str:
+    return _hash([messages, params or {}])
+
+
+class ResponseCache:
+    """
+    SQLite cache of raw model responses keyed by (model, schema hash, resolved prompt hash).
+    Only successful, schema-valid responses are stored.
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'model TEXT NOT NULL, schema TEXT NOT NULL, prompt TEXT NOT NULL, content TEXT NOT NULL, created REAL NOT NULL, '
+            'PRIMARY KEY (model, schema, prompt))')
+        self.connection.commit()
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[str]:
+        row = self.connection.execute('SELECT content FROM responses WHERE model = ? AND schema = ? AND prompt = ?', key).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: Tuple[str, str, str], content: str):
+        self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)', (*key, content, time.time()))
+        self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+class Checkpoint:
+    """
+    Append-only JSONL of finished tasks ({"task_id", "model", "key", "content"}), flushed after every task.
+    key is the hash of the task's cache key, so a record is only reused for the same model, schema and prompt.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # torn last line of an interrupted run
+                    self.done[record['task_id']] = record
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def get(self, task_id: str, key: str) -> Optional[str]:
+        """Content recorded for task_id, unless it was produced by a different model, schema or prompt."""
+        record = self.done.get(task_id)
+        return record['content'] if record is not None and record.get('key') == key else None
+
+    def add(self, task_id: str, model: str, key: str, content: str):
+        record = {'task_id': task_id, 'model': model, 'key': key, 'content': content}
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.file.flush()
+        self.done[task_id] = record
+
+    def close(self):
+        self.file.close()
+
+
+@dataclass
+class LabelingTask:
+    task_id: Hashable
+    model: str
+    messages: List[dict]
+    schema: Type[BaseModel]
+
+
+@dataclass
+class RunStats:
+    requests: int = 0
+    cached: int = 0
+    checkpointed: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+
+
+class LLMRunner:
+    """
+    Runs labeling prompts against OpenAI-compatible providers with bounded concurrency per provider.
+
+    Every response is looked up in / stored to a ResponseCache, so a rerun of an evaluation only pays
+    for prompts, models or schemas it has not seen. An optional checkpoint records finished tasks as
+    they complete, so an interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, cache_path: str = 'llm_cache.sqlite', providers: Optional[Dict[str, Provider]] = None,
+                 model_providers: Optional[Dict[str, str]] = None, max_retries: int = 5, timeout: float = 600.0):
+        self.providers = providers if providers is not None else PROVIDERS
+        self.model_providers = model_providers if model_providers is not None else MODEL_PROVIDERS
+        self.cache = ResponseCache(cache_path)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._clients: Dict[str, AsyncOpenAI] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._inflight: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def provider_name(self, model: str) -> str:
+        return self.model_providers.get(model, model if model in self.providers else 'openai')
+
+    def _bind_loop(self):
+        # Clients and semaphores belong to the event loop they were first used in; a new loop
+        # (e.g. a second asyncio.run) gets fresh ones
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._clients.clear()
+            self._semaphores.clear()
+            self._inflight.clear()
+            self._loop = loop
+
+    def _client(self, provider_name: str) -> AsyncOpenAI:
+        if provider_name not in self._clients:
+            self._clients[provider_name] = self.providers[provider_name].client(self.max_retries, self.timeout)
+        return self._clients[provider_name]
+
+    def _semaphore(self, provider_name: str) -> asyncio.Semaphore:
+        # Created lazily inside the running event loop
+        if provider_name not in self._semaphores:
+            self._semaphores[provider_name] = asyncio.Semaphore(self.providers[provider_name].max_concurrency)
+        return self._semaphores[provider_name]
+
+    def cache_key(self, model: str, messages: List[dict], schema: Type[BaseModel]) -> Tuple[str, str, str]:
+        params = self.providers[self.provider_name(model)].params
+        return model, schema_hash(schema), prompt_hash(messages, params)
+
+    async def _request(self, model: str, messages: List[dict], schema: Type[BaseModel]) -> str:
+        provider_name = self.provider_name(model)
+        client = self._client(provider_name)
+        completions = client.chat.completions
+        parse = getattr(completions, 'parse', None) or client.beta.chat.completions.parse
+        async with self._semaphore(provider_name):
+            response = await parse(model=model, messages=messages, response_format=schema,
+                                   **self.providers[provider_name].params)
+        return response.choices[0].message.content
+
+    async def predict(self, model: str, messages: List[dict], schema: Type[BaseModel],
+                      stats: Optional[RunStats] = None) -> BaseModel:
+        """
+        One structured prediction, served from the cache when the same prompt was already answered.
+        Identical prompts in flight at the same time share one request.
+        """
+        self._bind_loop()
+        key = self.cache_key(model, messages, schema)
+        content = self.cache.get(key)
+        if content is None and key in self._inflight:
+            content = await asyncio.shield(self._inflight[key])
+        if content is not None:
+            if stats is not None:
+                stats.cached += 1
+            return schema.model_validate_json(content)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            content = await self._request(model, messages, schema)
+            result = schema.model_validate_json(content)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # waiters re-raise it; do not log it as never retrieved
+            raise
+        finally:
+            del self._inflight[key]
+        self.cache.put(key, content)
+        future.set_result(content)
+        if stats is not None:
+            stats.requests += 1
+        return result
+
+    async def run(self, tasks: Iterable[LabelingTask], checkpoint_path: Optional[str] = None
+                  ) -> Tuple[Dict[Hashable, BaseModel], Dict[Hashable, Exception], RunStats]:
+        """
+        Runs all tasks concurrently (each provider limited to its max_concurrency) and returns
+        (results by task_id, errors by task_id, stats). Failed tasks are not cached or checkpointed,
+        so the next run retries them.
+        """
+        tasks = list(tasks)
+        stats = RunStats()
+        started = time.perf_counter()
+        checkpoint = Checkpoint(checkpoint_path) if checkpoint_path else None
+        results: Dict[Hashable, BaseModel] = {}
+        errors: Dict[Hashable, Exception] = {}
+
+        async def run_task(task: LabelingTask):
+            task_key = str(task.task_id)
+            # Task ids repeat across templates and schemas, so a record only counts for the same request
+            request_key = _hash(list(self.cache_key(task.model, task.messages, task.schema)))
+            content = checkpoint.get(task_key, request_key) if checkpoint is not None else None
+            if content is not None:
+                results[task.task_id] = task.schema.model_validate_json(content)
+                stats.checkpointed += 1
+                return
+            try:
+                result = await self.predict(task.model, task.messages, task.schema, stats)
+            except Exception as e:
+                logger.warning(f"Task {task.task_id} ({task.model}) failed: {e}")
+                errors[task.task_id] = e
+                stats.failed += 1
+                return
+            results[task.task_id] = result
+            if checkpoint is not None:
+                checkpoint.add(task_key, task.model, request_key, result.model_dump_json())
+
+        try:
+            await asyncio.gather(*(run_task(task) for task in tasks))
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+        stats.elapsed = time.perf_counter() - started
+        logger.info(f"{len(tasks)} tasks in {stats.elapsed:.1f}s: {stats.requests} requests, {stats.cached} cached, "
+                    f"{stats.checkpointed} from checkpoint, {stats.failed} failed")
+        return results, errors, stats
+
+    async def aclose(self):
+        for client in self._clients.values():
+            await client.close()
+        self._clients.clear()
+        self._semaphores.clear()
+        self.cache.close()
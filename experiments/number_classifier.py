@@ -0,0 +1,335 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from util.mask_spans import MASK_RE, find_spans
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER = 'TARGET_PLACEHOLDER'
+DEFAULT_MODEL = 'MoritzLaurer/bge-m3-zeroshot-v2.0'
+
+NUMBER_CLASS_MAPPING = {
+    'ідентифікаційний номер': 'TAXPAYER_ID',
+    'ідентифікаційний код': 'TAXPAYER_ID',
+    'ІПН': 'TAXPAYER_ID',
+    'РНОКПП': 'TAXPAYER_ID',
+    'реєстраційний номер облікової картки платника податків': 'TAXPAYER_ID',
+
+    'ЄДРПОУ': 'EDRPOU',
+    'ЄДРПОУ номер': 'EDRPOU',
+
+    'номер паспорту': 'ID',
+    'паспорт': 'ID',
+    'серія та номер паспорту': 'ID_OLD',
+    'cерія паспорту': 'ID_OLD',
+    'паспорт серія': 'ID_OLD',
+    'паспорт серії': 'ID_OLD',
+
+    'свідоцтво про смерть': 'DEATH_CERTIFICATE',
+    'свідоцтво про смерть серія': 'DEATH_CERTIFICATE',
+
+    'номер військової частини': 'MILITARY_UNIT',
+    'в/ч': 'MILITARY_UNIT',
+    'військова частина': 'MILITARY_UNIT',
+
+    'номер телефону': 'PHONE_NUMBER',
+    'абонентський номер': 'PHONE_NUMBER',
+    'IMEI': 'IMEI',
+    'MAC адреса': 'MAC_ADDRESS',
+    'мас адреса пристрою': 'MAC_ADDRESS',
+    'IP адреса': 'IP_ADDRESS',
+    'IP адреса пристрою': 'IP_ADDRESS',
+
+    'державний номерний знак': 'LICENSE_PLATE',
+    'д.н.з.': 'LICENSE_PLATE',
+    'номерний знак': 'LICENSE_PLATE',
+    'реєстраційний номер транспортного засобу': 'LICENSE_PLATE',
+    'номерний знак автомобіля': 'LICENSE_PLATE',
+    'номерний знак транспортного засобу': 'LICENSE_PLATE',
+
+    'номер водійського посвідчення': 'DRIVER_LICENSE',
+    'водійське посвідчення': 'DRIVER_LICENSE',
+    'посвідчення водія': 'DRIVER_LICENSE',
+
+    'страховий поліс': 'INSURANCE_POLICY',
+    'номер страхового полісу': 'INSURANCE_POLICY',
+
+    'VIN': 'VIN',
+    'VIN номер': 'VIN',
+
+    'IBAN': 'IBAN',
+    'IBAN номер': 'IBAN',
+    'р/р': 'IBAN',
+    'п/р': 'IBAN',
+    'розрахунковий рахунок': 'IBAN',
+    'р/р №': 'IBAN',
+
+    'номер банківської картки': 'CARD_NUMBER',
+
+    'особовий рахунок': 'ACCOUNT_NUMBER',
+    'о/р': 'ACCOUNT_NUMBER',
+
+    'номер зброї': 'WEAPON_NUMBER',
+    'номер пістолета': 'WEAPON_NUMBER',
+    'маркування зброї': 'WEAPON_NUMBER',
+    'номер гвинтівки': 'WEAPON_NUMBER',
+
+    'інше': 'OTHER'
+}
+
+
+def normalize_context(context: str) -> str:
+    """
+    Collapses whitespace and drops the ids of the other masks in a context (ОСОБА_12 -> ОСОБА_N), so
+    windows that differ only in mask numbering are classified once.
+    """
+    return MASK_RE.sub(lambda m: f'{m.group(1)}_N', ' '.join(context.split()))
+
+
+def context_window(text: str, start: int, end: int, left: int = 3, right: int = 0) -> str:
+    """
+    Up to `left` words before and `right` words after text[start:end], with the span itself replaced
+    by TARGET_PLACEHOLDER. Only the words next to the span are split off, not the whole document.
+    """
+    left_words = text[:start].rsplit(None, left)[-left:] if left > 0 else []
+    right_words = text[end:].split(None, right)[:right] if right > 0 else []
+    return normalize_context(' '.join(left_words + [PLACEHOLDER] + right_words))
+
+
+def first_occurrences(occurrences: Sequence[dict]) -> List[dict]:
+    """The first occurrence of every distinct mask, ordered by mask text (the order labels are extracted in)."""
+    first = {}
+    for occurrence in occurrences:
+        entity = occurrence['text']
+        if entity not in first or occurrence['start'] < first[entity]['start']:
+            first[entity] = occurrence
+    return [first[entity] for entity in sorted(first)]
+
+
+def collect_contexts(df: pd.DataFrame, occurrences_column: str = 'number_occurrences', text_column: str = 'text',
+                     id_column: str = 'id', add_context: Tuple[int, int] = (3, 0)) -> pd.DataFrame:
+    """
+    One row per distinct mask of every document: id, entity, start, end and its context window.
+    Documents without the occurrences column get their spans from util.mask_spans.
+    """
+    family = occurrences_column[:-len('_occurrences')]
+    rows = []
+    for doc_id, text, occurrences in zip(df[id_column], df[text_column],
+                                         df[occurrences_column] if occurrences_column in df else [None] * len(df)):
+        text = text or ''
+        if occurrences is None:
+            occurrences = find_spans(text)[family]
+        for occurrence in first_occurrences(occurrences):
+            start, end = int(occurrence['start']), int(occurrence['end'])
+            rows.append((doc_id, occurrence['text'], start, end, context_window(text, start, end, *add_context)))
+    return pd.DataFrame(rows, columns=[id_column, 'entity', 'start', 'end', 'context'])
+
+
+def _hash(value) -> str:
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ContextCache:
+    """
+    SQLite cache of predictions keyed by (model, labels hash, normalized context). The labels hash
+    covers the candidate labels and everything else that changes the scores (hypothesis template,
+    truncation length), so editing the label set never serves stale predictions.
+    """
+
+    LOOKUP_CHUNK = 500  # stays below SQLite's host parameter limit
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS predictions ('
+            'model TEXT NOT NULL, labels TEXT NOT NULL, context TEXT NOT NULL, label TEXT NOT NULL, score REAL NOT NULL, '
+            'PRIMARY KEY (model, labels, context))')
+        self.connection.commit()
+
+    def get_many(self, model: str, labels: str, contexts: Sequence[str]) -> Dict[str, Tuple[str, float]]:
+        found = {}
+        for i in range(0, len(contexts), self.LOOKUP_CHUNK):
+            chunk = list(contexts[i:i + self.LOOKUP_CHUNK])
+            query = ('SELECT context, label, score FROM predictions WHERE model = ? AND labels = ? '
+                     f'AND context IN ({", ".join("?" * len(chunk))})')
+            for context, label, score in self.connection.execute(query, [model, labels] + chunk):
+                found[context] = (label, score)
+        return found
+
+    def put_many(self, model: str, labels: str, predictions: Dict[str, Tuple[str, float]]):
+        self.connection.executemany('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)',
+                                    [(model, labels, context, label, score) for context, (label, score) in predictions.items()])
+        self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+class NLIZeroShotClassifier:
+    """
+    Zero-shot classification with an NLI sequence-classification model, scored the way
+    transformers' zero-shot-classification pipeline does it (softmax of the entailment logits over the
+    candidate labels), but for many contexts at once: every (context, hypothesis) pair is tokenized
+    once, the pairs are sorted by token length and run in padded batches, so a batch is padded only
+    to its own longest pair instead of the longest one overall.
+    """
+
+    def __init__(self, model_name_or_path: str = DEFAULT_MODEL, hypothesis_template: str = '{}',
+                 batch_size: int = 32, max_length: int = 256, num_threads: Optional[int] = None):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        self.torch = torch
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.name = model_name_or_path
+        self.hypothesis_template = hypothesis_template
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_name_or_path).eval()
+        self.entailment_id = next((i for label, i in self.model.config.label2id.items()
+                                   if label.lower().startswith('entail')), -1)
+
+    def signature(self, labels: Sequence[str]) -> str:
+        return _hash([list(labels), self.hypothesis_template, self.max_length])
+
+    def scores(self, contexts: Sequence[str], labels: Sequence[str]) -> np.ndarray:
+        """Probabilities of shape (len(contexts), len(labels)); every row sums to 1."""
+        hypotheses = [self.hypothesis_template.format(label) for label in labels]
+        premises = [context for context in contexts for _ in hypotheses]
+        encodings = self.tokenizer(premises, hypotheses * len(contexts), truncation='only_first',
+                                   max_length=self.max_length)
+        features = [{key: values[i] for key, values in encodings.items()} for i in range(len(premises))]
+        # Longest first, so running out of memory shows up on the first batch
+        order = np.argsort([-len(feature['input_ids']) for feature in features], kind='stable')
+
+        logits = np.empty(len(features), dtype=np.float32)
+        with self.torch.inference_mode():
+            for i in range(0, len(order), self.batch_size):
+                batch_ids = order[i:i + self.batch_size]
+                batch = self.tokenizer.pad([features[j] for j in batch_ids], return_tensors='pt')
+                logits[batch_ids] = self.model(**batch).logits[:, self.entailment_id].float().numpy()
+
+        logits = logits.reshape(len(contexts), len(labels))
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+@dataclass
+class ClassificationStats:
+    mentions: int = 0
+    unique_contexts: int = 0
+    cached: int = 0
+    classified: int = 0
+    elapsed: float = 0.0
+
+
+def classify_contexts(contexts: Sequence[str], classifier, labels: Sequence[str], cache: Optional[ContextCache] = None,
+                      chunk_size: int = 1024, stats: Optional[ClassificationStats] = None) -> List[Tuple[str, float]]:
+    """
+    (best label, score) for every context. Identical contexts are classified once; contexts already in
+    the cache are not classified at all. New predictions are written to the cache every chunk_size
+    contexts, so an interrupted run keeps what it finished.
+    """
+    stats = stats if stats is not None else ClassificationStats()
+    started = time.perf_counter()
+    labels = list(labels)
+    unique = list(pd.unique(pd.Series(contexts, dtype=object)))
+    signature = classifier.signature(labels)
+
+    predictions = cache.get_many(classifier.name, signature, unique) if cache is not None else {}
+    missing = [context for context in unique if context not in predictions]
+    stats.mentions += len(contexts)
+    stats.unique_contexts += len(unique)
+    stats.cached += len(unique) - len(missing)
+
+    for i in range(0, len(missing), chunk_size):
+        chunk = missing[i:i + chunk_size]
+        scores = classifier.scores(chunk, labels)
+        best = scores.argmax(axis=1)
+        new = {context: (labels[j], float(scores[k, j])) for k, (context, j) in enumerate(zip(chunk, best))}
+        if cache is not None:
+            cache.put_many(classifier.name, signature, new)
+        predictions.update(new)
+        stats.classified += len(chunk)
+        logger.info(f"Classified {stats.classified}/{len(missing)} new contexts")
+
+    stats.elapsed += time.perf_counter() - started
+    logger.info(f"{stats.mentions} mentions, {stats.unique_contexts} unique contexts: {stats.cached} cached, "
+                f"{stats.classified} classified in {stats.elapsed:.1f}s")
+    return [predictions[context] for context in contexts]
+
+
+def classify_frame(df: pd.DataFrame, classifier, class_mapping: Dict[str, str] = NUMBER_CLASS_MAPPING,
+                   occurrences_column: str = 'number_occurrences', add_context: Tuple[int, int] = (3, 0),
+                   cache_path: Optional[str] = None, text_column: str = 'text', id_column: str = 'id'
+                   ) -> Tuple[pd.DataFrame, ClassificationStats]:
+    """
+    Classifies the first occurrence of every distinct mask in every document. Returns one row per mask
+    (id, entity, start, end, context, label, score, predicted) in the order of the notebooks' label
+    extraction, where `label` is the winning candidate phrase and `predicted` its class_mapping value.
+    """
+    mentions = collect_contexts(df, occurrences_column, text_column, id_column, add_context)
+    stats = ClassificationStats()
+    cache = ContextCache(cache_path) if cache_path else None
+    try:
+        results = classify_contexts(mentions['context'].tolist(), classifier, list(class_mapping), cache, stats=stats)
+    finally:
+        if cache is not None:
+            cache.close()
+    mentions['label'] = [label for label, _ in results]
+    mentions['score'] = [score for _, score in results]
+    mentions['predicted'] = mentions['label'].map(class_mapping)
+    return mentions, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Classify НОМЕР_ masks by their context with a zero-shot NLI model')
+    parser.add_argument('input', help='Parquet file with id and text columns')
+    parser.add_argument('output', help='Parquet file to write one row per classified mask to')
+    parser.add_argument('--model', default=DEFAULT_MODEL, help='NLI model name or local path')
+    parser.add_argument('--cache', default='number_classifier_cache.sqlite', help='SQLite prediction cache')
+    parser.add_argument('--class_mapping', default=None, help='JSON file {label phrase: class} (default: NUMBER_CLASS_MAPPING)')
+    parser.add_argument('--occurrences_column', default='number_occurrences')
+    parser.add_argument('--left', type=int, default=3, help='Words of context before the mask')
+    parser.add_argument('--right', type=int, default=0, help='Words of context after the mask')
+    parser.add_argument('--batch_size', type=int, default=32, help='(context, label) pairs per forward pass')
+    parser.add_argument('--max_length', type=int, default=256, help='Maximum tokens per pair')
+    parser.add_argument('--threads', type=int, default=None, help='Torch CPU threads')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    class_mapping = NUMBER_CLASS_MAPPING
+    if args.class_mapping:
+        with open(args.class_mapping, 'r', encoding='utf-8') as f:
+            class_mapping = json.load(f)
+
+    df = pd.read_parquet(args.input)
+    classifier = NLIZeroShotClassifier(args.model, batch_size=args.batch_size, max_length=args.max_length,
+                                       num_threads=args.threads)
+    mentions, _ = classify_frame(df, classifier, class_mapping, args.occurrences_column, (args.left, args.right),
+                                 args.cache)
+    mentions.to_parquet(args.output, index=False)
+    logger.info(f"Saved {len(mentions)} predictions to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
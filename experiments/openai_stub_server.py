@@ -0,0 +1,110 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Minimal OpenAI-compatible /v1/chat/completions endpoint for running llm_runner offline.
+# It answers every request with a deterministic instance of the requested JSON schema (first enum
+# value, empty strings, zeros, one item per array) after an optional delay, and exposes request
+# counts and the peak number of concurrent requests at GET /stats.
+
+
+def instance_of(schema, defs):
+    if '$ref' in schema:
+        return instance_of(defs[schema['$ref'].split('/')[-1]], defs)
+    if 'enum' in schema:
+        return schema['enum'][0]
+    if 'const' in schema:
+        return schema['const']
+    for key in ('anyOf', 'oneOf', 'allOf'):
+        if key in schema:
+            return instance_of(schema[key][0], defs)
+    kind = schema.get('type')
+    if isinstance(kind, list):
+        kind = kind[0]
+    if kind == 'object':
+        return {name: instance_of(value, defs) for name, value in schema.get('properties', {}).items()}
+    if kind == 'array':
+        return [instance_of(schema.get('items', {}), defs)]
+    if kind in ('integer', 'number'):
+        return 0
+    if kind == 'boolean':
+        return False
+    if kind == 'null':
+        return None
+    return ''
+
+
+class StubState:
+    def __init__(self, delay):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.active = 0
+        self.peak = 0
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip('/').endswith('/stats'):
+                with state.lock:
+                    self._send(200, {'requests': state.requests, 'peak_concurrency': state.peak})
+            else:
+                self._send(404, {'error': {'message': 'not found'}})
+
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self._send(404, {'error': {'message': 'not found'}})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            with state.lock:
+                state.requests += 1
+                state.active += 1
+                state.peak = max(state.peak, state.active)
+            try:
+                time.sleep(state.delay)
+                schema = request.get('response_format', {}).get('json_schema', {}).get('schema', {})
+                content = json.dumps(instance_of(schema, schema.get('$defs', {})), ensure_ascii=False)
+                self._send(200, {
+                    'id': f'chatcmpl-stub-{state.requests}',
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': request.get('model', 'stub'),
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': content}}],
+                    'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+                })
+            finally:
+                with state.lock:
+                    state.active -= 1
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenAI-compatible stub server for testing llm_runner offline')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--delay', type=float, default=0.1, help='Seconds to wait before every response')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(StubState(args.delay)))
+    print(f'Serving on http://{args.host}:{args.port}/v1')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+import argparse
+import ast
+import json
+import os
+import sys
+from typing import List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from util.mask_spans import MASK_FAMILIES, SPANS_TYPE
+
+LABEL_TYPE = pa.struct([('start', pa.int32()), ('end', pa.int32()), ('text', pa.string()), ('labels', pa.list_(pa.string()))])
+LABELS_TYPE = pa.list_(LABEL_TYPE)
+
+# Label Studio export column names -> dataset column names
+RENAMES = {'case': 'grammatical_case_labels', 'gender': 'grammatical_gender_labels',
+           'number': 'number_labels', 'information': 'information_labels'}
+
+OCCURRENCE_COLUMNS = [f'{family}_occurrences' for family in MASK_FAMILIES.values()]
+# Label column -> the occurrence column every label must point at, one label per occurrence
+LABEL_COLUMNS = {
+    'grammatical_case_labels': 'person_occurrences',
+    'grammatical_gender_labels': 'person_occurrences',
+    'number_labels': 'number_occurrences',
+    'information_labels': 'information_occurrences',
+}
+
+REPORT_COLUMNS = ['row', 'id', 'column', 'check', 'start', 'end', 'detail']
+
+
+def parse_value(value) -> List[dict]:
+    """
+    Parses a stored span / label value without eval: JSON first, then Python literals
+    (DataFrame.astype(str) / old CSV exports). Missing values give [].
+    The old {'НОМЕР_1': [(start, end), ...]} occurrence format is converted to a list of spans.
+    """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return []
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return []
+        try:
+            value = json.loads(value)
+        except ValueError:
+            value = ast.literal_eval(value)
+    if isinstance(value, dict):
+        value = sorted(({'start': start, 'end': end, 'text': text} for text, positions in value.items() for start, end in positions),
+                       key=lambda span: span['start'])
+    return list(value)
+
+
+def _label_entry(entry: dict) -> dict:
+    labels = entry.get('labels', entry.get('label'))
+    if labels is None:
+        labels = []
+    elif isinstance(labels, str):
+        labels = [labels]
+    return {'start': entry.get('start'), 'end': entry.get('end'), 'text': entry.get('text'), 'labels': [str(label) for label in labels]}
+
+
+def to_typed_table(df: pd.DataFrame) -> pa.Table:
+    """
+    Converts a labeled DataFrame into an Arrow table with typed nested columns: occurrences as
+    list<struct<start, end, text>> and labels as list<struct<start, end, text, labels>>.
+    Stored strings are parsed once here; everything downstream works on the typed columns.
+    """
+    df = df.rename(columns={old: new for old, new in RENAMES.items() if old in df.columns})
+    columns = {}
+    for name in df.columns:
+        if name in OCCURRENCE_COLUMNS:
+            columns[name] = pa.array([[{key: span[key] for key in ('start', 'end', 'text')} for span in parse_value(value)]
+                                      for value in df[name]], type=SPANS_TYPE)
+        elif name in LABEL_COLUMNS:
+            columns[name] = pa.array([[_label_entry(entry) for entry in parse_value(value)] for value in df[name]],
+                                     type=LABELS_TYPE)
+        else:
+            # from_pandas turns NaN (pd.read_csv's empty cell) into a null instead of failing on a str column
+            columns[name] = pa.array(df[name], from_pandas=True)
+    return pa.table(columns)
+
+
+def _flatten(column: pa.ChunkedArray):
+    """(row index, start, end, text) arrays of every span in a list<struct> column."""
+    array = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    spans = pc.list_flatten(array)
+    rows = pc.list_parent_indices(array).to_numpy(zero_copy_only=False).astype(np.int64)
+    start = spans.field('start').to_numpy(zero_copy_only=False)
+    end = spans.field('end').to_numpy(zero_copy_only=False)
+    return rows, start, end, spans.field('text')
+
+
+def _report(rows, column, check, start=None, end=None, detail=None) -> pd.DataFrame:
+    rows = np.asarray(rows, dtype=np.int64)
+    n = len(rows)
+    return pd.DataFrame({
+        'row': rows,
+        'column': column,
+        'check': check,
+        'start': np.asarray(start, dtype=np.float64) if start is not None else np.full(n, np.nan),
+        'end': np.asarray(end, dtype=np.float64) if end is not None else np.full(n, np.nan),
+        'detail': detail if detail is not None else '',
+    })
+
+
+def check_counts(table: pa.Table) -> List[pd.DataFrame]:
+    """Label lists as long as their occurrence lists, and {family}_count equal to the number of occurrences."""
+    reports = []
+    for label_column, occurrence_column in LABEL_COLUMNS.items():
+        if label_column not in table.column_names or occurrence_column not in table.column_names:
+            continue
+        labels = pc.list_value_length(table[label_column]).to_numpy(zero_copy_only=False)
+        occurrences = pc.list_value_length(table[occurrence_column]).to_numpy(zero_copy_only=False)
+        rows = np.flatnonzero(labels != occurrences)
+        reports.append(_report(rows, label_column, 'label_count',
+                               detail=[f'{labels[row]} labels != {occurrences[row]} {occurrence_column}' for row in rows]))
+
+    for occurrence_column in OCCURRENCE_COLUMNS:
+        count_column = occurrence_column.replace('_occurrences', '_count')
+        if occurrence_column not in table.column_names or count_column not in table.column_names:
+            continue
+        occurrences = pc.list_value_length(table[occurrence_column]).to_numpy(zero_copy_only=False)
+        counts = pd.to_numeric(table[count_column].to_pandas(), errors='coerce').to_numpy()
+        rows = np.flatnonzero(counts != occurrences)
+        reports.append(_report(rows, count_column, 'count',
+                               detail=[f'{count_column}={counts[row]} != {occurrences[row]} occurrences' for row in rows]))
+    return reports
+
+
+def check_bounds(table: pa.Table, text_column: str = 'text') -> List[pd.DataFrame]:
+    """0 <= start < end <= len(text) for every span and label, and end - start == len(span text)."""
+    has_text = text_column in table.column_names
+    if has_text:
+        text_lengths = pc.fill_null(pc.utf8_length(table[text_column]), 0).to_numpy(zero_copy_only=False)
+
+    reports = []
+    for column in OCCURRENCE_COLUMNS + list(LABEL_COLUMNS):
+        if column not in table.column_names:
+            continue
+        rows, start, end, texts = _flatten(table[column])
+        invalid = np.isnan(start.astype(np.float64)) | np.isnan(end.astype(np.float64))
+        start = np.nan_to_num(start.astype(np.float64), nan=-1)
+        end = np.nan_to_num(end.astype(np.float64), nan=-1)
+        invalid |= (start < 0) | (end <= start)
+        if has_text:
+            invalid |= end > text_lengths[rows]
+        span_lengths = pc.fill_null(pc.utf8_length(texts), -1).to_numpy(zero_copy_only=False)
+        invalid |= span_lengths != end - start
+        bad = np.flatnonzero(invalid)
+        reports.append(_report(rows[bad], column, 'bounds', start[bad], end[bad],
+                               detail=[f'text length {text_lengths[row]}' if has_text else '' for row in rows[bad]]))
+    return reports
+
+
+def _overlaps(rows, start, end):
+    # Sort by (row, start); a span overlaps when it starts before the furthest end of the earlier spans in
+    # the same row, which also catches spans nested in a long one that is not their direct predecessor
+    order = np.lexsort((end, start, rows))
+    rows, start, end = rows[order], start[order], end[order]
+    if len(rows) == 0:
+        return rows, start, end, start, end
+    # Offsetting every row past the largest end makes one running maximum restart at each row boundary
+    stride = np.nanmax(end.astype(np.float64)) + 1
+    key = rows * stride + end.astype(np.float64)
+    running = np.fmax.accumulate(key)
+    furthest = np.maximum.accumulate(np.where(key == running, np.arange(len(key)), 0))
+    overlapping = np.flatnonzero((rows[1:] == rows[:-1]) & (start[1:] < running[:-1] - rows[:-1] * stride)) + 1
+    previous = furthest[overlapping - 1]
+    return rows[overlapping], start[overlapping], end[overlapping], start[previous], end[previous]
+
+
+def check_overlaps(table: pa.Table) -> List[pd.DataFrame]:
+    """No two masks of a document overlap (across all families), and no two labels of a column overlap."""
+    reports = []
+    occurrence_columns = [column for column in OCCURRENCE_COLUMNS if column in table.column_names]
+    if occurrence_columns:
+        flattened = [_flatten(table[column]) for column in occurrence_columns]
+        rows, start, end, previous_start, previous_end = _overlaps(
+            np.concatenate([f[0] for f in flattened]), np.concatenate([f[1] for f in flattened]),
+            np.concatenate([f[2] for f in flattened]))
+        reports.append(_report(rows, 'occurrences', 'overlap', start, end,
+                               detail=[f'overlaps {s}-{e}' for s, e in zip(previous_start, previous_end)]))
+
+    for column in LABEL_COLUMNS:
+        if column not in table.column_names:
+            continue
+        rows, start, end, _ = _flatten(table[column])
+        rows, start, end, previous_start, previous_end = _overlaps(rows, start, end)
+        reports.append(_report(rows, column, 'overlap', start, end,
+                               detail=[f'overlaps {s}-{e}' for s, e in zip(previous_start, previous_end)]))
+    return reports
+
+
+def check_label_spans(table: pa.Table) -> List[pd.DataFrame]:
+    """Every label covers exactly one of its occurrence spans, with the same mask text, and has a label value."""
+    reports = []
+    for label_column, occurrence_column in LABEL_COLUMNS.items():
+        if label_column not in table.column_names or occurrence_column not in table.column_names:
+            continue
+        rows, start, end, texts = _flatten(table[label_column])
+        labels = pd.DataFrame({'row': rows, 'start': start, 'end': end, 'text': texts.to_numpy(zero_copy_only=False)})
+        occurrence_rows, occurrence_start, occurrence_end, occurrence_texts = _flatten(table[occurrence_column])
+        occurrences = pd.DataFrame({'row': occurrence_rows, 'start': occurrence_start, 'end': occurrence_end,
+                                    'mask': occurrence_texts.to_numpy(zero_copy_only=False)})
+        occurrences = occurrences.drop_duplicates(['row', 'start', 'end'])
+        labels[['start', 'end']] = labels[['start', 'end']].astype(np.float64)
+        occurrences[['start', 'end']] = occurrences[['start', 'end']].astype(np.float64)
+        merged = labels.merge(occurrences, on=['row', 'start', 'end'], how='left')
+
+        missing = merged[merged['mask'].isna()]
+        reports.append(_report(missing['row'], label_column, 'unmatched_label', missing['start'], missing['end'],
+                               detail=f'no {occurrence_column} span at these offsets'))
+        different = merged[merged['mask'].notna() & (merged['mask'] != merged['text'])]
+        reports.append(_report(different['row'], label_column, 'label_text', different['start'], different['end'],
+                               detail=[f'{a!r} != {b!r}' for a, b in zip(different['text'], different['mask'])]))
+
+        array = table[label_column].combine_chunks()
+        values = pc.list_value_length(pc.list_flatten(array).field('labels'))
+        empty = np.flatnonzero(pc.fill_null(values, 0).to_numpy(zero_copy_only=False) == 0)
+        reports.append(_report(rows[empty], label_column, 'empty_label', start[empty], end[empty]))
+    return reports
+
+
+def validate(table: pa.Table, text_column: str = 'text', id_column: str = 'id') -> pd.DataFrame:
+    """Runs every check over the typed table; returns one row per violation (REPORT_COLUMNS)."""
+    reports = check_counts(table) + check_bounds(table, text_column) + check_overlaps(table) + check_label_spans(table)
+    report = pd.concat(reports, ignore_index=True) if reports else pd.DataFrame(columns=REPORT_COLUMNS)
+    ids = table[id_column].to_numpy(zero_copy_only=False) if id_column in table.column_names else None
+    report['id'] = ids[report['row'].to_numpy(dtype=np.int64)] if ids is not None and len(report) else None
+    report[['start', 'end']] = report[['start', 'end']].astype('Int64')
+    return report[REPORT_COLUMNS].sort_values(['row', 'column', 'check'], kind='stable').reset_index(drop=True)
+
+
+def summarize(report: pd.DataFrame) -> pd.DataFrame:
+    """Violations and affected documents per (check, column)."""
+    if report.empty:
+        return pd.DataFrame(columns=['check', 'column', 'violations', 'documents'])
+    return (report.groupby(['check', 'column'])
+            .agg(violations=('row', 'size'), documents=('row', 'nunique'))
+            .reset_index())
+
+
+def load_table(path: str) -> pa.Table:
+    """Reads a labeled dataset; typed parquet is used as is, anything else goes through to_typed_table."""
+    if path.endswith('.parquet'):
+        table = pq.read_table(path)
+        typed = all(table.schema.field(name).type == SPANS_TYPE for name in OCCURRENCE_COLUMNS if name in table.column_names) \
+            and all(table.schema.field(name).type == LABELS_TYPE for name in LABEL_COLUMNS if name in table.column_names)
+        return table if typed else to_typed_table(table.to_pandas())
+    return to_typed_table(pd.read_csv(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate span and label columns of a labeled court decisions dataset")
+    parser.add_argument("input_path", help="Labeled dataset (.csv or .parquet)")
+    parser.add_argument("--output", default=None, help="Write the dataset with typed list<struct> columns to this parquet file")
+    parser.add_argument("--report", default=None, help="Write the violations to this file (.csv or .parquet)")
+    parser.add_argument("--text_column", default="text", help="Name of the text column")
+    parser.add_argument("--id_column", default="id", help="Name of the document id column")
+    args = parser.parse_args()
+
+    table = load_table(args.input_path)
+    if args.output:
+        pq.write_table(table, args.output, compression='zstd')
+
+    report = validate(table, args.text_column, args.id_column)
+    summary = summarize(report)
+    print(f"{table.num_rows} documents, {len(report)} violations in {report['row'].nunique()} documents")
+    if not summary.empty:
+        print(summary.to_string(index=False))
+
+    if args.report:
+        if args.report.endswith('.parquet'):
+            report.to_parquet(args.report, index=False)
+        else:
+            report.to_csv(args.report, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,15 @@
 import pandas as pd
 import numpy as np
 from pathlib import Path
-import re
 import logging
 import pickle
 from typing import Dict, Optional
 from dataclasses import dataclass
 from enum import Enum
 
+from util.morphology_index import MorphologyIndex
+from util.rng import DocumentId, document_rng, resolve_rng, seed_sequence_for
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -24,10 +26,38 @@ class NormalizationConfig:
     clip_quantile: float = 0.98          # for CLIP
     drop_top_n: int = 3                  # for DROP_TOP
 
+
+CASE_MAP = {
+    'v_naz': 'nominative',
+    'v_rod': 'genitive',
+    'v_dav': 'dative',
+    'v_zna': 'accusative',
+    'v_oru': 'instrumental',
+    'v_mis': 'locative',
+    'v_kly': 'vocative'
+}
+
+
+@dataclass
+class SamplingTable:
+    """Cumulative distribution over integer name IDs with case forms aligned to the IDs."""
+    names: np.ndarray
+    cdf: np.ndarray
+    forms: Dict[str, np.ndarray]
+
+    def sample(self, n: int, rng: np.random.Generator) -> np.ndarray:
+        # Same inverse-CDF lookup np.random.choice performs, without rebuilding the CDF per draw
+        uniform = rng.random(n)
+        return self.cdf.searchsorted(uniform, side='right')
+
 class NameGenerator:
+    RNG_STREAM = 0
+
     def __init__(self, dict_base_path: Path = Path("dict"),
                  seed_state_path: Path = Path("rng_state.pkl"), 
-                 normalization_config: NormalizationConfig = NormalizationConfig()):
+                 normalization_config: NormalizationConfig = NormalizationConfig(),
+                 seed: Optional[int] = None,
+                 rng: Optional[np.random.Generator] = None):
         self.normalization_config = normalization_config
         
         self.base_path = dict_base_path / "generated"
@@ -38,63 +68,56 @@ class NameGenerator:
         self.pname_freq: Dict[str, pd.DataFrame] = {}
         self.lname_freq: Optional[pd.DataFrame] = None
 
-        self.fname_cases: Dict[str, dict] = {}
-        self.pname_cases: Dict[str, dict] = {}
-        self.lname_cases: Dict[str, dict] = {}
+        self.fname_cases: Dict[str, MorphologyIndex] = {}
+        self.pname_cases: Dict[str, MorphologyIndex] = {}
+        self.lname_cases: Dict[str, MorphologyIndex] = {}
 
-        self._load_rng_state()
+        self.fname_tables: Dict[str, SamplingTable] = {}
+        self.pname_tables: Dict[str, SamplingTable] = {}
+        self.lname_tables: Dict[str, Optional[SamplingTable]] = {}
+        self.lname_dropped_mass: Dict[str, float] = {}
+
+        self.seed_sequence = seed_sequence_for(seed, rng)
+        self.rng = rng if rng is not None else np.random.default_rng(self.seed_sequence)
+        if seed is None and rng is None:
+            self._load_rng_state()
         self._load_all_data()
 
     def _load_rng_state(self):
+        # The state file also holds the seed entropy of the document streams, so document_rng gives
+        # the same streams in every run that restores it
         if self.rng_state_path.exists():
             with open(self.rng_state_path, 'rb') as f:
-                np.random.set_state(pickle.load(f))
+                state = pickle.load(f)
+            if isinstance(state, dict) and state.get('bit_generator') == type(self.rng.bit_generator).__name__:
+                state = dict(state)
+                entropy = state.pop('seed_entropy', None)
+                spawn_key = tuple(state.pop('seed_spawn_key', ()))
+                self.rng.bit_generator.state = state
+                if entropy is not None:
+                    self.seed_sequence = np.random.SeedSequence(entropy, spawn_key=spawn_key)
+                else:
+                    logger.warning(f"{self.rng_state_path} has no seed entropy, document_rng streams will differ "
+                                   f"between runs until it is saved again with save_rng_state")
+            else:
+                logger.warning(f"Ignoring incompatible RNG state in {self.rng_state_path}")
 
     def save_rng_state(self):
+        state = dict(self.rng.bit_generator.state, seed_entropy=self.seed_sequence.entropy,
+                     seed_spawn_key=list(self.seed_sequence.spawn_key))
         with open(self.rng_state_path, 'wb') as f:
-            pickle.dump(np.random.get_state(), f)
+            pickle.dump(state, f)
 
-    def _load_case_dict(self, file_path: Path) -> dict:
-        if not file_path.exists():
-            logger.warning(f"File not found: {file_path}")
-            return {}
-        
-        case_dict = {}
+    def document_rng(self, doc_id: DocumentId) -> np.random.Generator:
+        """Independent generator for one document, derived from this generator's seed and the document id."""
+        return document_rng(self.seed_sequence, doc_id, self.RNG_STREAM)
+
+    def _load_case_dict(self, file_path: Path) -> MorphologyIndex:
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                i = 0
-                while i < len(lines):
-                    line = lines[i].strip()
-                    if not line:
-                        i += 1
-                        continue
-                    if not line.startswith(' '):
-                        parts = line.split()
-                        if not parts:
-                            i += 1
-                            continue
-                        base_form = parts[0]
-                        cases = {'v_naz': base_form}
-                        j = i + 1
-                        while j < len(lines) and lines[j].startswith(' '):
-                            case_line = lines[j].strip()
-                            case_parts = case_line.split()
-                            if case_parts:
-                                case_word = case_parts[0]
-                                case_info = ' '.join(case_parts[1:])
-                                case_match = re.search(r'v_([a-z]+)', case_info)
-                                if case_match:
-                                    case_type = f"v_{case_match.group(1)}"
-                                    cases[case_type] = case_word
-                            j += 1
-                        case_dict[base_form] = cases
-                        i = j
-                    else:
-                        i += 1
+            return MorphologyIndex.load(file_path)
         except Exception as e:
             logger.error(f"Error loading case dictionary from {file_path}: {e}")
-        return case_dict
+            return MorphologyIndex()
 
     def _load_all_data(self):
         self.lname_freq = self._load_freq_df("lname_freq_dict.csv")
@@ -108,6 +131,40 @@ class NameGenerator:
 
             self.lname_cases[gender] = self._load_case_dict(self.case_path / f"person_{gender}_lname.txt")
 
+            self.fname_tables[gender] = self._build_sampling_table(self.fname_freq[gender], self.fname_cases[gender])
+            self.pname_tables[gender] = self._build_sampling_table(self.pname_freq[gender], self.pname_cases[gender])
+            self.lname_tables[gender] = self._build_lname_table(gender)
+
+    def _build_lname_table(self, gender: str) -> Optional[SamplingTable]:
+        # Last name frequencies are shared by both genders, so keep only the lemmas
+        # inflected for this gender and renormalize over them
+        lemma_ids = self.lname_cases[gender].lemma_ids(self.lname_freq['name'])
+        has_cases = lemma_ids >= 0
+        dropped_mass = 1.0 - float(self.lname_freq['prob'].to_numpy()[has_cases].sum())
+        self.lname_dropped_mass[gender] = dropped_mass
+
+        logger.info(f"Last names ({gender}): kept {has_cases.sum()}/{len(has_cases)} lemmas with case forms, "
+                    f"dropped {dropped_mass:.2%} of probability mass")
+
+        if not has_cases.any():
+            logger.warning(f"No last names with case forms for gender '{gender}'")
+            return None
+        return self._build_sampling_table(self.lname_freq[has_cases], self.lname_cases[gender])
+
+    def _build_sampling_table(self, freq_df: pd.DataFrame, case_index: MorphologyIndex) -> SamplingTable:
+        names = freq_df['name'].to_numpy(dtype=object)
+        cdf = np.cumsum(freq_df['prob'].to_numpy(dtype=np.float64))
+        cdf /= cdf[-1]
+
+        lemma_ids = case_index.lemma_ids(names)
+        has_cases = lemma_ids >= 0
+
+        forms = {}
+        for uk_case in CASE_MAP:
+            forms[uk_case] = names.copy()
+            forms[uk_case][has_cases] = case_index.forms_array(uk_case)[lemma_ids[has_cases]]
+
+        return SamplingTable(names=names, cdf=cdf, forms=forms)
 
     def _load_freq_df(self, filename: str) -> pd.DataFrame:
         df = pd.read_csv(self.base_path / filename)
@@ -132,44 +189,35 @@ class NameGenerator:
         df['prob'] = df['freq_in_corpus'] / df['freq_in_corpus'].sum()
         return df
 
-    def generate(self, gender: str, seed: Optional[int] = None) -> dict:
+    def _get_lname_table(self, gender: str) -> SamplingTable:
+        lname_table = self.lname_tables[gender]
+        if lname_table is None:
+            raise ValueError(f"No last names with case forms for gender '{gender}'")
+        return lname_table
+
+    def generate(self, gender: str, seed: Optional[int] = None,
+                 rng: Optional[np.random.Generator] = None) -> dict:
         if gender not in ['male', 'female']:
             raise ValueError("Gender must be either 'male' or 'female'")
-        if seed is not None:
-            np.random.seed(seed)
-
-        fname_df = self.fname_freq[gender]
-        pname_df = self.pname_freq[gender]
+        rng = resolve_rng(self.rng, seed, rng)
 
-        first_name = np.random.choice(fname_df['name'], p=fname_df['prob'])
-        patronymic = np.random.choice(pname_df['name'], p=pname_df['prob'])
+        fname_table = self.fname_tables[gender]
+        pname_table = self.pname_tables[gender]
+        lname_table = self._get_lname_table(gender)
 
-        fname_cases = self.fname_cases[gender].get(first_name, {})
-        pname_cases = self.pname_cases[gender].get(patronymic, {})
+        fname_id = fname_table.sample(1, rng)[0]
+        pname_id = pname_table.sample(1, rng)[0]
+        lname_id = lname_table.sample(1, rng)[0]
 
-        lname_df = self.lname_freq
-        
-        while True:
-            last_name = np.random.choice(lname_df['name'], p=lname_df['prob'])
-            lname_cases = self.lname_cases[gender].get(last_name)
-            if lname_cases:
-                break
-
-        case_map = {
-            'v_naz': 'nominative',
-            'v_rod': 'genitive',
-            'v_dav': 'dative',
-            'v_zna': 'accusative',
-            'v_oru': 'instrumental',
-            'v_mis': 'locative',
-            'v_kly': 'vocative'
-        }
+        first_name = fname_table.names[fname_id]
+        patronymic = pname_table.names[pname_id]
+        last_name = lname_table.names[lname_id]
 
         result = {}
-        for uk_case, en_case in case_map.items():
-            lname_case = lname_cases.get(uk_case, last_name)
-            fname_case = fname_cases.get(uk_case, first_name)
-            pname_case = pname_cases.get(uk_case, patronymic)
+        for uk_case, en_case in CASE_MAP.items():
+            lname_case = lname_table.forms[uk_case][lname_id]
+            fname_case = fname_table.forms[uk_case][fname_id]
+            pname_case = pname_table.forms[uk_case][pname_id]
             result[en_case] = f"{lname_case} {fname_case} {pname_case}"
 
         result['original'] = {
@@ -180,7 +228,34 @@ class NameGenerator:
 
         return result
 
+    def generate_batch(self, n: int, gender: str, seed: Optional[int] = None,
+                       rng: Optional[np.random.Generator] = None) -> pd.DataFrame:
+        """Generate n names at once, one row per name with all 7 cases and the original lemmas."""
+        if gender not in ['male', 'female']:
+            raise ValueError("Gender must be either 'male' or 'female'")
+        rng = resolve_rng(self.rng, seed, rng)
+
+        fname_table = self.fname_tables[gender]
+        pname_table = self.pname_tables[gender]
+        lname_table = self._get_lname_table(gender)
+
+        fname_ids = fname_table.sample(n, rng)
+        pname_ids = pname_table.sample(n, rng)
+        lname_ids = lname_table.sample(n, rng)
+
+        result = {}
+        for uk_case, en_case in CASE_MAP.items():
+            result[en_case] = (lname_table.forms[uk_case][lname_ids] + ' '
+                               + fname_table.forms[uk_case][fname_ids] + ' '
+                               + pname_table.forms[uk_case][pname_ids])
+
+        result['last_name'] = lname_table.names[lname_ids]
+        result['first_name'] = fname_table.names[fname_ids]
+        result['patronymic'] = pname_table.names[pname_ids]
+
+        return pd.DataFrame(result)
+
 # if __name__ == "__main__":
-#     name_generator = NameGenerator()
-#     for i in range(10):
-#         print(name_generator.generate("female"))
+#     name_generator = NameGenerator(seed=42)
+#     for doc_id in range(10):
+#         print(name_generator.generate("female", rng=name_generator.document_rng(doc_id)))
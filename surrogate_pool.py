@@ -0,0 +1,264 @@
+import argparse
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from util.rng import DocumentId, document_rng, resolve_rng, seed_sequence_for
+
+logger = logging.getLogger(__name__)
+
+CASES = ('nominative', 'genitive', 'dative', 'accusative', 'instrumental', 'locative', 'vocative')
+NAME_COLUMNS = CASES + ('last_name', 'first_name', 'patronymic')
+GENDERS = ('male', 'female')
+
+NAMES_FILE = 'names.arrow'
+ADDRESSES_FILE = 'addresses.arrow'
+ALL_REGIONS = ''
+
+STANDARD_ADDRESS_FORMATS = (
+    "{street}, {house_number}, {village}, {region} область",
+    "{index}, {region} область, {district} район, {village}, {street}, {house_number}",
+)
+
+# Same stream numbers as NameGenerator / AddressGenerator, so a pool and a generator with the same seed
+# hand out their draws from the same per-document streams
+NAME_STREAM = 0
+ADDRESS_STREAM = 1
+
+
+def _offsets_metadata(offsets: Dict[str, Tuple[int, int]], extra: Optional[dict] = None) -> Dict[bytes, bytes]:
+    return {b'offsets': json.dumps(offsets, ensure_ascii=False).encode('utf-8'),
+            **{key.encode(): json.dumps(value, ensure_ascii=False).encode('utf-8') for key, value in (extra or {}).items()}}
+
+
+def _write_ipc(path: Path, schema: pa.Schema, batches):
+    """Writes an uncompressed Arrow IPC file (memory-mappable without copies) through a tmp file."""
+    tmp_path = path.with_name(path.name + f'.{os.getpid()}.tmp')
+    with pa.OSFile(str(tmp_path), 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+    os.replace(tmp_path, path)
+
+
+def build_name_pool(name_generator, output_dir: Path, per_gender: int, chunk_size: int = 100_000) -> Path:
+    """
+    Materializes per_gender names of each gender (all 7 cases plus the lemmas) into names.arrow.
+    Rows are grouped by gender; the schema metadata holds {gender: [start, end]}.
+    """
+    offsets = {gender: (i * per_gender, (i + 1) * per_gender) for i, gender in enumerate(GENDERS)}
+    schema = pa.schema([(column, pa.string()) for column in NAME_COLUMNS],
+                       metadata=_offsets_metadata(offsets))
+
+    def batches():
+        for gender in GENDERS:
+            for start in range(0, per_gender, chunk_size):
+                n = min(chunk_size, per_gender - start)
+                rng = name_generator.document_rng(f'pool:{gender}:{start}')
+                frame = name_generator.generate_batch(n, gender, rng=rng)
+                yield pa.RecordBatch.from_pandas(frame[list(NAME_COLUMNS)], schema=schema, preserve_index=False)
+            logger.info(f"Generated {per_gender} {gender} names")
+
+    path = output_dir / NAMES_FILE
+    _write_ipc(path, schema, batches())
+    return path
+
+
+def build_address_pool(address_generator, output_dir: Path, per_region: int,
+                       formats: Sequence[str] = STANDARD_ADDRESS_FORMATS) -> Path:
+    """
+    Materializes per_region addresses for every region into addresses.arrow, one column per format.
+    All format columns of a row describe the same address. Rows are grouped by region and drawn from
+    that region's own rows only; the schema metadata holds {region: [start, end]}, the number of
+    addresses of every region in the table (used to weight regions when sampling) and the format strings.
+    """
+    regions = [str(region) for region in address_generator.categories['region']]
+    postings = address_generator.postings['region']
+    offsets = {region: (i * per_region, (i + 1) * per_region) for i, region in enumerate(regions)}
+    counts = {region: len(postings[code]) for code, region in enumerate(regions)}
+    columns = [f'address_{i}' for i in range(len(formats))]
+    schema = pa.schema([('region', pa.string())] + [(column, pa.string()) for column in columns],
+                       metadata=_offsets_metadata(offsets, {'formats': list(formats), 'counts': counts}))
+
+    def batches():
+        for code, region in enumerate(regions):
+            arrays = [pa.array([region] * per_region, type=pa.string())]
+            for format_string in formats:
+                # A fresh generator per format draws the same rows and house numbers for every format
+                rng = address_generator.document_rng(f'pool:{region}')
+                arrays.append(pa.array(address_generator.generate_addresses_from(postings[code], per_region, format_string, rng=rng),
+                                       type=pa.string()))
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    path = output_dir / ADDRESSES_FILE
+    _write_ipc(path, schema, batches())
+    logger.info(f"Generated {per_region} addresses for each of {len(regions)} regions")
+    return path
+
+
+def _take(batches: List[pa.RecordBatch], batch_starts: np.ndarray, indices) -> pa.Table:
+    # Table/ChunkedArray.take concatenates all chunks first, which would copy the whole mapped file;
+    # take from each record batch instead and restore the requested order on the (small) result
+    indices = np.asarray(indices, dtype=np.int64)
+    batch_ids = np.searchsorted(batch_starts, indices, side='right') - 1
+    order = np.argsort(batch_ids, kind='stable')
+    parts = []
+    for batch_id in np.unique(batch_ids):
+        rows = order[batch_ids[order] == batch_id]
+        parts.append(batches[batch_id].take(pa.array(indices[rows] - batch_starts[batch_id])))
+    taken = pa.Table.from_batches(parts, schema=batches[0].schema) if parts else batches[0].schema.empty_table()
+    return taken.take(pa.array(np.argsort(order, kind='stable'))) if len(parts) > 1 else taken
+
+
+def _batch_starts(batches: List[pa.RecordBatch]) -> np.ndarray:
+    return np.concatenate(([0], np.cumsum([batch.num_rows for batch in batches])[:-1])).astype(np.int64)
+
+
+def _load_ipc(path: Path) -> Tuple[pa.Table, dict]:
+    # Zero-copy: the table's buffers point into the mapped file, so processes share the pages via the OS cache
+    table = pa.ipc.open_file(pa.memory_map(str(path), 'r')).read_all()
+    metadata = {key.decode(): json.loads(value) for key, value in (table.schema.metadata or {}).items()}
+    return table, metadata
+
+
+class NamePool:
+    """
+    Memory-mapped names.arrow with the NameGenerator sampling interface (generate, generate_batch,
+    document_rng). Drawing a name is an integer index into the gender's row range.
+    """
+
+    def __init__(self, pool_dir: Path, seed: Optional[int] = None, rng: Optional[np.random.Generator] = None):
+        self.table, metadata = _load_ipc(Path(pool_dir) / NAMES_FILE)
+        self.offsets: Dict[str, Tuple[int, int]] = {gender: tuple(bounds) for gender, bounds in metadata['offsets'].items()}
+        self.batches = self.table.to_batches()
+        self.batch_starts = _batch_starts(self.batches)
+
+        self.seed_sequence = seed_sequence_for(seed, rng)
+        self.rng = rng if rng is not None else np.random.default_rng(self.seed_sequence)
+
+    def document_rng(self, doc_id: DocumentId) -> np.random.Generator:
+        """Independent generator for one document, derived from this pool's seed and the document id."""
+        return document_rng(self.seed_sequence, doc_id, NAME_STREAM)
+
+    def sample(self, n: int, gender: str, rng: np.random.Generator) -> np.ndarray:
+        """Row indices of n names of the given gender."""
+        if gender not in self.offsets:
+            raise ValueError("Gender must be either 'male' or 'female'")
+        start, end = self.offsets[gender]
+        return rng.integers(start, end, size=n)
+
+    def take(self, indices: Sequence[int]) -> pd.DataFrame:
+        return _take(self.batches, self.batch_starts, indices).to_pandas()
+
+    def generate_batch(self, n: int, gender: str, seed: Optional[int] = None,
+                       rng: Optional[np.random.Generator] = None) -> pd.DataFrame:
+        return self.take(self.sample(n, gender, resolve_rng(self.rng, seed, rng)))
+
+    def generate(self, gender: str, seed: Optional[int] = None, rng: Optional[np.random.Generator] = None) -> dict:
+        row = self.generate_batch(1, gender, seed, rng).iloc[0]
+        result = {case: row[case] for case in CASES}
+        result['original'] = {'last_name': row['last_name'], 'first_name': row['first_name'], 'patronymic': row['patronymic']}
+        return result
+
+
+class AddressPool:
+    """
+    Memory-mapped addresses.arrow with the AddressGenerator interface (generate_address(es), document_rng)
+    for the formats the pool was built with. Addresses can be restricted to a region (matched by substring,
+    like AddressGenerator), not to a city. Matching regions are weighted by their number of addresses in
+    the source table, so a draw follows the same distribution over regions as AddressGenerator.
+    """
+
+    def __init__(self, pool_dir: Path, seed: Optional[int] = None, rng: Optional[np.random.Generator] = None):
+        self.table, metadata = _load_ipc(Path(pool_dir) / ADDRESSES_FILE)
+        self.offsets: Dict[str, Tuple[int, int]] = {region: tuple(bounds) for region, bounds in metadata['offsets'].items()}
+        # Pools built before the counts were stored weight regions by their number of pool rows
+        self.counts: Dict[str, int] = metadata.get('counts') or {region: end - start for region, (start, end) in self.offsets.items()}
+        self._ranges_cache: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.formats: List[str] = metadata['formats']
+        self.batches = self.table.to_batches()
+        self.batch_starts = _batch_starts(self.batches)
+
+        self.seed_sequence = seed_sequence_for(seed, rng)
+        self.rng = rng if rng is not None else np.random.default_rng(self.seed_sequence)
+
+    def document_rng(self, doc_id: DocumentId) -> np.random.Generator:
+        """Independent generator for one document, derived from this pool's seed and the document id."""
+        return document_rng(self.seed_sequence, doc_id, ADDRESS_STREAM)
+
+    def _column(self, format_string: str) -> str:
+        if format_string not in self.formats:
+            raise ValueError(f"Address format {format_string!r} is not in the pool; rebuild it with this format")
+        return f'address_{self.formats.index(format_string)}'
+
+    def _ranges(self, region: str) -> Tuple[np.ndarray, np.ndarray]:
+        # Regions match by the same substring rule as AddressGenerator._matching_rows, so a partial name
+        # such as 'Київ' selects the rows of every region containing it (and ALL_REGIONS selects all)
+        if region not in self._ranges_cache:
+            names = sorted(self.offsets, key=self.offsets.get)
+            matches = pd.Series(names, dtype=object).str.contains(region, na=False)
+            matched = [name for name, match in zip(names, matches) if match]
+            if not matched:
+                raise ValueError(f"No addresses found for region={region!r}")
+            ranges = np.array([self.offsets[name] for name in matched], dtype=np.int64)
+            weights = np.cumsum([self.counts[name] for name in matched], dtype=np.float64)
+            self._ranges_cache[region] = ranges, weights / weights[-1]
+        return self._ranges_cache[region]
+
+    def sample(self, n: int, region: Optional[str], rng: np.random.Generator) -> np.ndarray:
+        """
+        Row indices of n addresses: a matching region (any region for None) drawn in proportion to its
+        number of addresses, then a uniform row of that region's range.
+        """
+        ranges, cumulative = self._ranges(ALL_REGIONS if region in (None, 'null') else region)
+        chosen = np.minimum(np.searchsorted(cumulative, rng.random(n), side='right'), len(ranges) - 1)
+        return rng.integers(ranges[chosen, 0], ranges[chosen, 1])
+
+    def generate_address(self, format_string, city=None, region=None, seed=None, rng=None):
+        return self.generate_addresses(1, format_string, city=city, region=region, seed=seed, rng=rng)[0]
+
+    def generate_addresses(self, n, format_string, city=None, region=None, seed=None, rng=None) -> List[str]:
+        if city not in (None, 'null'):
+            raise ValueError("The address pool is indexed by region only; use AddressGenerator for a city")
+        column = self._column(format_string)
+        indices = self.sample(n, region, resolve_rng(self.rng, seed, rng))
+        return _take(self.batches, self.batch_starts, indices).column(column).to_pylist()
+
+
+def build_pool(output_dir: Path, dict_path: Path = Path('dict'), address_csv: str = 'dict/address.csv',
+               names_per_gender: int = 1_000_000, addresses_per_region: int = 100_000,
+               formats: Sequence[str] = STANDARD_ADDRESS_FORMATS, seed: Optional[int] = None):
+    from address_generator import AddressGenerator
+    from name_generator import NameGenerator
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    build_name_pool(NameGenerator(dict_base_path=dict_path, seed=seed), output_dir, names_per_gender)
+    build_address_pool(AddressGenerator(address_csv, seed=seed), output_dir, addresses_per_region, formats)
+    logger.info(f"Built surrogate pool in {output_dir} in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate a memory-mapped pool of surrogate names and addresses")
+    parser.add_argument("output_dir", help="Directory to write names.arrow and addresses.arrow to")
+    parser.add_argument("--dict_path", default="dict", help="Dictionary folder used by NameGenerator")
+    parser.add_argument("--address_csv", default="dict/address.csv", help="Address table used by AddressGenerator")
+    parser.add_argument("--names_per_gender", type=int, default=1_000_000, help="Names generated for each gender")
+    parser.add_argument("--addresses_per_region", type=int, default=100_000, help="Addresses generated for each region")
+    parser.add_argument("--formats", nargs="*", default=list(STANDARD_ADDRESS_FORMATS), help="Address format strings")
+    parser.add_argument("--seed", type=int, default=None, help="Root seed of the generators")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    build_pool(Path(args.output_dir), Path(args.dict_path), args.address_csv, args.names_per_gender,
+               args.addresses_per_region, args.formats, args.seed)
+
+
+if __name__ == "__main__":
+    main()
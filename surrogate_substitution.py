@@ -0,0 +1,355 @@
+import argparse
+import ast
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from surrogate_pool import STANDARD_ADDRESS_FORMATS, AddressPool, NamePool
+from util.mask_spans import SPANS_TYPE, find_spans
+from util.rng import DocumentId, saved_seed_entropy
+
+logger = logging.getLogger(__name__)
+
+CASES = ('nominative', 'genitive', 'dative', 'accusative', 'instrumental', 'locative', 'vocative')
+# Label spellings used by annotators, LLM schemas and the morphology dictionaries -> NameGenerator case columns
+CASE_ALIASES = {
+    **{case: case for case in CASES},
+    'v_naz': 'nominative', 'v_rod': 'genitive', 'v_dav': 'dative', 'v_zna': 'accusative',
+    'v_oru': 'instrumental', 'v_mis': 'locative', 'v_kly': 'vocative',
+    'prepositional': 'locative',
+}
+GENDER_ALIASES = {'masculine': 'male', 'male': 'male', 'feminine': 'female', 'female': 'female'}
+GENDERS = ('male', 'female')
+
+DEFAULT_ADDRESS_FORMAT = STANDARD_ADDRESS_FORMATS[0]
+
+SURROGATE_TYPE = pa.struct([('start', pa.int32()), ('end', pa.int32()), ('text', pa.string()),
+                            ('mask', pa.string()), ('case', pa.string()), ('gender', pa.string())])
+SURROGATES_TYPE = pa.list_(SURROGATE_TYPE)
+
+# Masks that stay in the text; their spans are shifted to the rebuilt document
+PASSTHROUGH_FAMILIES = ('number', 'information')
+# Input columns whose offsets refer to the masked text and are replaced by the surrogate columns
+CONSUMED_COLUMNS = ('person_occurrences', 'address_occurrences', 'grammatical_case_labels', 'grammatical_gender_labels')
+
+
+def parse_spans(value) -> List[dict]:
+    """
+    Reads a span / label column value: a list of dicts, a numpy array of dicts (pandas from parquet),
+    a JSON string (Label Studio export) or a Python repr string (DataFrame.astype(str)). Missing values give [].
+    """
+    if value is None:
+        return []
+    if isinstance(value, float) and np.isnan(value):
+        return []
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            value = ast.literal_eval(value)
+    return list(value)
+
+
+def _label(entry: dict) -> Optional[str]:
+    labels = entry.get('labels') if 'labels' in entry else entry.get('label')
+    if isinstance(labels, (list, tuple, np.ndarray)):
+        labels = labels[0] if len(labels) else None
+    return str(labels).lower() if labels is not None else None
+
+
+def labels_by_start(labels: Sequence[dict], aliases: Dict[str, str]) -> Dict[int, str]:
+    """{span start: normalized label} for the labels that have a known value."""
+    result = {}
+    for entry in labels:
+        label = aliases.get(_label(entry))
+        if label is not None:
+            result[int(entry['start'])] = label
+    return result
+
+
+class SurrogateSubstituter:
+    """
+    Replaces ОСОБА_N masks with generated names in the labeled case and gender and АДРЕСА_N masks
+    with generated addresses. The generators can be NameGenerator / AddressGenerator or a pre-built
+    NamePool / AddressPool (surrogate_pool.py).
+
+    A mask id gets one surrogate per document, drawn from the generators' per-document RNG streams,
+    so the output of a document does not depend on which worker processes it or in which order.
+    """
+
+    def __init__(self, name_generator, address_generator, address_format: str = DEFAULT_ADDRESS_FORMAT,
+                 address_city: Optional[str] = None, address_region: Optional[str] = None):
+        self.name_generator = name_generator
+        self.address_generator = address_generator
+        self.address_format = address_format
+        self.address_city = address_city
+        self.address_region = address_region
+
+    def _person_surrogates(self, doc_id: DocumentId, person_spans: List[dict],
+                           genders: Dict[int, str]) -> Tuple[Dict[str, dict], Dict[str, str]]:
+        # Gender of a mask: the first labeled occurrence wins, unlabeled / 'any' masks get a random one
+        mask_genders: Dict[str, Optional[str]] = {}
+        for span in person_spans:
+            if mask_genders.get(span['text']) is None:
+                mask_genders[span['text']] = genders.get(span['start'])
+
+        rng = self.name_generator.document_rng(doc_id)
+        for mask, gender in mask_genders.items():
+            if gender is None:
+                mask_genders[mask] = GENDERS[rng.integers(len(GENDERS))]
+
+        names: Dict[str, dict] = {}
+        for gender in GENDERS:
+            masks = [mask for mask, mask_gender in mask_genders.items() if mask_gender == gender]
+            if masks:
+                batch = self.name_generator.generate_batch(len(masks), gender, rng=rng)
+                names.update(zip(masks, batch[list(CASES)].to_dict('records')))
+        return names, mask_genders
+
+    def _address_surrogates(self, doc_id: DocumentId, address_spans: List[dict]) -> Dict[str, str]:
+        masks = list(dict.fromkeys(span['text'] for span in address_spans))
+        if not masks:
+            return {}
+        addresses = self.address_generator.generate_addresses(
+            len(masks), self.address_format, city=self.address_city, region=self.address_region,
+            rng=self.address_generator.document_rng(doc_id))
+        return dict(zip(masks, addresses))
+
+    def substitute(self, doc_id: DocumentId, text: str, person_spans=None, address_spans=None,
+                   case_labels=None, gender_labels=None, passthrough_spans=None) -> Tuple[str, Dict[str, List[dict]]]:
+        """
+        Rebuilds one document in a single pass.
+
+        Spans default to the masks found in the text; occurrences without a case label are put in the
+        nominative. Returns the new text and {'person': [...], 'address': [...], family: [...]} with the
+        surrogate spans and the passthrough (НОМЕР_/ІНФОРМАЦІЯ_) spans at their offsets in the new text.
+        Spans that do not match the text at their offsets are left as they are.
+        """
+        if person_spans is None or address_spans is None or passthrough_spans is None:
+            found = find_spans(text)
+            person_spans = found['person'] if person_spans is None else person_spans
+            address_spans = found['address'] if address_spans is None else address_spans
+            if passthrough_spans is None:
+                passthrough_spans = {family: found[family] for family in PASSTHROUGH_FAMILIES}
+
+        person_spans = [span for span in person_spans if text[span['start']:span['end']] == span['text']]
+        address_spans = [span for span in address_spans if text[span['start']:span['end']] == span['text']]
+        cases = labels_by_start(case_labels or [], CASE_ALIASES)
+        names, mask_genders = self._person_surrogates(doc_id, person_spans, labels_by_start(gender_labels or [], GENDER_ALIASES))
+        addresses = self._address_surrogates(doc_id, address_spans)
+
+        occurrences = [(span['start'], span['end'], span['text'], 'person') for span in person_spans]
+        occurrences += [(span['start'], span['end'], span['text'], 'address') for span in address_spans]
+        for family, spans in passthrough_spans.items():
+            occurrences += [(span['start'], span['end'], span['text'], family) for span in spans]
+        occurrences.sort()
+
+        result = {'person': [], 'address': [], **{family: [] for family in passthrough_spans}}
+        pieces = []
+        position = 0
+        shift = 0
+        for start, end, mask, family in occurrences:
+            if start < position:
+                continue
+            if family == 'person':
+                case = cases.get(start, 'nominative')
+                surrogate = names[mask][case]
+                entry = {'mask': mask, 'case': case, 'gender': mask_genders[mask]}
+            elif family == 'address':
+                surrogate = addresses[mask]
+                entry = {'mask': mask, 'case': None, 'gender': None}
+            else:
+                surrogate = mask
+                entry = {}
+            pieces.append(text[position:start])
+            pieces.append(surrogate)
+            result[family].append({'start': start + shift, 'end': start + shift + len(surrogate), 'text': surrogate, **entry})
+            shift += len(surrogate) - (end - start)
+            position = end
+        pieces.append(text[position:])
+        return ''.join(pieces), result
+
+
+def substitute_rows(substituter: SurrogateSubstituter, ids: Sequence[DocumentId], texts: Sequence[str],
+                    columns: Dict[str, Sequence]) -> Dict[str, list]:
+    """
+    Substitutes a batch of documents given as column lists. Optional span / label columns are
+    person_occurrences, address_occurrences, number_occurrences, information_occurrences,
+    grammatical_case_labels and grammatical_gender_labels.
+    """
+    def column(name, row):
+        values = columns.get(name)
+        return parse_spans(values[row]) if values is not None else None
+
+    output = {'text': [], 'person_surrogates': [], 'address_surrogates': [],
+              **{f'{family}_occurrences': [] for family in PASSTHROUGH_FAMILIES}}
+    for row, (doc_id, text) in enumerate(zip(ids, texts)):
+        if text is None:
+            output['text'].append(None)
+            for name in output:
+                if name != 'text':
+                    output[name].append([])
+            continue
+        passthrough = None
+        if all(f'{family}_occurrences' in columns for family in PASSTHROUGH_FAMILIES):
+            passthrough = {family: column(f'{family}_occurrences', row) for family in PASSTHROUGH_FAMILIES}
+        text, spans = substituter.substitute(
+            doc_id, text, column('person_occurrences', row), column('address_occurrences', row),
+            column('grammatical_case_labels', row), column('grammatical_gender_labels', row), passthrough)
+        output['text'].append(text)
+        output['person_surrogates'].append(spans['person'])
+        output['address_surrogates'].append(spans['address'])
+        for family in PASSTHROUGH_FAMILIES:
+            output[f'{family}_occurrences'].append(spans.get(family, []))
+    return output
+
+
+def substitute_frame(df, substituter: SurrogateSubstituter, id_column: str = 'id', text_column: str = 'text'):
+    """substitute_rows for a DataFrame: returns a copy with the new text, surrogate columns and shifted spans."""
+    columns = {name: df[name].tolist() for name in CONSUMED_COLUMNS + tuple(f'{family}_occurrences' for family in PASSTHROUGH_FAMILIES)
+               if name in df.columns}
+    output = substitute_rows(substituter, df[id_column].tolist(), df[text_column].tolist(), columns)
+    result = df.drop(columns=[name for name in CONSUMED_COLUMNS if name in df.columns])
+    result[text_column] = output.pop('text')
+    for name, values in output.items():
+        result[name] = values
+    return result
+
+
+def substitute_record_batch(substituter: SurrogateSubstituter, batch: pa.RecordBatch, id_column: str = 'id',
+                            text_column: str = 'text') -> pa.RecordBatch:
+    """substitute_rows for an Arrow record batch; columns the substitution does not touch are passed through."""
+    names = batch.schema.names
+    columns = {name: batch.column(name).to_pylist() for name in names
+               if name in CONSUMED_COLUMNS or name in {f'{family}_occurrences' for family in PASSTHROUGH_FAMILIES}}
+    output = substitute_rows(substituter, batch.column(id_column).to_pylist(), batch.column(text_column).to_pylist(), columns)
+
+    replaced = {text_column, *CONSUMED_COLUMNS, *output}
+    arrays = {name: batch.column(name) for name in names if name not in replaced}
+    arrays[text_column] = pa.array(output['text'], type=pa.string())
+    arrays['person_surrogates'] = pa.array(output['person_surrogates'], type=SURROGATES_TYPE)
+    arrays['address_surrogates'] = pa.array(output['address_surrogates'], type=SURROGATES_TYPE)
+    for family in PASSTHROUGH_FAMILIES:
+        arrays[f'{family}_occurrences'] = pa.array(
+            [[{key: span[key] for key in ('start', 'end', 'text')} for span in spans] for spans in output[f'{family}_occurrences']],
+            type=SPANS_TYPE)
+    return pa.RecordBatch.from_arrays(list(arrays.values()), names=list(arrays))
+
+
+# Per-process substituter, built once by the pool initializer
+_worker_substituter: Optional[SurrogateSubstituter] = None
+
+
+def _init_worker(dict_path: str, address_csv: str, seed: Optional[int], address_format: str,
+                 address_city: Optional[str], address_region: Optional[str], pool_dir: Optional[str] = None):
+    global _worker_substituter
+    if pool_dir is not None:
+        name_generator = NamePool(Path(pool_dir), seed=seed)
+        address_generator = AddressPool(Path(pool_dir), seed=seed)
+    else:
+        from address_generator import AddressGenerator
+        from name_generator import NameGenerator
+
+        name_generator = NameGenerator(dict_base_path=Path(dict_path), seed=seed)
+        address_generator = AddressGenerator(address_csv, seed=seed)
+    _worker_substituter = SurrogateSubstituter(name_generator, address_generator, address_format, address_city, address_region)
+
+
+def _substitute_shard(input_path: str, output_path: str, batch_size: int, id_column: str, text_column: str,
+                      compression: str) -> Tuple[str, int, float]:
+    started = time.perf_counter()
+    documents = 0
+    writer = None
+    tmp_path = f'{output_path}.{os.getpid()}.tmp'
+    for batch in pq.ParquetFile(input_path).iter_batches(batch_size=batch_size):
+        result = substitute_record_batch(_worker_substituter, batch, id_column, text_column)
+        if writer is None:
+            writer = pq.ParquetWriter(tmp_path, result.schema, compression=compression)
+        writer.write_batch(result)
+        documents += result.num_rows
+    if writer is not None:
+        writer.close()
+        os.replace(tmp_path, output_path)
+    return input_path, documents, time.perf_counter() - started
+
+
+def list_shards(input_path: str) -> List[str]:
+    if os.path.isdir(input_path):
+        return sorted(os.path.join(input_path, name) for name in os.listdir(input_path) if name.endswith('.parquet'))
+    return [input_path]
+
+
+def substitute_parquet(input_path: str, output_dir: str, dict_path: str = 'dict', address_csv: str = 'dict/address.csv',
+                       seed: Optional[int] = None, address_format: str = DEFAULT_ADDRESS_FORMAT,
+                       address_city: Optional[str] = None, address_region: Optional[str] = None,
+                       workers: Optional[int] = None, batch_size: int = 1_000, id_column: str = 'id',
+                       text_column: str = 'text', compression: str = 'zstd', pool_dir: Optional[str] = None,
+                       rng_state_path: str = 'rng_state.pkl') -> int:
+    """
+    Substitutes every parquet shard of input_path (a file or a directory of shards) into output_dir,
+    one output shard per input shard, with one shard per task in a process pool. Every worker loads
+    the generators once, or memory-maps the surrogate pool in pool_dir instead.
+
+    All workers share one root seed: seed, else the entropy saved in rng_state_path, else fresh entropy
+    drawn here and logged, so the output does not depend on which worker handles a shard.
+    Logs docs/s per shard and for the whole run; returns the number of documents.
+    """
+    if seed is None:
+        seed = saved_seed_entropy(Path(rng_state_path))
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        logger.info(f"Root seed {seed}; pass --seed {seed} to reproduce this run")
+    shards = list_shards(input_path)
+    os.makedirs(output_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    documents = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(dict_path, address_csv, seed, address_format, address_city, address_region, pool_dir)) as executor:
+        futures = [executor.submit(_substitute_shard, shard, os.path.join(output_dir, os.path.basename(shard)),
+                                   batch_size, id_column, text_column, compression) for shard in shards]
+        for future in as_completed(futures):
+            shard, shard_documents, elapsed = future.result()
+            documents += shard_documents
+            logger.info(f"{os.path.basename(shard)}: {shard_documents} documents in {elapsed:.1f}s "
+                        f"({shard_documents / max(elapsed, 1e-9):.0f} docs/s)")
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Substituted {documents} documents from {len(shards)} shards in {elapsed:.1f}s "
+                f"({documents / max(elapsed, 1e-9):.0f} docs/s)")
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replace ОСОБА_/АДРЕСА_ masks with generated names and addresses")
+    parser.add_argument("input_path", help="Parquet file or directory of parquet shards with id and text columns")
+    parser.add_argument("output_dir", help="Directory to write the substituted shards to")
+    parser.add_argument("--dict_path", default="dict", help="Dictionary folder used by NameGenerator")
+    parser.add_argument("--address_csv", default="dict/address.csv", help="Address table used by AddressGenerator")
+    parser.add_argument("--pool_dir", default=None, help="Draw surrogates from a pool built by surrogate_pool.py")
+    parser.add_argument("--seed", type=int, default=None, help="Root seed; the same seed gives the same surrogates")
+    parser.add_argument("--rng_state_path", default="rng_state.pkl",
+                        help="Without --seed, reuse the seed entropy saved by NameGenerator.save_rng_state")
+    parser.add_argument("--address_format", default=DEFAULT_ADDRESS_FORMAT, help="AddressGenerator format string")
+    parser.add_argument("--address_city", default=None, help="Only generate addresses in this city")
+    parser.add_argument("--address_region", default=None, help="Only generate addresses in this region")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--batch_size", type=int, default=1_000, help="Documents per record batch")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    substitute_parquet(args.input_path, args.output_dir, args.dict_path, args.address_csv, args.seed,
+                       args.address_format, args.address_city, args.address_region, args.workers, args.batch_size,
+                       pool_dir=args.pool_dir, rng_state_path=args.rng_state_path)
+
+
+if __name__ == "__main__":
+    main()
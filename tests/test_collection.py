@@ -0,0 +1,64 @@
+import os
+import sys
+import tarfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from data_collection.collection import collect, url_column
+from data_collection.rtf_stub_server import StubState, start_server
+
+
+def write_rows(path, base_url, names):
+    # The registry export is tab separated inside the first CSV field, with the URL in column url_column
+    with open(path, 'w', encoding='utf-8') as f:
+        for name in names:
+            fields = [name] + [''] * (url_column - 1) + [f'{base_url}/{name}.rtf']
+            f.write('\t'.join(fields) + '\n')
+
+
+def archived_documents(output_dir):
+    documents = {}
+    for file_name in os.listdir(output_dir):
+        if file_name.endswith('.tar.gz'):
+            with tarfile.open(os.path.join(output_dir, file_name), 'r:gz') as tar:
+                for member in tar:
+                    documents.setdefault(member.name, []).append(tar.extractfile(member).read().decode('utf-8'))
+    return documents
+
+
+def run(csv_path, output_dir):
+    collect(csv_path, output_dir, batch_size=4, workers=4, max_in_flight=8, rate_limit=0, timeout=5,
+            retries=2, backoff=0.01, checkpoint_every=2, convert_workers=1)
+
+
+def test_failed_rows_are_retried_on_resume(tmp_path):
+    names = [str(100 + i) for i in range(10)]
+    state = StubState(missing={'101', '106'}, flaky=1)
+    server = start_server(state)
+    try:
+        csv_path = str(tmp_path / 'rows.csv')
+        output_dir = str(tmp_path / 'out')
+        write_rows(csv_path, f'http://127.0.0.1:{server.server_address[1]}', names)
+
+        run(csv_path, output_dir)
+        failed_file = os.path.join(output_dir, 'failed_rows.tsv')
+        with open(failed_file, encoding='utf-8') as f:
+            assert [line.split('\t')[:2] for line in f] == [['1', '101'], ['6', '106']]
+        assert sorted(archived_documents(output_dir)) == [f'{name}.txt' for name in names if name not in ('101', '106')]
+        with open(os.path.join(output_dir, 'progress_checkpoint.txt')) as f:
+            assert f.read() == '10'
+
+        # The documents come back: the resumed run only asks for the failed rows
+        state.missing.clear()
+        run(csv_path, output_dir)
+    finally:
+        server.shutdown()
+
+    documents = archived_documents(output_dir)
+    assert sorted(documents) == sorted(f'{name}.txt' for name in names)
+    assert all(len(texts) == 1 and f'Документ {name[:-4]}' in texts[0] for name, texts in documents.items())
+    assert not os.path.exists(failed_file)
+    assert not os.listdir(os.path.join(output_dir, 'documents'))
+    requests = state.requests
+    assert requests['/101.rtf'] == 2 and requests['/106.rtf'] == 2
+    assert all(requests[f'/{name}.rtf'] == 2 for name in names if name not in ('101', '106'))  # 503 once, then 200
@@ -0,0 +1,39 @@
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from util.text_normalizer import normalize_text
+
+
+def legacy_normalize_file(text):
+    # tools/folder_to_parquet.py before util/text_normalizer.py, with non-breaking spaces added to [ \t]
+    text = text.encode('utf-8', 'ignore').decode('utf-8')
+    text = re.sub(r'\n\s*\n+', '\n\n', text)
+    text = re.sub('[ \t\u00a0]+', ' ', text)
+    text = re.sub(r' *\n *', '\n', text)
+    return text.strip()
+
+
+CASES = [
+    'УХВАЛА\n23 грудня 2024 року\n\n\n м. Київ  \n',
+    'a  b \t c',
+    'рядок\r\nще рядок\r\n\r\nабзац\r\n',
+    'сторінка\x0cнаступна\x0b\x1c\x1d\x1e\x85кінець',
+    'перший\u2028другий\u2029третій',
+    'з\u00a0\u00a0нерозривним \u00a0 пробілом\u00a0',
+    '  \n\t\n текст \n   \n\nкінець\u3000 ',
+    'без\ud800змін',
+    '',
+]
+
+
+def test_matches_legacy_normalize_file():
+    for text in CASES:
+        assert normalize_text(text) == legacy_normalize_file(text), repr(text)
+
+
+def test_only_newlines_split_lines():
+    assert normalize_text('a\rb\x0bc d') == 'a\rb\x0bc d'
+    assert normalize_text('a  \tb\n\n\nc') == 'a b\n\nc'
@@ -0,0 +1,25 @@
+import io
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from labeling.validate_labels import to_typed_table, validate
+
+CSV = '''id,text,court,number_occurrences,number_labels
+1,Справа НОМЕР_1,,"[{""start"": 7, ""end"": 14, ""text"": ""НОМЕР_1""}]","[{""start"": 7, ""end"": 14, ""text"": ""НОМЕР_1"", ""labels"": [""case""]}]"
+2,Без номерів,Верховний Суд,[],[]
+'''
+
+
+def test_empty_cell_in_passthrough_column():
+    df = pd.read_csv(io.StringIO(CSV))
+    assert df['court'].isna().iloc[0]
+
+    table = to_typed_table(df)
+
+    assert table['court'].to_pylist() == [None, 'Верховний Суд']
+    assert table['number_labels'].to_pylist()[0][0]['labels'] == ['case']
+    assert validate(table).empty
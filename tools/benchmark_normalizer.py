@@ -0,0 +1,101 @@
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from util.text_normalizer import normalize, normalize_text
+
+
+# The implementations util.text_normalizer replaces, kept here as baselines
+
+def legacy_normalize_file(file):
+    # tools/folder_to_parquet.py
+    file = file.encode('utf-8', 'ignore').decode('utf-8')
+    file = re.sub(r'\n\s*\n+', '\n\n', file)
+    file = re.sub(r'[ \t]+', ' ', file)
+    file = re.sub(r' *\n *', '\n', file)
+    return file.strip()
+
+
+def legacy_normalize_text(text):
+    # deduplication/deduplication.py
+    text = re.sub(r'\n', ' ', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+
+def legacy_tokenize_text(text):
+    # deduplication/deduplication.py
+    return re.findall(r'\b\w+\b', text.lower())
+
+
+def legacy_prepare_text(text):
+    # labeling/prepare_dataset.ipynb
+    text = re.sub(r'[ \t]+', ' ', text)
+    text = re.sub(r'\n+', '\n', text)
+    return text.strip()
+
+
+def legacy_dedup(text):
+    return legacy_tokenize_text(legacy_normalize_text(text))
+
+
+def legacy_all(text):
+    # What a document goes through today on its way to parquet, dedup and labeling
+    text = legacy_normalize_file(text)
+    legacy_dedup(text)
+    return legacy_prepare_text(text)
+
+
+def load_texts(source, limit):
+    if source.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.read_table(source, columns=['text']).column('text').to_pylist()[:limit]
+    texts = []
+    for entry in sorted(os.scandir(source), key=lambda entry: entry.name)[:limit]:
+        with open(entry.path, 'r', encoding='utf-8') as f:
+            texts.append(f.read())
+    return texts
+
+
+def measure(name, function, texts, size_mb, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            function(text)
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<40} {best:8.3f}s {size_mb / best:8.1f} MB/s {len(texts) / best:10.0f} docs/s")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark util.text_normalizer against the per-pipeline normalizers it replaces")
+    parser.add_argument("source", help="Folder of text files or parquet file with a text column")
+    parser.add_argument("--limit", type=int, default=None, help="Use at most this many documents")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of this many runs")
+    args = parser.parse_args()
+
+    texts = load_texts(args.source, args.limit)
+    size_mb = sum(len(text.encode('utf-8')) for text in texts) / 1024 / 1024
+    print(f"{len(texts)} documents, {size_mb:.1f} MB")
+
+    measure("legacy normalize_file (tools)", legacy_normalize_file, texts, size_mb, args.repeat)
+    measure("legacy normalize_text+tokenize (dedup)", legacy_dedup, texts, size_mb, args.repeat)
+    measure("legacy prepare_text (labeling)", legacy_prepare_text, texts, size_mb, args.repeat)
+    legacy = measure("legacy, all three in sequence", legacy_all, texts, size_mb, args.repeat)
+    measure("text_normalizer.normalize_text", normalize_text, texts, size_mb, args.repeat)
+    shared = measure("text_normalizer.normalize (text + tokens)", normalize, texts, size_mb, args.repeat)
+    print(f"Speedup over all three legacy passes: {legacy / shared:.2f}x")
+
+    token_mismatches = sum(normalize(text)[1] != legacy_dedup(text) for text in texts)
+    text_mismatches = sum(normalize_text(text) != legacy_normalize_file(text) for text in texts)
+    print(f"Documents whose tokens differ from dedup: {token_mismatches}")
+    print(f"Documents whose text differs from normalize_file: {text_mismatches}")
+
+
+if __name__ == "__main__":
+    main()
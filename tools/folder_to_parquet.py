@@ -1,38 +1,52 @@
 import os
-import pandas as pd
-import re
+import sys
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 
-def normalize_file(file):
-    # Remove non-utf-8 characters
-    file = file.encode('utf-8', 'ignore').decode('utf-8')
-    # Replace multiple (more than 1) \n with a single \n
-    file = re.sub(r'\n\s*\n+', '\n\n', file)   # collapse multiple blank lines to double newline (paragraphs)
-    file = re.sub(r'[ \t]+', ' ', file)        # replace only spaces/tabs
-    file = re.sub(r' *\n *', '\n', file)       # trim spaces around newlines
-    # Remove leading and trailing spaces
-    file = file.strip()
-    return file
-
-def folder_to_parquet(input_folder, output_path):
-    # read files and create list of dictionaries
-    documents = []
-    filenames = os.listdir(input_folder)
-    
-    for filename in filenames:
-        file_path = os.path.join(input_folder, filename)
-        with open(file_path, 'r', encoding='utf-8') as f:
-            try:
-                documents.append({
-                    'id': filename.split('.')[0],
-                    'text': normalize_file(f.read())
-                })
-            except:
-                print(f'Error reading {filename}')
-
-    df = pd.DataFrame(documents)
-    df = df.sort_values('id').reset_index(drop=True)  # Sort by id and reset index
-    df.to_parquet(output_path)
+import pyarrow as pa
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from util.corpus_reader import DEFAULT_LENGTH_BUCKETS, CorpusWriter
+from util.text_normalizer import normalize_text
+
+SCHEMA = pa.schema([('id', pa.string()), ('text', pa.string())])
+
+def read_document(file_path):
+    """Reads and normalizes one file in a worker process; returns None if it cannot be read."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        try:
+            return normalize_text(f.read())
+        except:
+            print(f'Error reading {os.path.basename(file_path)}')
+            return None
+
+def folder_to_parquet(input_folder, output_path, workers=None, row_group_size=10_000, compression='snappy',
+                      length_buckets=None):
+    """
+    Converts a folder of text files into one parquet file sorted by id.
+
+    The listing is sorted by id up front, files are normalized by a process pool one row group at a time
+    and every row group is written as soon as it is ready, so memory depends on row_group_size only,
+    not on the size of the corpus.
+
+    Every row also gets the text_length and {family}_count columns of util.corpus_reader, so length and
+    mask count filters do not need the text. With length_buckets, row groups are grouped by text length
+    (sorted by id within a bucket) and length filters skip whole row groups.
+    """
+    filenames = sorted(os.listdir(input_folder), key=lambda filename: filename.split('.')[0])
+
+    with ProcessPoolExecutor(max_workers=workers) as executor, \
+            CorpusWriter(output_path, SCHEMA, row_group_size, compression, length_buckets) as writer:
+        chunksize = max(1, row_group_size // ((workers or os.cpu_count()) * 4))
+        for start in range(0, len(filenames), row_group_size):
+            batch = filenames[start:start + row_group_size]
+            texts = executor.map(read_document, [os.path.join(input_folder, filename) for filename in batch],
+                                 chunksize=chunksize)
+            documents = [(filename.split('.')[0], text) for filename, text in zip(batch, texts) if text is not None]
+            writer.write(pa.table({'id': [doc_id for doc_id, _ in documents],
+                                   'text': [text for _, text in documents]}, schema=SCHEMA))
+            print(f'Written {min(start + row_group_size, len(filenames))}/{len(filenames)} files')
 
 def main():
     parser = argparse.ArgumentParser(
@@ -40,9 +54,15 @@ def main():
     )
     parser.add_argument('input_folder', help='Path to the folder containing text files')
     parser.add_argument('output_path', help='Path where the parquet file should be saved')
-    
+    parser.add_argument('--workers', type=int, default=None, help='Number of normalization processes (default: CPU count)')
+    parser.add_argument('--row_group_size', type=int, default=10_000, help='Documents per parquet row group')
+    parser.add_argument('--compression', default='snappy', help='Parquet compression codec (snappy, zstd, gzip, none)')
+    parser.add_argument('--cluster_by_length', action='store_true',
+                        help='Group rows into row groups by text length bucket, so length filters skip row groups')
+
     args = parser.parse_args()
-    folder_to_parquet(args.input_folder, args.output_path)
+    folder_to_parquet(args.input_folder, args.output_path, args.workers, args.row_group_size, args.compression,
+                      DEFAULT_LENGTH_BUCKETS if args.cluster_by_length else None)
 
 if __name__ == '__main__':
     main()
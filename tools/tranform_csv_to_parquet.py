@@ -1,19 +1,115 @@
-import pandas as pd
-import sys
+import argparse
+import json
 
-# Check if the correct number of arguments are provided
-if len(sys.argv) != 3:
-    print("Usage: python script.py <input_csv> <output_parquet>")
-    sys.exit(1)
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
 
-# Get input CSV and output Parquet file paths
-input_csv = sys.argv[1]
-output_parquet = sys.argv[2]
+DICTIONARY_TYPE = pa.dictionary(pa.int32(), pa.string())
 
-# Read CSV file
-df = pd.read_csv(input_csv)
 
-# Write to Parquet file
-df.to_parquet(output_parquet)
+def detect_delimiter(input_csv, encoding):
+    # Registry exports are tab-separated; anything else is treated as a regular CSV
+    with open(input_csv, 'r', encoding=encoding, errors='replace') as f:
+        header = f.readline()
+    return '\t' if header.count('\t') > header.count(',') else ','
 
-print(f"CSV file '{input_csv}' has been converted to Parquet file '{output_parquet}'.")
+
+def parse_type(name):
+    return DICTIONARY_TYPE if name == 'dictionary' else pa.type_for_alias(name)
+
+
+def type_name(data_type):
+    return 'dictionary' if pa.types.is_dictionary(data_type) else str(data_type)
+
+
+def load_schema(schema_path):
+    """Reads a {column: type} JSON file, e.g. {"id": "int64", "court": "dictionary", "date": "timestamp[s]"}."""
+    with open(schema_path, 'r', encoding='utf-8') as f:
+        return {column: parse_type(name) for column, name in json.load(f).items()}
+
+
+def convert_options(column_types=None, columns=None):
+    # Empty fields (quoted or not) and the usual NA markers become nulls in string columns too,
+    # the same values pd.read_csv turns into NaN
+    return pv.ConvertOptions(column_types=column_types, include_columns=columns or [],
+                             strings_can_be_null=True, quoted_strings_can_be_null=True)
+
+
+def infer_schema(input_csv, parse_options, read_options, columns=None, sample_bytes=64 << 20):
+    """Infers column types once from the first sample_bytes of the file; columns that are empty there become strings."""
+    sample_options = pv.ReadOptions(encoding=read_options.encoding, block_size=sample_bytes)
+    with pv.open_csv(input_csv, read_options=sample_options, parse_options=parse_options,
+                     convert_options=convert_options(columns=columns)) as reader:
+        return {field.name: pa.string() if pa.types.is_null(field.type) else field.type for field in reader.schema}
+
+
+def convert(input_csv, output_parquet, delimiter=None, columns=None, schema=None, categorical=(),
+            row_group_size=100_000, block_size=16 << 20, compression='snappy', encoding='utf8',
+            sample_bytes=64 << 20, save_schema=None):
+    """
+    Streams a CSV/TSV file into parquet without loading it whole.
+
+    Column types come from schema ({column: pyarrow type}) or are inferred once from a sample, so every
+    block is parsed with the same types; categorical columns are dictionary-encoded. The file is read in
+    blocks of block_size bytes and written in row groups of row_group_size rows, which bounds peak memory.
+    Returns the number of rows written.
+    """
+    delimiter = delimiter or detect_delimiter(input_csv, encoding)
+    parse_options = pv.ParseOptions(delimiter=delimiter)
+    read_options = pv.ReadOptions(encoding=encoding, block_size=block_size)
+
+    column_types = dict(schema) if schema else infer_schema(input_csv, parse_options, read_options, columns, sample_bytes)
+    for column in categorical:
+        column_types[column] = DICTIONARY_TYPE
+    if save_schema:
+        with open(save_schema, 'w', encoding='utf-8') as f:
+            json.dump({column: type_name(data_type) for column, data_type in column_types.items()}, f,
+                      ensure_ascii=False, indent=2)
+
+    rows = 0
+    with pv.open_csv(input_csv, read_options=read_options, parse_options=parse_options,
+                     convert_options=convert_options(column_types, columns)) as reader, \
+            pq.ParquetWriter(output_parquet, reader.schema, compression=compression) as writer:
+        pending = []
+        pending_rows = 0
+        for batch in reader:
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows >= row_group_size:
+                writer.write_table(pa.Table.from_batches(pending, schema=reader.schema), row_group_size=row_group_size)
+                rows += pending_rows
+                pending, pending_rows = [], 0
+        if pending:
+            writer.write_table(pa.Table.from_batches(pending, schema=reader.schema), row_group_size=row_group_size)
+            rows += pending_rows
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a CSV or tab-separated file to parquet in a streaming way.')
+    parser.add_argument('input_csv', help='Path to the CSV/TSV file')
+    parser.add_argument('output_parquet', help='Path where the parquet file should be saved')
+    parser.add_argument('--delimiter', default=None, help='Field delimiter (default: tab or comma, detected from the header)')
+    parser.add_argument('--columns', nargs='*', default=None, help='Only convert these columns')
+    parser.add_argument('--schema', default=None, help='JSON file with {column: type}; skips type inference')
+    parser.add_argument('--save_schema', default=None, help='Write the schema that was used to this JSON file')
+    parser.add_argument('--categorical', nargs='*', default=[], help='Columns to dictionary-encode')
+    parser.add_argument('--row_group_size', type=int, default=100_000, help='Rows per parquet row group')
+    parser.add_argument('--block_size', type=int, default=16, help='CSV read block size in MB')
+    parser.add_argument('--sample_size', type=int, default=64, help='MB of input used to infer the schema')
+    parser.add_argument('--compression', default='snappy', help='Parquet compression codec (snappy, zstd, gzip, none)')
+    parser.add_argument('--encoding', default='utf8', help='Input encoding')
+    args = parser.parse_args()
+
+    if args.delimiter == '\\t':
+        args.delimiter = '\t'
+    rows = convert(args.input_csv, args.output_parquet, args.delimiter, args.columns,
+                   load_schema(args.schema) if args.schema else None, args.categorical, args.row_group_size,
+                   args.block_size << 20, args.compression, args.encoding, args.sample_size << 20, args.save_schema)
+
+    print(f"CSV file '{args.input_csv}' has been converted to Parquet file '{args.output_parquet}' ({rows} rows).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+import argparse
+import logging
+import os
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from util.mask_spans import MASK_FAMILIES
+from util.text_normalizer import normalize_batch
+
+logger = logging.getLogger(__name__)
+
+# Per-document statistics stored next to the text, so filters on them are evaluated on small integer
+# columns and can skip whole row groups through the parquet min/max statistics
+LENGTH_COLUMN = 'text_length'
+COUNT_COLUMNS = {family: f'{family}_count' for family in MASK_FAMILIES.values()}
+STATS_COLUMNS = [LENGTH_COLUMN] + list(COUNT_COLUMNS.values())
+STATS_FIELDS = [pa.field(column, pa.int32()) for column in STATS_COLUMNS]
+
+# Upper bounds (in characters) of the length buckets rows are grouped by when a file is clustered by length
+DEFAULT_LENGTH_BUCKETS = (1_000, 2_000, 5_000, 10_000, 20_000, 50_000)
+
+Bounds = Tuple[Optional[int], Optional[int]]
+
+
+def stat_expression(column: str, text_column: str = 'text') -> ds.Expression:
+    """
+    How a statistics column is computed from the text, as an expression (RE2 regexes, evaluated in C++).
+    Null texts give 0, the same value with_stats writes for them.
+    """
+    text = pc.coalesce(ds.field(text_column), pa.scalar(''))
+    if column == LENGTH_COLUMN:
+        return pc.utf8_length(text).cast(pa.int32())
+    for prefix, family in MASK_FAMILIES.items():
+        if column == COUNT_COLUMNS[family]:
+            return pc.count_substring_regex(text, pattern=f'{prefix}[0-9]+').cast(pa.int32())
+    raise ValueError(f"Unknown statistics column {column!r}")
+
+
+def with_stats(table: pa.Table, text_column: str = 'text') -> pa.Table:
+    """Appends (or recomputes) the statistics columns of a table; null texts get zeros."""
+    texts = pc.fill_null(table.column(text_column), '')
+    length = pc.cast(pc.utf8_length(texts), pa.int32())
+    counts = {family: pc.cast(pc.count_substring_regex(texts, pattern=f'{prefix}[0-9]+'), pa.int32())
+              for prefix, family in MASK_FAMILIES.items()}
+    for column, values in [(LENGTH_COLUMN, length)] + [(COUNT_COLUMNS[family], counts[family]) for family in counts]:
+        if column in table.column_names:
+            table = table.drop_columns([column])
+        table = table.append_column(pa.field(column, pa.int32()), values)
+    return table
+
+
+def stats_schema(schema: pa.Schema) -> pa.Schema:
+    """The schema with_stats produces for tables of the given schema."""
+    fields = [field for field in schema if field.name not in STATS_COLUMNS]
+    return pa.schema(fields + STATS_FIELDS, metadata=schema.metadata)
+
+
+class CorpusWriter:
+    """
+    ParquetWriter for document tables that adds the statistics columns on write.
+
+    With length_buckets, rows are grouped by text length before they are written: every bucket keeps its
+    own pending rows and is flushed as a separate row group once it holds row_group_size rows, so each row
+    group covers one length range and a length filter skips the others. Rows then leave in bucket order
+    instead of input order; memory stays bounded by (buckets + 1) * row_group_size rows.
+    """
+
+    def __init__(self, path: str, schema: pa.Schema, row_group_size: int = 10_000, compression: str = 'snappy',
+                 length_buckets: Optional[Sequence[int]] = None, text_column: str = 'text'):
+        self.schema = stats_schema(schema)
+        self.row_group_size = row_group_size
+        self.text_column = text_column
+        self.length_buckets = np.asarray(length_buckets, dtype=np.int64) if length_buckets else None
+        self.pending: Dict[int, List[pa.Table]] = {}
+        self.pending_rows: Dict[int, int] = {}
+        self.rows = 0
+        self.writer = pq.ParquetWriter(path, self.schema, compression=compression)
+
+    def write(self, table: pa.Table):
+        table = with_stats(table, self.text_column).select(self.schema.names).cast(self.schema)
+        if self.length_buckets is None:
+            self.writer.write_table(table, row_group_size=self.row_group_size)
+            self.rows += table.num_rows
+            return
+        buckets = np.searchsorted(self.length_buckets, table.column(LENGTH_COLUMN).to_numpy(), side='left')
+        for bucket in np.unique(buckets):
+            self.pending.setdefault(bucket, []).append(table.filter(pa.array(buckets == bucket)))
+            self.pending_rows[bucket] = self.pending_rows.get(bucket, 0) + int((buckets == bucket).sum())
+            if self.pending_rows[bucket] >= self.row_group_size:
+                self._flush(bucket)
+
+    def _flush(self, bucket: int, final: bool = False):
+        # Only whole row groups leave before close, the remainder waits for more rows of its bucket
+        table = pa.concat_tables(self.pending.pop(bucket))
+        del self.pending_rows[bucket]
+        full = table.num_rows if final else table.num_rows - table.num_rows % self.row_group_size
+        if full < table.num_rows:
+            self.pending[bucket] = [table.slice(full)]
+            self.pending_rows[bucket] = table.num_rows - full
+        self.writer.write_table(table.slice(0, full), row_group_size=self.row_group_size)
+        self.rows += full
+
+    def close(self):
+        for bucket in sorted(self.pending):
+            self._flush(bucket, final=True)
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def add_stats(input_path: str, output_path: str, row_group_size: int = 10_000, compression: str = 'snappy',
+              length_buckets: Optional[Sequence[int]] = None, batch_size: int = 10_000, text_column: str = 'text',
+              normalize: bool = False) -> int:
+    """
+    Rewrites a parquet corpus (e.g. one written before the statistics columns existed) with them, one
+    record batch at a time. With normalize, texts go through util.text_normalizer first (as in
+    tools/folder_to_parquet.py), so the statistics describe the normalized text.
+    Returns the number of rows written.
+    """
+    started = time.perf_counter()
+    parquet_file = pq.ParquetFile(input_path)
+    tmp_path = f'{output_path}.{os.getpid()}.tmp'
+    with CorpusWriter(tmp_path, parquet_file.schema_arrow, row_group_size, compression, length_buckets, text_column) as writer:
+        for batch in parquet_file.iter_batches(batch_size=batch_size):
+            table = pa.Table.from_batches([batch])
+            if normalize:
+                index = table.schema.get_field_index(text_column)
+                texts = normalize_batch(table.column(text_column).combine_chunks()).cast(table.field(index).type)
+                table = table.set_column(index, table.field(index), texts)
+            writer.write(table)
+    os.replace(tmp_path, output_path)
+    logger.info(f"Wrote {writer.rows} documents with statistics to {output_path} in {time.perf_counter() - started:.1f}s")
+    return writer.rows
+
+
+class CorpusReader:
+    """
+    Lazy access to one or more parquet corpus files through a pyarrow dataset. Nothing is read until a
+    method asks for rows, and then only the requested columns of the rows passing the filter.
+
+    Filters go through stats_filter: on files written with the statistics columns they are plain integer
+    comparisons that parquet row-group statistics can prune; on older files the same filters still work,
+    computed from the text on the fly.
+    """
+
+    def __init__(self, source: Union[str, Sequence[str]], text_column: str = 'text', id_column: str = 'id'):
+        self.dataset = ds.dataset(source, format='parquet')
+        self.text_column = text_column
+        self.id_column = id_column
+
+    @property
+    def schema(self) -> pa.Schema:
+        return self.dataset.schema
+
+    @property
+    def has_stats(self) -> bool:
+        return all(column in self.schema.names for column in STATS_COLUMNS)
+
+    def field(self, column: str) -> ds.Expression:
+        """A column, or its expression over the text for statistics columns the files do not have."""
+        if column in self.schema.names:
+            return ds.field(column)
+        return stat_expression(column, self.text_column)
+
+    def _projection(self, columns: Optional[Sequence[str]]):
+        if columns is None:
+            return None
+        return {column: self.field(column) for column in columns}
+
+    def stats_filter(self, min_length: Optional[int] = None, max_length: Optional[int] = None,
+                     counts: Optional[Dict[str, Bounds]] = None, where: Optional[ds.Expression] = None
+                     ) -> Optional[ds.Expression]:
+        """
+        Filter expression for min_length <= text_length <= max_length and, per mask family,
+        min <= {family}_count <= max (counts={'number': (2, 5)}; None leaves a side open), and-ed with where.
+        """
+        conditions = []
+        for column, (low, high) in [(LENGTH_COLUMN, (min_length, max_length))] + \
+                                   [(COUNT_COLUMNS[family], bounds) for family, bounds in (counts or {}).items()]:
+            if low is not None:
+                conditions.append(self.field(column) >= low)
+            if high is not None:
+                conditions.append(self.field(column) <= high)
+        if where is not None:
+            conditions.append(where)
+        if not conditions:
+            return None
+        expression = conditions[0]
+        for condition in conditions[1:]:
+            expression = expression & condition
+        return expression
+
+    def count_rows(self, filter: Optional[ds.Expression] = None) -> int:
+        """Row count; without a filter it comes from the file metadata alone."""
+        return self.dataset.count_rows(filter=filter)
+
+    def iter_batches(self, columns: Optional[Sequence[str]] = None, filter: Optional[ds.Expression] = None,
+                     batch_size: int = 10_000) -> Iterator[pa.RecordBatch]:
+        yield from self.dataset.to_batches(columns=self._projection(columns), filter=filter, batch_size=batch_size)
+
+    def to_table(self, columns: Optional[Sequence[str]] = None, filter: Optional[ds.Expression] = None) -> pa.Table:
+        return self.dataset.to_table(columns=self._projection(columns), filter=filter)
+
+    def to_pandas(self, columns: Optional[Sequence[str]] = None, filter: Optional[ds.Expression] = None) -> pd.DataFrame:
+        return self.to_table(columns, filter).to_pandas()
+
+    def head(self, n: int = 5, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        return self.dataset.head(n, columns=self._projection(columns)).to_pandas()
+
+    def stats(self, filter: Optional[ds.Expression] = None) -> pd.DataFrame:
+        """id and statistics columns of every (matching) document, without the text."""
+        return self.to_pandas([self.id_column] + STATS_COLUMNS, filter)
+
+    def quantiles(self, q: Sequence[float], column: str = LENGTH_COLUMN,
+                  filter: Optional[ds.Expression] = None) -> List[float]:
+        values = self.to_table([column], filter).column(column).to_numpy()
+        return np.nanquantile(values.astype(np.float64), q).tolist()
+
+    def sample(self, n: int, columns: Optional[Sequence[str]] = None, filter: Optional[ds.Expression] = None,
+               stratify_by: Optional[str] = None, bins: Optional[Sequence[float]] = None,
+               seed: Optional[int] = None, batch_size: int = 100_000) -> pd.DataFrame:
+        """
+        n random documents, or n per stratum with stratify_by (a column, binned by the bins edges if given),
+        as a DataFrame in corpus order.
+
+        Reservoir sampling by random keys: the first pass reads only the id (and stratum) column and keeps
+        the n smallest keys per stratum; the second pass reads the requested columns for the chosen ids
+        only. The text column is never materialized beyond the sampled rows.
+        """
+        rng = np.random.default_rng(seed)
+        scan_columns = {self.id_column: ds.field(self.id_column)}
+        if stratify_by is not None:
+            scan_columns['stratum'] = self.field(stratify_by)
+
+        reservoir = pd.DataFrame({'key': pd.Series(dtype=np.float64), 'id': pd.Series(dtype=object),
+                                  'stratum': pd.Series(dtype=object)})
+        for batch in self.dataset.to_batches(columns=scan_columns, filter=filter, batch_size=batch_size):
+            if batch.num_rows == 0:
+                continue
+            if stratify_by is None:
+                strata = np.zeros(batch.num_rows, dtype=np.int64)
+            else:
+                strata = batch.column('stratum').to_numpy(zero_copy_only=False)
+                if bins is not None:
+                    strata = np.digitize(strata, bins)
+            candidates = pd.DataFrame({'key': rng.random(batch.num_rows),
+                                       'id': batch.column(self.id_column).to_numpy(zero_copy_only=False),
+                                       'stratum': strata})
+            merged = pd.concat([reservoir, candidates], ignore_index=True) if len(reservoir) else candidates
+            merged = merged.sort_values('key', kind='stable')
+            reservoir = merged[merged.groupby('stratum', sort=False).cumcount() < n]
+
+        ids = pa.array(reservoir['id'].tolist(), type=self.schema.field(self.id_column).type)
+        selected = ds.field(self.id_column).isin(ids)
+        table = self.to_table(columns, selected if filter is None else filter & selected)
+        logger.info(f"Sampled {table.num_rows} documents"
+                    + (f" from {reservoir['stratum'].nunique()} strata of {stratify_by}" if stratify_by else ''))
+        return table.to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Add text length and mask count columns to a parquet corpus')
+    parser.add_argument('input_path', help='Parquet file with id and text columns')
+    parser.add_argument('output_path', help='Parquet file to write')
+    parser.add_argument('--row_group_size', type=int, default=10_000, help='Documents per parquet row group')
+    parser.add_argument('--compression', default='snappy', help='Parquet compression codec (snappy, zstd, gzip, none)')
+    parser.add_argument('--cluster_by_length', action='store_true',
+                        help='Group rows into row groups by text length bucket, so length filters skip row groups')
+    parser.add_argument('--length_buckets', type=int, nargs='*', default=list(DEFAULT_LENGTH_BUCKETS),
+                        help='Bucket upper bounds in characters for --cluster_by_length')
+    parser.add_argument('--normalize', action='store_true', help='Normalize texts before computing the statistics')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    add_stats(args.input_path, args.output_path, args.row_group_size, args.compression,
+              args.length_buckets if args.cluster_by_length else None, normalize=args.normalize)
+
+
+if __name__ == '__main__':
+    main()
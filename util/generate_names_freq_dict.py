@@ -1,17 +1,21 @@
+import argparse
 import csv
-import urllib.request
+import lzma
 import os
-import zipfile
+import urllib.request
+from typing import Dict, Iterable, List, Set, Tuple
 
+FREQ_URL = 'https://lang.org.ua/static/downloads/ubertext2.0/dicts/ubertext_freq.csv.xz'
 
-# if there is no ubertext_freq.csv, 
-# download it from https://lang.org.ua/static/downloads/ubertext2.0/dicts/ubertext_freq.csv.xz and extract it
-if not os.path.exists('dict/ubertext_freq.csv'):
-    url = 'https://lang.org.ua/static/downloads/ubertext2.0/dicts/ubertext_freq.csv.xz'
-    urllib.request.urlretrieve(url, 'dict/ubertext_freq.csv.xz')
-    with zipfile.ZipFile('dict/ubertext_freq.csv.xz', 'r') as zip_ref:
-        zip_ref.extractall('dict')
-    os.remove('dict/ubertext_freq.csv.xz')
+# Output file -> name dictionaries it is built from. Outputs with several sources are normalized per
+# source first and merged (the later source wins for shared names) before the final normalization.
+OUTPUTS = {
+    'female_fname_freq_dict.csv': ['wiki_person_female_fname.txt'],
+    'male_fname_freq_dict.csv': ['wiki_person_make_fname.txt'],
+    'lname_freq_dict.csv': ['person_female_lname.txt', 'person_male_lname.txt'],
+    'female_pname_freq_dict.csv': ['person_female_pname.txt'],
+    'male_pname_freq_dict.csv': ['person_male_pname.txt'],
+}
 
 
 def load_ignore_list(filename):
@@ -20,81 +24,131 @@ def load_ignore_list(filename):
     return ignore_list
 
 
-def load_freq_dict(filename):
-    freq_dict = {}
-    with open(filename, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row["pos"] == "PROPN":
-                freq_dict[row["lemma"]] = row
-    return freq_dict
+def get_names_from_file(filename, ignore_list):
+    # Lemmas start a line, their inflected forms are indented
+    with open(filename, 'r', encoding='utf-8') as file:
+        names = [line.split()[0] for line in file if not line.startswith(' ') and line.strip()]
+    return [name for name in names if name not in ignore_list]
 
 
-def get_word_freq(word, freq_dict):
-    return freq_dict.get(word)
+def freq_source(dict_path):
+    """The UberText frequency list: an already extracted CSV if there is one, else the .xz download."""
+    extracted = os.path.join(dict_path, 'ubertext_freq.csv')
+    return extracted if os.path.exists(extracted) else os.path.join(dict_path, 'ubertext_freq.csv.xz')
 
 
-def freq_dict_contains(word, freq_dict):
-    return word in freq_dict
+def download_freq_source(path, url=FREQ_URL):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    print(f'Downloading {url}')
+    urllib.request.urlretrieve(url, tmp_path)
+    os.replace(tmp_path, path)
 
 
-def get_names_from_file(filename, ignore_list):
-    with open(filename, 'r', encoding='utf-8') as file:
-        names = [line.strip() for line in file if not line.startswith(' ')]
-    return [name.split()[0] for name in names if name not in ignore_list]
+def open_freq_source(path):
+    if path.endswith('.xz'):
+        return lzma.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
 
 
-def normalize_freq(freq_dict):
-    sum_freq = sum(float(freq['freq_in_corpus']) for freq in freq_dict.values())
-    for name in freq_dict:
-        freq_dict[name]['freq_in_corpus'] = float(freq_dict[name]['freq_in_corpus']) / sum_freq
-    return freq_dict
+def read_propn_freqs(path, candidates: Set[str]) -> Dict[str, str]:
+    """
+    Streams the frequency list (decoding .xz on the fly) and returns {lemma: freq_in_corpus} for the
+    PROPN rows whose lemma is a candidate name. Only the matching frequencies are kept, so memory
+    depends on the name dictionaries, not on the size of the corpus list. A later row wins for a lemma.
+    """
+    freqs = {}
+    with open_freq_source(path) as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        lemma_column, pos_column, freq_column = (header.index(name) for name in ('lemma', 'pos', 'freq_in_corpus'))
+        for row in reader:
+            lemma = row[lemma_column]
+            if lemma in candidates and row[pos_column] == 'PROPN':
+                freqs[lemma] = row[freq_column]
+    return freqs
 
-def get_names_freq(filename, freq_dict, ignore_list):
-    names = get_names_from_file(filename, ignore_list)
-    print(f'Loaded {len(names)} names from file')
 
-    names_freq_dict = {}
+def normalize_freq(names_freq: Dict[str, float]) -> Dict[str, float]:
+    sum_freq = sum(names_freq.values())
+    return {name: freq / sum_freq for name, freq in names_freq.items()}
 
-    for name in names:
-        if freq_dict_contains(name, freq_dict):
-            names_freq_dict[name] = get_word_freq(name, freq_dict)
 
-    # Normalize the frequency
-    names_freq_dict = normalize_freq(names_freq_dict)
+def get_names_freq(names: Iterable[str], freqs: Dict[str, str]) -> Dict[str, float]:
+    return normalize_freq({name: float(freqs[name]) for name in names if name in freqs})
 
-    # Sort the names_freq_dict by freq_in_corpus
-    names_freq_dict = sorted(names_freq_dict.items(), key=lambda x: x[1]['freq_in_corpus'], reverse=True)
 
-    return names_freq_dict
+def sort_by_freq(names_freq: Dict[str, float]) -> List[Tuple[str, float]]:
+    return sorted(names_freq.items(), key=lambda x: x[1], reverse=True)
+
 
-    
 def save_names_freq_dict(names_freq_dict, filename):
-    with open(filename, 'w', encoding='utf-8') as f:
+    tmp_path = f'{filename}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         writer = csv.DictWriter(f, fieldnames=['name', 'freq_in_corpus'])
         writer.writeheader()
-        for name in names_freq_dict:
-            writer.writerow({'name': name[0], 'freq_in_corpus': name[1]['freq_in_corpus']})
-
-os.makedirs('dict/generated', exist_ok=True)
-
-ignore_list = load_ignore_list('dict/ignore_list.txt')
-freq_dict = load_freq_dict('dict/ubertext_freq.csv')
-
-female_fname_freq_dict = get_names_freq('dict/wiki_person_female_fname.txt', freq_dict, ignore_list)
-male_fname_freq_dict = get_names_freq('dict/wiki_person_make_fname.txt', freq_dict, ignore_list)
-
-save_names_freq_dict(female_fname_freq_dict, 'dict/generated/female_fname_freq_dict.csv')
-save_names_freq_dict(male_fname_freq_dict, 'dict/generated/male_fname_freq_dict.csv')
-
-female_lname_freq_dict = get_names_freq('dict/person_female_lname.txt', freq_dict, ignore_list)
-male_lname_freq_dict = get_names_freq('dict/person_male_lname.txt', freq_dict, ignore_list)
-lname_freq_dict = {**dict(female_lname_freq_dict), **dict(male_lname_freq_dict)}
-lname_freq_dict = normalize_freq(lname_freq_dict)
-lname_freq_dict = sorted(lname_freq_dict.items(), key=lambda x: x[1]['freq_in_corpus'], reverse=True)
-save_names_freq_dict(lname_freq_dict, 'dict/generated/lname_freq_dict.csv')
-
-female_pname_freq_dict = get_names_freq('dict/person_female_pname.txt', freq_dict, ignore_list)
-male_pname_freq_dict = get_names_freq('dict/person_male_pname.txt', freq_dict, ignore_list)
-save_names_freq_dict(female_pname_freq_dict, 'dict/generated/female_pname_freq_dict.csv')
-save_names_freq_dict(male_pname_freq_dict, 'dict/generated/male_pname_freq_dict.csv')
+        for name, freq in names_freq_dict:
+            writer.writerow({'name': name, 'freq_in_corpus': freq})
+    os.replace(tmp_path, filename)
+
+
+def is_up_to_date(output, inputs):
+    if not os.path.exists(output):
+        return False
+    output_mtime = os.path.getmtime(output)
+    return all(os.path.getmtime(path) <= output_mtime for path in inputs if os.path.exists(path))
+
+
+def build_freq_dicts(dict_path='dict', output_dir=None, force=False):
+    """
+    Builds every dict/generated/*_freq_dict.csv with one streaming pass over the frequency list.
+    Outputs newer than the frequency list, the ignore list and their name dictionaries are skipped;
+    when all of them are up to date the frequency list is not read (or downloaded) at all.
+    Returns the list of files written.
+    """
+    output_dir = output_dir or os.path.join(dict_path, 'generated')
+    os.makedirs(output_dir, exist_ok=True)
+
+    ignore_path = os.path.join(dict_path, 'ignore_list.txt')
+    source = freq_source(dict_path)
+    stale = {output: sources for output, sources in OUTPUTS.items()
+             if force or not is_up_to_date(os.path.join(output_dir, output),
+                                           [source, ignore_path] + [os.path.join(dict_path, name) for name in sources])}
+    if not stale:
+        print('All frequency dictionaries are up to date')
+        return []
+
+    ignore_list = set(load_ignore_list(ignore_path))
+    names = {name: get_names_from_file(os.path.join(dict_path, name), ignore_list)
+             for name in {name for sources in stale.values() for name in sources}}
+    for name, lemmas in names.items():
+        print(f'Loaded {len(lemmas)} names from {name}')
+
+    if not os.path.exists(source):
+        download_freq_source(source)
+    freqs = read_propn_freqs(source, {lemma for lemmas in names.values() for lemma in lemmas})
+    print(f'Found {len(freqs)} candidate names in {os.path.basename(source)}')
+
+    written = []
+    for output, sources in stale.items():
+        merged = {}
+        for name in sources:
+            merged.update(get_names_freq(names[name], freqs))
+        names_freq = normalize_freq(merged) if len(sources) > 1 else merged
+        path = os.path.join(output_dir, output)
+        save_names_freq_dict(sort_by_freq(names_freq), path)
+        written.append(path)
+        print(f'Saved {len(names_freq)} names to {path}')
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the name frequency dictionaries used by NameGenerator from UberText frequencies')
+    parser.add_argument('--dict_path', default='dict', help='Folder with the name dictionaries and ubertext_freq.csv(.xz)')
+    parser.add_argument('--output_dir', default=None, help='Output folder (default: <dict_path>/generated)')
+    parser.add_argument('--force', action='store_true', help='Rebuild outputs even if they are up to date')
+    args = parser.parse_args()
+    build_freq_dicts(args.dict_path, args.output_dir, args.force)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,13 @@
 import random
+from functools import lru_cache
+from pathlib import Path
+
+from util.morphology_index import MorphologyIndex
+
+
+@lru_cache(maxsize=None)
+def load_index(filename):
+    return MorphologyIndex.load(Path(filename))
 
 
 def generate_random_name(gender):
@@ -29,33 +38,10 @@ def generate_random_name(gender):
     for part in ['fname', 'lname', 'pname']:
         filename = files[gender].get(part)
         if filename:
-            with open(filename, 'r', encoding='utf-8') as file:
-                entries = []
-                current_base = None
-                forms_dict = {form: None for form in name_map.keys()}
-                for line in file:
-                    if line.startswith(' '):  # Indented line (word form)
-                        if current_base:
-                            word, attributes = line.strip().split(maxsplit=1)
-                            for form in forms_dict.keys():
-                                if form in attributes:
-                                    forms_dict[form] = word
-                    else:  # Base form
-                        if current_base:  # Store completed entry
-                            entries.append((current_base, forms_dict.copy()))
-                        current_base = line.strip().split(maxsplit=1)[0]
-                        forms_dict = {form: None for form in name_map.keys()}
-
-                # Add the last entry if it exists
-                if current_base:
-                    entries.append((current_base, forms_dict.copy()))
-
-                if entries:
-                    selected_base, selected_forms = random.choice(entries)
-                    for form in name_map.keys():
-                        if selected_forms[form]:
-                            name_map[form][part] = selected_forms[form]
-                        else:
-                            name_map[form][part] = selected_base  # Use base as fallback
+            index = load_index(filename)
+            if len(index):
+                lemma_id = random.randrange(len(index))
+                for form in name_map.keys():
+                    name_map[form][part] = index.form(lemma_id, form)  # Falls back to the base form
 
     return name_map
@@ -0,0 +1,142 @@
+import argparse
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# Mask prefix in the court decisions -> column prefix used in the datasets
+MASK_FAMILIES = {
+    'НОМЕР_': 'number',
+    'ІНФОРМАЦІЯ_': 'information',
+    'ОСОБА_': 'person',
+    'АДРЕСА_': 'address',
+}
+MASK_RE = re.compile(r'(НОМЕР|ІНФОРМАЦІЯ|ОСОБА|АДРЕСА)_[0-9]+')
+FAMILY_BY_PREFIX = {prefix.rstrip('_'): family for prefix, family in MASK_FAMILIES.items()}
+
+SPAN_TYPE = pa.struct([('start', pa.int32()), ('end', pa.int32()), ('text', pa.string())])
+SPANS_TYPE = pa.list_(SPAN_TYPE)
+
+
+def find_spans(text: str) -> Dict[str, List[dict]]:
+    """
+    Finds every mask in one regex pass and returns {family: [{'start', 'end', 'text'}, ...]} in text order.
+    Each span covers a whole mask, so ОСОБА_1 is never reported inside ОСОБА_12.
+    """
+    spans = {family: [] for family in MASK_FAMILIES.values()}
+    for match in MASK_RE.finditer(text):
+        spans[FAMILY_BY_PREFIX[match.group(1)]].append({'start': match.start(), 'end': match.end(), 'text': match.group()})
+    return spans
+
+
+def extract_batch(texts: Sequence[Optional[str]]) -> pa.RecordBatch:
+    """
+    Extracts mask spans for a batch of texts (a list, pandas Series or Arrow string array).
+    Returns a record batch with a {family}_occurrences list<struct<start, end, text>> column and a
+    {family}_count column per mask family; null texts give empty lists.
+    """
+    if isinstance(texts, (pa.Array, pa.ChunkedArray)):
+        texts = texts.to_pylist()
+
+    columns = {family: ([0], [], [], []) for family in MASK_FAMILIES.values()}
+    for text in texts:
+        for match in MASK_RE.finditer(text or ''):
+            _, starts, ends, values = columns[FAMILY_BY_PREFIX[match.group(1)]]
+            starts.append(match.start())
+            ends.append(match.end())
+            values.append(match.group())
+        for offsets, starts, _, _ in columns.values():
+            offsets.append(len(starts))
+
+    arrays = []
+    names = []
+    for family, (offsets, starts, ends, values) in columns.items():
+        spans = pa.StructArray.from_arrays(
+            [pa.array(starts, type=pa.int32()), pa.array(ends, type=pa.int32()), pa.array(values, type=pa.string())],
+            fields=list(SPAN_TYPE))
+        arrays.append(pa.ListArray.from_arrays(pa.array(offsets, type=pa.int32()), spans))
+        names.append(f'{family}_occurrences')
+        arrays.append(pa.array(np.diff(offsets).astype(np.int32)))
+        names.append(f'{family}_count')
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+
+def extract_frame(texts):
+    """extract_batch for a pandas Series of texts: a DataFrame on the same index, with spans as lists of dicts."""
+    frame = pa.Table.from_batches([extract_batch(texts.tolist())]).to_pandas()
+    frame.index = texts.index
+    for family in MASK_FAMILIES.values():
+        frame[f'{family}_occurrences'] = frame[f'{family}_occurrences'].map(list)
+    return frame
+
+
+def _extract_record_batch(batch: pa.RecordBatch, text_column: str, keep_columns: Sequence[str]) -> pa.RecordBatch:
+    spans = extract_batch(batch.column(text_column))
+    kept = [batch.column(name) for name in keep_columns]
+    return pa.RecordBatch.from_arrays(kept + spans.columns, names=list(keep_columns) + spans.schema.names)
+
+
+def extract_parquet(input_path, output_path, text_column='text', keep_columns=('id',), workers=None,
+                    batch_size=10_000, compression='zstd'):
+    """
+    Indexes the mask spans of a whole parquet corpus. Record batches are processed by a process pool,
+    with at most two batches per worker in flight, and written in input order as they finish.
+    Returns the number of documents processed.
+    """
+    parquet_file = pq.ParquetFile(input_path)
+    keep_columns = [name for name in keep_columns if name != text_column]
+    batches = parquet_file.iter_batches(batch_size=batch_size, columns=keep_columns + [text_column])
+
+    started = time.perf_counter()
+    documents = 0
+    writer = None
+    workers = workers or os.cpu_count()
+    max_in_flight = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for batch in batches:
+            pending.append(executor.submit(_extract_record_batch, batch, text_column, keep_columns))
+            if len(pending) < max_in_flight:
+                continue
+            result = pending.pop(0).result()
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, result.schema, compression=compression)
+            writer.write_batch(result)
+            documents += result.num_rows
+            logger.info(f"Indexed {documents} documents ({documents / (time.perf_counter() - started):.0f} docs/s)")
+        for future in pending:
+            result = future.result()
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, result.schema, compression=compression)
+            writer.write_batch(result)
+            documents += result.num_rows
+    if writer is not None:
+        writer.close()
+    logger.info(f"Indexed {documents} documents in {time.perf_counter() - started:.1f}s")
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract ОСОБА_/НОМЕР_/АДРЕСА_/ІНФОРМАЦІЯ_ mask spans from a parquet corpus")
+    parser.add_argument("input_path", help="Parquet file with a text column")
+    parser.add_argument("output_path", help="Parquet file to write spans and counts to")
+    parser.add_argument("--text_column", default="text", help="Name of the text column")
+    parser.add_argument("--keep_columns", nargs="*", default=["id"], help="Input columns copied to the output")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--batch_size", type=int, default=10_000, help="Documents per record batch")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    extract_parquet(args.input_path, args.output_path, args.text_column, args.keep_columns, args.workers, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
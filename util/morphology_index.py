@@ -0,0 +1,193 @@
+import logging
+import mmap
+import os
+import re
+import struct
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CASES = ('v_naz', 'v_rod', 'v_dav', 'v_zna', 'v_oru', 'v_mis', 'v_kly')
+
+# File layout (little-endian):
+#   header | string offsets uint32[n_strings + 1] | forms int32[n_lemmas, 7] | UTF-8 string blob
+# Every distinct word form is stored once in the blob; forms refer to it by string ID, -1 means missing.
+MAGIC = b'MORPHIDX'
+VERSION = 1
+HEADER = struct.Struct('<8sIQQIIQ')
+
+CASE_RE = re.compile(r'v_([a-z]+)')
+
+
+def default_index_path(source_path: Path) -> Path:
+    return source_path.parent / 'compiled' / f'{source_path.stem}.idx'
+
+
+def parse_case_file(source_path: Path) -> Dict[str, Dict[str, str]]:
+    """Parses a lemma/indented-forms dictionary into {lemma: {case: form}}; the last form listed for a case wins."""
+    case_dict = {}
+    cases = None
+    with open(source_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith(' '):
+                if cases is None:
+                    continue
+                parts = line.split()
+                if not parts:
+                    continue
+                case_match = CASE_RE.search(' '.join(parts[1:]))
+                if case_match:
+                    cases[f"v_{case_match.group(1)}"] = parts[0]
+            else:
+                parts = line.split()
+                if not parts:
+                    cases = None
+                    continue
+                cases = {'v_naz': parts[0]}
+                case_dict[parts[0]] = cases
+    return case_dict
+
+
+def build_index(source_path: Path, index_path: Path):
+    """Compiles a dictionary file into the binary index format."""
+    stat = source_path.stat()
+    case_dict = parse_case_file(source_path)
+
+    string_ids: Dict[str, int] = {}
+    forms = np.full((len(case_dict), len(CASES)), -1, dtype='<i4')
+    for lemma_id, (lemma, cases) in enumerate(case_dict.items()):
+        forms[lemma_id, 0] = string_ids.setdefault(lemma, len(string_ids))
+        for case_id, case in enumerate(CASES):
+            if case in cases:
+                forms[lemma_id, case_id] = string_ids.setdefault(cases[case], len(string_ids))
+
+    encoded = [s.encode('utf-8') for s in string_ids]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u4')
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    blob = b''.join(encoded)
+
+    header = HEADER.pack(MAGIC, VERSION, stat.st_size, stat.st_mtime_ns,
+                         len(encoded), len(case_dict), len(blob))
+
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = index_path.with_name(index_path.name + f'.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(offsets.tobytes())
+        f.write(forms.tobytes())
+        f.write(blob)
+    os.replace(tmp_path, index_path)
+    logger.info(f"Compiled {len(case_dict)} lemmas ({len(encoded)} unique forms) from {source_path} into {index_path}")
+
+
+class MorphologyIndex(Mapping):
+    """
+    Memory-mapped lemma -> case forms index compiled from a person_*_{fname,pname,lname}.txt dictionary.
+
+    Behaves like the {lemma: {case: form}} dict the dictionaries used to be parsed into,
+    and additionally exposes integer lemma IDs and per-case form arrays for vectorized lookups.
+    """
+
+    def __init__(self, buffer=None):
+        self._buffer = buffer
+        self._strings: Optional[np.ndarray] = None
+        self._form_arrays: Dict[str, np.ndarray] = {}
+
+        if buffer is None:
+            self._offsets = np.zeros(1, dtype='<u4')
+            self._forms = np.zeros((0, len(CASES)), dtype='<i4')
+            self._blob = memoryview(b'')
+            self._lemma_ids: Dict[str, int] = {}
+            return
+
+        _, _, _, _, n_strings, n_lemmas, blob_size = HEADER.unpack_from(buffer, 0)
+        pos = HEADER.size
+        self._offsets = np.frombuffer(buffer, dtype='<u4', count=n_strings + 1, offset=pos)
+        pos += self._offsets.nbytes
+        self._forms = np.frombuffer(buffer, dtype='<i4', count=n_lemmas * len(CASES), offset=pos).reshape(n_lemmas, len(CASES))
+        pos += self._forms.nbytes
+        self._blob = memoryview(buffer)[pos:pos + blob_size]
+        starts = self._offsets[self._forms[:, 0]].tolist()
+        ends = self._offsets[self._forms[:, 0] + 1].tolist()
+        self._lemma_ids = {str(self._blob[start:end], 'utf-8'): lemma_id
+                           for lemma_id, (start, end) in enumerate(zip(starts, ends))}
+
+    @classmethod
+    def load(cls, source_path: Path, index_path: Optional[Path] = None) -> 'MorphologyIndex':
+        """Opens the compiled index for source_path, (re)building it first if it is missing or stale."""
+        source_path = Path(source_path)
+        if not source_path.exists():
+            logger.warning(f"File not found: {source_path}")
+            return cls()
+
+        index_path = Path(index_path) if index_path else default_index_path(source_path)
+        if not cls._is_fresh(source_path, index_path):
+            build_index(source_path, index_path)
+
+        with open(index_path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer)
+
+    @staticmethod
+    def _is_fresh(source_path: Path, index_path: Path) -> bool:
+        try:
+            with open(index_path, 'rb') as f:
+                header = f.read(HEADER.size)
+        except FileNotFoundError:
+            return False
+        if len(header) < HEADER.size:
+            return False
+        magic, version, source_size, source_mtime_ns, *_ = HEADER.unpack(header)
+        stat = source_path.stat()
+        return (magic == MAGIC and version == VERSION
+                and source_size == stat.st_size and source_mtime_ns == stat.st_mtime_ns)
+
+    def _string(self, string_id: int) -> str:
+        return str(self._blob[self._offsets[string_id]:self._offsets[string_id + 1]], 'utf-8')
+
+    def lemma_id(self, lemma: str) -> int:
+        return self._lemma_ids.get(lemma, -1)
+
+    def lemma_ids(self, lemmas: Iterable[str]) -> np.ndarray:
+        return np.fromiter((self._lemma_ids.get(lemma, -1) for lemma in lemmas), dtype=np.int64)
+
+    def lemma(self, lemma_id: int) -> str:
+        return self._string(self._forms[lemma_id, 0])
+
+    def form(self, lemma_id: int, case: str) -> str:
+        """Returns the form of the lemma in the given case, falling back to the lemma itself."""
+        string_id = self._forms[lemma_id, CASES.index(case)]
+        if string_id < 0:
+            string_id = self._forms[lemma_id, 0]
+        return self._string(string_id)
+
+    def forms(self, lemma_id: int) -> Dict[str, str]:
+        return {case: self._string(string_id)
+                for case, string_id in zip(CASES, self._forms[lemma_id]) if string_id >= 0}
+
+    def forms_array(self, case: str) -> np.ndarray:
+        """Returns an object array of forms in the given case indexed by lemma ID (missing forms fall back to the lemma)."""
+        if case not in self._form_arrays:
+            if self._strings is None:
+                offsets = self._offsets.tolist()
+                self._strings = np.array([str(self._blob[start:end], 'utf-8')
+                                          for start, end in zip(offsets[:-1], offsets[1:])], dtype=object)
+            string_ids = self._forms[:, CASES.index(case)]
+            self._form_arrays[case] = self._strings[np.where(string_ids >= 0, string_ids, self._forms[:, 0])]
+        return self._form_arrays[case]
+
+    def __getitem__(self, lemma: str) -> Dict[str, str]:
+        return self.forms(self._lemma_ids[lemma])
+
+    def __contains__(self, lemma) -> bool:
+        return lemma in self._lemma_ids
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._lemma_ids)
+
+    def __len__(self) -> int:
+        return len(self._forms)
@@ -0,0 +1,67 @@
+import hashlib
+import logging
+import pickle
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DocumentId = Union[int, str]
+
+
+def document_key(doc_id: DocumentId) -> int:
+    """Maps a document id to a non-negative integer usable as a SeedSequence spawn key."""
+    if isinstance(doc_id, (int, np.integer)) and doc_id >= 0:
+        return int(doc_id)
+    digest = hashlib.blake2b(str(doc_id).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def document_rng(seed_sequence: np.random.SeedSequence, doc_id: DocumentId, stream: int = 0) -> np.random.Generator:
+    """
+    Returns an independent generator for one document.
+
+    The stream depends only on the root entropy, the stream number and the document id,
+    so documents can be processed in any order, by any number of workers, with identical output.
+    """
+    child = np.random.SeedSequence(seed_sequence.entropy,
+                                   spawn_key=(*seed_sequence.spawn_key, stream, document_key(doc_id)),
+                                   pool_size=seed_sequence.pool_size)
+    return np.random.default_rng(child)
+
+
+def seed_sequence_for(seed: Optional[int] = None, rng: Optional[np.random.Generator] = None) -> np.random.SeedSequence:
+    """
+    The root of a generator's document streams, derived from what seeds it: the explicit seed, else a
+    child spawned from the SeedSequence behind rng. Without either it is fresh OS entropy, so document_rng
+    is only reproducible across runs with an explicit seed, a seeded rng or persisted entropy.
+    """
+    if seed is not None:
+        return np.random.SeedSequence(seed)
+    if rng is not None:
+        seed_seq = getattr(rng.bit_generator, 'seed_seq', None) or getattr(rng.bit_generator, '_seed_seq', None)
+        if isinstance(seed_seq, np.random.SeedSequence):
+            return seed_seq.spawn(1)[0]
+        logger.warning("The rng has no SeedSequence; document_rng streams will differ between runs, pass seed= instead")
+    return np.random.SeedSequence()
+
+
+def saved_seed_entropy(state_path: Path) -> Optional[int]:
+    """The seed entropy persisted with NameGenerator.save_rng_state, or None without a (recent) state file."""
+    if not state_path.exists():
+        return None
+    with open(state_path, 'rb') as f:
+        state = pickle.load(f)
+    return state.get('seed_entropy') if isinstance(state, dict) else None
+
+
+def resolve_rng(default: np.random.Generator, seed: Optional[int] = None,
+                rng: Optional[np.random.Generator] = None) -> np.random.Generator:
+    """Picks the generator for one call: an explicit rng, a fresh one for an explicit seed, or the owned default."""
+    if rng is not None:
+        return rng
+    if seed is not None:
+        return np.random.default_rng(seed)
+    return default
@@ -0,0 +1,96 @@
+import re
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - Arrow input is optional
+    pa = None
+
+WORD_RE = re.compile(r'\w+')
+# Only these characters are collapsed inside a line; other whitespace (\r, \x0c, \u2028, ...) is kept as text
+SPACE_RUN_RE = re.compile('[ \t\u00a0]+')
+
+TextBatch = Union[Sequence[Optional[str]], 'pa.Array', 'pa.ChunkedArray']
+
+
+def normalize_text(text: str) -> str:
+    """
+    Canonical document text shared by every pipeline. It is the text the former normalize_file of
+    tools/folder_to_parquet.py produced, except that non-breaking spaces are collapsed like spaces:
+      - characters that cannot be encoded as UTF-8 (lone surrogates) are dropped,
+      - lines are split on '\n' only; inside a line every run of spaces, tabs and non-breaking spaces
+        becomes one space and the line is trimmed of them,
+      - lines that are empty or whitespace only collapse into a single empty line (a paragraph break),
+      - leading and trailing whitespace of the whole text is removed.
+
+    The text is scanned by one regular expression and split once, instead of one pass per rule.
+    """
+    try:
+        text.encode('utf-8')
+    except UnicodeEncodeError:
+        text = text.encode('utf-8', 'ignore').decode('utf-8')
+
+    lines = []
+    blank = False
+    for line in SPACE_RUN_RE.sub(' ', text).split('\n'):
+        if line.strip():
+            if blank and lines:
+                lines.append('')
+            lines.append(line.strip(' '))
+            blank = False
+        else:
+            blank = True
+    return '\n'.join(lines).strip()
+
+
+def tokenize(normalized: str) -> List[str]:
+    """Lower-cased word tokens of a normalized text (the tokens MinHash signatures are built from)."""
+    return WORD_RE.findall(normalized.lower())
+
+
+def normalize(text: str) -> Tuple[str, List[str]]:
+    """Returns the normalized text and its tokens."""
+    normalized = normalize_text(text)
+    return normalized, tokenize(normalized)
+
+
+def _as_list(texts: TextBatch) -> List[Optional[str]]:
+    if pa is not None and isinstance(texts, (pa.Array, pa.ChunkedArray)):
+        return texts.to_pylist()
+    if isinstance(texts, np.ndarray):
+        return texts.tolist()
+    return list(texts)
+
+
+def _is_arrow(texts: TextBatch) -> bool:
+    return pa is not None and isinstance(texts, (pa.Array, pa.ChunkedArray))
+
+
+def normalize_batch(texts: TextBatch) -> TextBatch:
+    """
+    Normalizes a batch of texts. Lists (or pandas Series / numpy arrays) give a list back,
+    Arrow string arrays give an Arrow string array back; None / null entries stay null.
+    """
+    normalized = [normalize_text(text) if text is not None else None for text in _as_list(texts)]
+    if _is_arrow(texts):
+        return pa.array(normalized, type=pa.string())
+    return normalized
+
+
+def normalize_and_tokenize_batch(texts: TextBatch) -> Tuple[TextBatch, TextBatch]:
+    """Batch version of normalize: returns (normalized texts, tokens), as lists or as Arrow string / list<string> arrays."""
+    normalized = []
+    tokens = []
+    for text in _as_list(texts):
+        if text is None:
+            normalized.append(None)
+            tokens.append(None)
+        else:
+            text, words = normalize(text)
+            normalized.append(text)
+            tokens.append(words)
+    if _is_arrow(texts):
+        return pa.array(normalized, type=pa.string()), pa.array(tokens, type=pa.list_(pa.string()))
+    return normalized, tokens